@@ -0,0 +1,76 @@
+from enum import Enum
+import logging
+from corpus.corpus_cache import DEFAULT_MAX_BYTES
+from materialization.archive_writer import ArchiveLayout
+from materialization.tree_materializer import MaterializationBackend, OutputFormat
+from mutation.mutation_errors import InvalidArgumentsError
+from mutation.mutation_runner import instantiateOperators, mutateApp, setupOperators, validateArguments
+from report.report_sink import ReportSink
+from scanning.scan_index import ScanIndex
+
+# Library API of seed-vulns, to mutate apps in-process (e.g. from a
+# long-lived worker) instead of running seed-vulns once per app:
+#
+#   from api.mutation_api import MutationMode, generateMutants
+#   for mutant in generateMutants("app", "out/app", ["ImproperExport"], MutationMode.SINGLE, seed=1):
+#       print(mutant.operator, mutant.outputPath)
+#
+# Errors are raised as subclasses of SeedVulnsError (see
+# mutation/mutation_errors.py), and the process is never exited.
+# Progress is logged to the seed-vulns logger, or to the given one
+
+# What is output: one mutant per operator, each in its own copy of the app
+# (default), a single higher order mutant holding the mutations of all
+# operators (single), or every possible mutant of each operator (all-mutants)
+class MutationMode(Enum):
+    DEFAULT = "default"
+    SINGLE = "single"
+    ALL_MUTANTS = "all-mutants"
+
+# A mutant, as reported by the operator that produced it. Operators
+# that did not mutate the app have no mutants
+class MutantResult:
+
+    def __init__(self, record):
+        self.operator = record["operator"]
+        self.kind = record["kind"]
+        self.file = record["file"]
+        self.span = tuple(record["span"]) if record["span"] != None else None
+        self.pattern = record["pattern"]
+        self.excerpt = record["excerpt"]
+        self.mutatedExcerpt = record["mutatedExcerpt"]
+        self.mutantIndex = record["mutantIndex"]
+        self.mutantId = record["mutantId"]
+        self.outputPath = record["outputPath"]
+        self.skipped = record["skipped"]
+        self.duration = record["duration"]
+
+    def __repr__(self):
+        return "MutantResult({}, {}, {})".format(self.operator, self.file, self.outputPath)
+
+def generateMutants(sourcePath, destinationPath, operators, mode=MutationMode.DEFAULT, commentMutations=False, seed=None, materialization=MaterializationBackend.AUTO, outputFormat=OutputFormat.TREE, archiveLayout=ArchiveLayout.PER_MUTANT, jobs=1, scanThreads=1, cacheSize=DEFAULT_MAX_BYTES // (1024 * 1024), skipExisting=False, scanIndexPath=None, include=None, exclude=None, gitignore=False, reportPath=None, log=None):
+    # Arguments are those of the command line, operators being a list of
+    # operator names (or a comma-separated string) and cacheSize in MB.
+    # Returns the mutants of all operators, in the order they were reported
+    log = log if log != None else logging.getLogger("seed-vulns")
+    if isinstance(operators, str):
+        operators = operators.split(",")
+    if len(operators) == 0:
+        raise InvalidArgumentsError("No operators given")
+    single = mode == MutationMode.SINGLE
+    allMutants = mode == MutationMode.ALL_MUTANTS
+    validateArguments(single, allMutants, outputFormat, archiveLayout, jobs, scanThreads, skipExisting)
+
+    operatorsQueue = instantiateOperators(log, operators)
+    reportSink = ReportSink(reportPath)
+    scanIndex = ScanIndex(scanIndexPath) if scanIndexPath != None else None
+    try:
+        setupOperators(operatorsQueue, reportSink, skipExisting, seed)
+        mutateApp(log, operatorsQueue, jobs, sourcePath, destinationPath, single, commentMutations, allMutants, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, skipExisting, include, exclude, gitignore)
+        # Mutants are read back from the report, to which worker
+        # processes stream the mutants of their operators too
+        return [MutantResult(record) for record in reportSink.readRecords() if record["event"] == "mutant"]
+    finally:
+        reportSink.close()
+        if scanIndex != None:
+            scanIndex.close()
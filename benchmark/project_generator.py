@@ -0,0 +1,155 @@
+import os
+from random import Random
+
+# Sites each operator looks for, by kind. Java and Kotlin files get each
+# kind of site with the probability given by the site density
+javaSites = {
+    "pendingIntent": "        PendingIntent p{index} = PendingIntent.getActivity(this, {index}, intent, PendingIntent.FLAG_IMMUTABLE);\n",
+    "filterTouches": "        view.setFilterTouchesWhenObscured(true);\n",
+    "hideOverlayWindows": "        getWindow().setHideOverlayWindows(true);\n"
+}
+kotlinSites = {
+    "pendingIntent": "        val p{index} = PendingIntent.getActivity(this, {index}, intent, PendingIntent.FLAG_IMMUTABLE)\n",
+    "filterTouches": "        view.filterTouchesWhenObscured = true\n",
+    "hideOverlayWindows": "        window.setHideOverlayWindows(true)\n"
+}
+
+javaDispatchTouchEvent = """    @Override
+    public boolean dispatchTouchEvent(MotionEvent event) {
+        if ((event.getFlags() & MotionEvent.FLAG_WINDOW_IS_PARTIALLY_OBSCURED) != 0) {
+            return false;
+        }
+        return super.dispatchTouchEvent(event);
+    }
+
+"""
+kotlinDispatchTouchEvent = """    override fun dispatchTouchEvent(event: MotionEvent): Boolean {
+        if (event.flags and MotionEvent.FLAG_WINDOW_IS_PARTIALLY_OBSCURED != 0) {
+            return false
+        }
+        return super.dispatchTouchEvent(event)
+    }
+
+"""
+
+# Filler statements, with comments and strings that look like sites to
+# regexes but not to the tokenizer
+javaFiller = [
+    "        int value{index} = compute({index}) * {index};\n",
+    "        // PendingIntent.getActivity(this, 0, intent, 0) in a comment\n",
+    "        String text{index} = \"class Fake{index} {{ }}\";\n",
+    "        if (value{index} > {index}) {{ log(\"value\", value{index}); }}\n"
+]
+kotlinFiller = [
+    "        val value{index} = compute({index}) * {index}\n",
+    "        // PendingIntent.getActivity(this, 0, intent, 0) in a comment\n",
+    "        val text{index} = \"class Fake{index} {{ }}\"\n",
+    "        if (value{index} > {index}) {{ log(\"value\", value{index}) }}\n"
+]
+
+componentTypes = ["activity", "service", "receiver", "provider"]
+
+# Generator of synthetic Android projects with the layout of a Gradle
+# module (app/src/main), used to benchmark the handlers and operators
+# on apps of any size. Projects also hold build output that discovery
+# must skip. Generation is deterministic for a given seed
+class ProjectGenerator:
+
+    def __init__(self, javaFiles=100, kotlinFiles=50, fileSize=4096, components=40, layouts=30, siteDensity=0.2, seed=0):
+        self.javaFiles = javaFiles
+        self.kotlinFiles = kotlinFiles
+        self.fileSize = fileSize
+        self.components = components
+        self.layouts = layouts
+        self.siteDensity = siteDensity
+        self.random = Random(seed)
+        self.bytesWritten = 0
+        self.filesWritten = 0
+
+    def writeFile(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        self.bytesWritten += len(content.encode("utf-8"))
+        self.filesWritten += 1
+
+    def generateManifest(self):
+        manifest = '<?xml version="1.0" encoding="utf-8"?>\n'
+        manifest += '<manifest xmlns:android="http://schemas.android.com/apk/res/android" package="com.example.synthetic">\n'
+        manifest += '    <application android:label="Synthetic">\n'
+        for index in range(self.components):
+            componentType = componentTypes[index % len(componentTypes)]
+            # Components are exported, not exported, or implicitly
+            # exported by an intent filter
+            match self.random.randrange(0, 3):
+                case 0:
+                    manifest += '        <{} android:name=".Component{}" android:exported="true"/>\n'.format(componentType, index)
+                case 1:
+                    manifest += '        <{} android:name=".Component{}" android:exported="false"/>\n'.format(componentType, index)
+                case _:
+                    manifest += '        <{0} android:name=".Component{1}">\n            <intent-filter><action android:name="com.example.synthetic.ACTION_{1}"/></intent-filter>\n        </{0}>\n'.format(componentType, index)
+        manifest += '    </application>\n'
+        manifest += '</manifest>\n'
+        return manifest
+
+    def generateSource(self, index, kotlin):
+        sites = kotlinSites if kotlin else javaSites
+        filler = kotlinFiller if kotlin else javaFiller
+        if kotlin:
+            source = "package com.example.synthetic\n\nclass Synthetic{} : Activity() {{\n\n".format(index)
+        else:
+            source = "package com.example.synthetic;\n\npublic class Synthetic{} extends Activity {{\n\n".format(index)
+
+        if self.random.random() < self.siteDensity:
+            source += kotlinDispatchTouchEvent if kotlin else javaDispatchTouchEvent
+
+        method = 0
+        statement = 0
+        while len(source) < self.fileSize:
+            source += "    fun method{}() {{\n".format(method) if kotlin else "    void method{}() {{\n".format(method)
+            for site in sites.values():
+                if self.random.random() < self.siteDensity:
+                    source += site.format(index=statement)
+                    statement += 1
+            for _ in range(8):
+                source += filler[statement % len(filler)].format(index=statement)
+                statement += 1
+            source += "    }\n\n"
+            method += 1
+        return source + "}\n"
+
+    def generateLayout(self, index):
+        layout = '<?xml version="1.0" encoding="utf-8"?>\n'
+        layout += '<LinearLayout xmlns:android="http://schemas.android.com/apk/res/android" android:orientation="vertical">\n'
+        for view in range(10):
+            # Every other view has one attribute per line, as
+            # Android Studio formats layouts
+            separator = "\n        " if view % 2 == 1 else " "
+            layout += '    <Button{}android:id="@+id/button{}_{}"'.format(separator, index, view)
+            if self.random.random() < self.siteDensity:
+                layout += separator + 'android:filterTouchesWhenObscured="true"'
+            layout += separator + 'android:text="Button {}"/>\n'.format(view)
+        return layout + '</LinearLayout>\n'
+
+    def generate(self, root):
+        main = os.path.join(root, "app", "src", "main")
+        self.writeFile(os.path.join(main, "AndroidManifest.xml"), self.generateManifest())
+
+        sources = os.path.join(main, "java", "com", "example", "synthetic")
+        for index in range(self.javaFiles):
+            self.writeFile(os.path.join(sources, "Synthetic{}.java".format(index)), self.generateSource(index, False))
+        for index in range(self.javaFiles, self.javaFiles + self.kotlinFiles):
+            self.writeFile(os.path.join(sources, "Synthetic{}.kt".format(index)), self.generateSource(index, True))
+
+        resources = os.path.join(main, "res")
+        for index in range(self.layouts):
+            self.writeFile(os.path.join(resources, "layout", "layout_{}.xml".format(index)), self.generateLayout(index))
+        strings = '<?xml version="1.0" encoding="utf-8"?>\n<resources>\n'
+        strings += '    <string name="app_name">Synthetic</string>\n</resources>\n'
+        self.writeFile(os.path.join(resources, "values", "strings.xml"), strings)
+
+        # Build output, which is never mutated
+        build = os.path.join(root, "app", "build", "generated", "source", "r")
+        for index in range(max(1, self.javaFiles // 10)):
+            self.writeFile(os.path.join(build, "R{}.java".format(index)), "public final class R{} {{\n}}\n".format(index))
+        return root
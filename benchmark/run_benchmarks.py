@@ -0,0 +1,298 @@
+import argparse
+import json
+import logging
+import os
+from shutil import rmtree
+import tempfile
+import time
+import tracemalloc
+from benchmark.project_generator import ProjectGenerator
+from corpus.corpus_cache import CorpusCache
+from materialization.tree_materializer import MaterializationBackend, TreeMaterializer
+from mutation.mutation_errors import SeedVulnsError
+from mutation.mutation_runner import createHandler, instantiateOperators, setupOperators
+from operators.operator_registry import builtinOperators
+from operators.operators import OperatorTypes
+from report.report_sink import ReportSink
+from scanning.project_index import ProjectIndex
+from scanning.scan_engine import ScanEngine
+
+# resource is only available on POSIX platforms. Without it, the peak
+# memory of the process is simply not reported
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Benchmark suite of seed-vulns. It generates a synthetic Android project
+# and times each phase (materialization, discovery, scanning, mutation,
+# writing, output of mutants and cleanup) of each operator in single, default and all-mutants
+# modes, so that performance regressions are visible. Run it from the
+# root of the repository:
+#
+#   python3 -m benchmark.run_benchmarks --java-files 500 --json results.json
+#
+# Operators and their handlers are created as seed-vulns creates them
+# (through the operator registry and mutation runner), so that the
+# benchmarks time the code paths of the command line
+
+modes = ["single", "default", "all-mutants"]
+phases = ["materialize", "discover", "scan", "mutate", "write", "output", "cleanup"]
+
+# Wall and CPU time of each phase of a benchmark, with the bytes scanned
+# and the mutants produced. Phases run more than once add up. Like in the
+# run profile, phases are timed exclusively: time spent in a nested phase
+# (e.g. outputting mutants while mutating) is only accounted to it
+class BenchmarkResult:
+
+    def __init__(self, mode, operator):
+        self.mode = mode
+        self.operator = operator
+        self.phases = {phase: {"wall": 0.0, "cpu": 0.0} for phase in phases}
+        self.bytesScanned = 0
+        self.mutants = 0
+        self.peakMemory = None
+        self.stack = []
+
+    def measure(self, phase, function, *arguments):
+        frame = [0.0, 0.0]
+        self.stack.append(frame)
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+        try:
+            return function(*arguments)
+        finally:
+            wall = time.perf_counter() - wallStart
+            cpu = time.process_time() - cpuStart
+            self.stack.pop()
+            if len(self.stack) != 0:
+                self.stack[-1][0] += wall
+                self.stack[-1][1] += cpu
+            self.phases[phase]["wall"] += wall - frame[0]
+            self.phases[phase]["cpu"] += cpu - frame[1]
+
+    def getTotal(self):
+        return sum(phase["wall"] for phase in self.phases.values())
+
+    def toRecord(self):
+        return {
+            "mode": self.mode,
+            "operator": self.operator,
+            "phases": self.phases,
+            "total": self.getTotal(),
+            "bytesScanned": self.bytesScanned,
+            "mutants": self.mutants,
+            "peakMemory": self.peakMemory
+        }
+
+# Materializer of the benchmarked handlers. In all-mutants mode, operators
+# output each mutant themselves while mutating, hence mutants are timed as
+# they are materialized, in a phase of their own (output)
+class TimedMaterializer:
+
+    def __init__(self, materializer):
+        self.materializer = materializer
+        self.result = None
+
+    def __getattr__(self, name):
+        return getattr(self.materializer, name)
+
+    def materializeMutant(self, basePath, mutantPath, contents):
+        return self.result.measure("output", self.materializer.materializeMutant, basePath, mutantPath, contents)
+
+def scanHandler(operator, handler):
+    # Scanning is timed on its own. Operators then hit the results
+    # memoized by the scan engine when they match files themselves.
+    # The manifest is parsed as part of discovery
+    if operator.type == OperatorTypes.JAVA:
+        handler.matchSourceFiles(operator.getPatterns())
+        return sum(os.path.getsize(file) for file in handler.sourceFiles)
+    if operator.type == OperatorTypes.XML_RESOURCES:
+        handler.getAttributeIndex("layout")
+        return sum(os.path.getsize(file) for file in handler.findResourceFilesOfType("layout"))
+    return 0
+
+def countMutants(reportSink, operator):
+    return sum(1 for record in reportSink.readRecords(operator.name.value) if record["event"] == "mutant")
+
+def startMemoryTrace(traceMemory):
+    if traceMemory:
+        tracemalloc.start()
+
+def stopMemoryTrace(traceMemory, result):
+    if traceMemory:
+        result.peakMemory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+def benchmarkOperator(mode, operator, sourcePath, workPath, materializer, scanThreads, projectIndex, reportSink, traceMemory):
+    # Each operator gets its own cache and scan engine, so that its
+    # timings do not depend on the operators benchmarked before it
+    result = BenchmarkResult(mode, operator.name.value)
+    allMutants = mode == "all-mutants"
+    path = os.path.join(workPath, "{}_{}".format(mode, operator.name.value))
+    scanEngine = ScanEngine()
+    scanEngine.registerPatterns(operator.getPatterns())
+
+    materializer.result = result
+
+    startMemoryTrace(traceMemory)
+    result.measure("materialize", materializer.materialize, sourcePath, path)
+    handler = result.measure("discover", createHandler, operator.type, path, materializer, CorpusCache(), scanEngine, scanThreads, projectIndex)
+    result.bytesScanned = result.measure("scan", scanHandler, operator, handler)
+    mutated = result.measure("mutate", operator.mutate, handler, False, allMutants)
+    if mutated:
+        result.measure("write", handler.writeEdits)
+    stopMemoryTrace(traceMemory, result)
+
+    result.measure("cleanup", rmtree, path, True)
+    for entry in os.listdir(workPath):
+        if entry.startswith(os.path.basename(path) + "_"):
+            result.measure("cleanup", rmtree, os.path.join(workPath, entry), True)
+    result.mutants = countMutants(reportSink, operator)
+    return [result]
+
+def benchmarkSingle(operatorsQueue, sourcePath, workPath, materializer, scanThreads, projectIndex, reportSink, traceMemory):
+    # All operators mutate the same copy of the app with shared handlers,
+    # as with --single. Shared phases are accounted to their own row
+    shared = BenchmarkResult("single", "(shared)")
+    path = os.path.join(workPath, "single")
+    corpusCache = CorpusCache()
+    scanEngine = ScanEngine()
+    for operator in operatorsQueue:
+        scanEngine.registerPatterns(operator.getPatterns())
+    materializer.result = shared
+
+    startMemoryTrace(traceMemory)
+    shared.measure("materialize", materializer.materialize, sourcePath, path)
+    handlers = {}
+    for operator in operatorsQueue:
+        if operator.type not in handlers:
+            handlers[operator.type] = shared.measure("discover", createHandler, operator.type, path, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+
+    results = []
+    for operator in operatorsQueue:
+        result = BenchmarkResult("single", operator.name.value)
+        result.bytesScanned = result.measure("scan", scanHandler, operator, handlers[operator.type])
+        result.measure("mutate", operator.mutate, handlers[operator.type], False, False)
+        result.mutants = countMutants(reportSink, operator)
+        results.append(result)
+
+    for handler in handlers.values():
+        shared.measure("write", handler.writeEdits)
+    stopMemoryTrace(traceMemory, shared)
+    shared.measure("cleanup", rmtree, path, True)
+    return [shared] + results
+
+def formatResult(result):
+    wall = result.getTotal()
+    scanned = result.phases["scan"]["wall"]
+    mutated = result.phases["mutate"]["wall"]
+    # Mutants are produced by mutating, then output
+    produced = mutated + result.phases["output"]["wall"]
+    return "{:<32} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>9.3f} {:>10.3f} {:>9.3f} {:>9.3f} {:>10} {:>7} {:>10} {:>10}".format(
+        result.operator,
+        result.phases["materialize"]["wall"],
+        result.phases["discover"]["wall"],
+        scanned,
+        mutated,
+        result.phases["write"]["wall"],
+        result.phases["output"]["wall"],
+        result.phases["cleanup"]["wall"],
+        wall,
+        "{:.1f}".format(result.bytesScanned / scanned / (1024 * 1024)) if result.bytesScanned != 0 and scanned != 0 else "-",
+        result.mutants,
+        "{:.1f}".format(result.mutants / produced) if result.mutants != 0 and produced != 0 else "-",
+        "{:.1f}".format(result.peakMemory / 1024) if result.peakMemory != None else "-"
+    )
+
+def printResults(mode, results):
+    print("\n========== {} ==========".format(mode))
+    print("{:<32} {:>9} {:>9} {:>9} {:>9} {:>9} {:>10} {:>9} {:>9} {:>10} {:>7} {:>10} {:>10}".format(
+        "Operator", "Copy (s)", "Find (s)", "Scan (s)", "Mutate (s)", "Write (s)", "Output (s)", "Clean (s)", "Total (s)", "Scan MB/s", "Mutants", "Mutants/s", "Peak KiB"
+    ))
+    for result in results:
+        print(formatResult(result))
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="seed-vulns benchmarks")
+
+    parser.add_argument('--java-files', help='Number of Java source files of the synthetic app (default: 100)', type=int, default=100)
+    parser.add_argument('--kotlin-files', help='Number of Kotlin source files of the synthetic app (default: 50)', type=int, default=50)
+    parser.add_argument('--file-size', help='Approximate size of each source file, in bytes (default: 4096)', type=int, default=4096)
+    parser.add_argument('--components', help='Number of components in the manifest (default: 40)', type=int, default=40)
+    parser.add_argument('--layouts', help='Number of layout files (default: 30)', type=int, default=30)
+    parser.add_argument('--site-density', help='Probability of each kind of mutation site in each method, file or view (default: 0.2)', type=float, default=0.2)
+    parser.add_argument('--seed', help='Seed of the synthetic app and of the operators (default: 0)', type=int, default=0)
+    parser.add_argument('--modes', help='Comma-separated list of modes to benchmark (default: {})'.format(",".join(modes)), default=",".join(modes))
+    parser.add_argument('--operators', help='Comma-separated list of operators to benchmark, named as for seed-vulns (default: all built-in operators)', default=None)
+    parser.add_argument('-m', '--materialization', help='How copies of the app are materialized', choices=[backend.value for backend in MaterializationBackend], default=MaterializationBackend.AUTO.value)
+    parser.add_argument('-t', '--scan-threads', help='Number of threads used to walk the app and to read and scan its files (default: 1)', type=int, default=1)
+    parser.add_argument('--work-path', help='Directory in which the synthetic app and its copies are written. A temporary directory by default, removed afterwards', default=None)
+    parser.add_argument('--trace-memory', help='Report the peak memory allocated by each benchmark. Tracing slows down every phase', action='store_true')
+    parser.add_argument('--json', help='Path to which results are written as JSON', default=None)
+
+    return parser.parse_args()
+
+def main():
+    args = parseArguments()
+
+    # Operators only log warnings and errors, so that
+    # console output does not weigh on the timings
+    log = logging.getLogger('seed-vulns-benchmark')
+    log.setLevel(logging.WARNING)
+    log.addHandler(logging.StreamHandler())
+
+    workPath = args.work_path if args.work_path != None else tempfile.mkdtemp(prefix="seed-vulns-benchmark-")
+    sourcePath = os.path.join(workPath, "app")
+    generator = ProjectGenerator(args.java_files, args.kotlin_files, args.file_size, args.components, args.layouts, args.site_density, args.seed)
+    generationStart = time.perf_counter()
+    generator.generate(sourcePath)
+    print("Generated {} files ({:.1f} MiB) in {:.3f} s: {}".format(
+        generator.filesWritten, generator.bytesWritten / (1024 * 1024), time.perf_counter() - generationStart, sourcePath
+    ))
+
+    materializer = TimedMaterializer(TreeMaterializer(MaterializationBackend(args.materialization)))
+    projectIndex = ProjectIndex(sourcePath, args.scan_threads)
+    operators = args.operators.split(",") if args.operators != None else list(builtinOperators)
+
+    records = []
+    for mode in args.modes.split(","):
+        if mode not in modes:
+            log.error("Invalid mode: %s. Exiting...", mode)
+            exit(1)
+        # Operators are instantiated per mode, each with
+        # a report sink of its own to count its mutants
+        reportSink = ReportSink()
+        try:
+            operatorsQueue = instantiateOperators(log, operators)
+        except SeedVulnsError as e:
+            log.error("%s. Exiting...", e)
+            exit(1)
+        setupOperators(operatorsQueue, reportSink, False, args.seed)
+
+        if mode == "single":
+            results = benchmarkSingle(operatorsQueue, sourcePath, workPath, materializer, args.scan_threads, projectIndex, reportSink, args.trace_memory)
+        else:
+            results = []
+            for operator in operatorsQueue:
+                results.extend(benchmarkOperator(mode, operator, sourcePath, workPath, materializer, args.scan_threads, projectIndex, reportSink, args.trace_memory))
+        reportSink.close()
+        printResults(mode, results)
+        records.extend(result.toRecord() for result in results)
+
+    # Peak resident memory of the whole process, on top of the
+    # memory allocated by each benchmark if traced
+    peakResidentMemory = None
+    if resource != None:
+        peakResidentMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        print("\nPeak resident memory: {:.1f} MiB".format(peakResidentMemory / 1024))
+
+    if args.json != None:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"arguments": vars(args), "peakResidentMemory": peakResidentMemory, "results": records}, f, indent=2)
+
+    if args.work_path == None:
+        rmtree(workPath, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
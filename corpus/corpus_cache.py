@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import os
+from threading import Lock
+from profiling.run_profile import getProfile
+
+# Default memory cap of the corpus cache, in bytes
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Per-run cache of file contents shared by all handlers, so that each
+# file is read from disk once regardless of how many operators scan it.
+# Entries are keyed by path relative to the handler's destination path,
+# since every operator works on its own copy of the same app. Copies
+# preserve size and modification time, which are checked on every read
+# to invalidate entries of files that have been written since. The cache
+# is safe to use from the threads of a concurrent scan
+class CorpusCache:
+
+    def __init__(self, maxBytes=DEFAULT_MAX_BYTES):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    # Locks cannot be pickled, which is needed to hand the cache over
+    # to worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def getKey(self, root, file):
+        return os.path.relpath(file, root)
+
+    def read(self, root, file):
+        key = self.getKey(root, file)
+        fileStat = os.stat(file)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry != None and entry["size"] == fileStat.st_size and entry["mtime"] == fileStat.st_mtime_ns:
+                # Most recently used entries are kept at the end
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["content"]
+            self.misses += 1
+
+        # Files are read outside of the lock, so that threads do
+        # not wait on each other's reads
+        with open(file, "r") as f:
+            content = f.read()
+        profile = getProfile()
+        profile.count("filesRead")
+        profile.count("bytesRead", fileStat.st_size)
+        with self.lock:
+            self.store(key, fileStat, content)
+        return content
+
+    def store(self, key, fileStat, content):
+        self.remove(key)
+
+        # Files larger than the whole cache are never cached
+        if fileStat.st_size > self.maxBytes:
+            return
+
+        self.entries[key] = {
+            "size": fileStat.st_size,
+            "mtime": fileStat.st_mtime_ns,
+            "content": content
+        }
+        self.size += fileStat.st_size
+
+        # Evict least recently used entries until under the memory cap
+        while self.size > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted["size"]
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry != None:
+            self.size -= entry["size"]
+
+    def invalidate(self, root, file):
+        with self.lock:
+            self.remove(self.getKey(root, file))
@@ -1,7 +1,11 @@
 from enum import Enum
-import os
-from shutil import copytree, rmtree
+from hashlib import sha256
+from shutil import rmtree
 from lxml import etree as ET
+from materialization.tree_materializer import TreeMaterializer
+from mutation.mutation_errors import ManifestError
+from profiling.run_profile import getProfile
+from scanning.project_index import ProjectIndex
 
 class ExportedConfig(Enum):
     EXPORTED_EXPORTED_IS_TRUE = 1
@@ -12,145 +16,210 @@ class ExportedConfig(Enum):
 class ManifestHandler:
 
     namespace = None 
+    androidNamespace = None
     manifestPath = None
     manifestXml = None
+    manifestHash = None
+    componentTypes = ["activity", "service", "receiver", "provider"]
 
-    def __init__(self, destinationPath):
+    def __init__(self, destinationPath, materializer=None, scanThreads=1, projectIndex=None):
         self.destinationPath = destinationPath
-        self.findManifest()
-        self.parseManifest()
+        self.materializer = materializer if materializer != None else TreeMaterializer()
+        self.scanThreads = scanThreads
+        self.projectIndex = projectIndex if projectIndex != None else ProjectIndex(destinationPath, scanThreads)
+        if not self.findManifest():
+            raise ManifestError("No manifest found in: {}".format(destinationPath))
+        if not self.parseManifest():
+            raise ManifestError("Invalid manifest: {}".format(self.manifestPath))
 
     def removeDestinationPath(self):
         rmtree(self.destinationPath, ignore_errors=True)
 
+    def getOutputPath(self, copy_index=None):
+        # Mutants written to a new copy are output wherever the materializer
+        # puts that copy. Otherwise, the destination path itself is mutated
+        if copy_index == None:
+            return self.destinationPath
+        return self.materializer.getOutputPath("{}_{}".format(self.destinationPath, copy_index))
+
     def writeManifest(self, to_new_copy=False, copy_index=None):
-        # If to_new_copy is True, create a backup of the destination path
-        destinationPathBackup = None
-        if to_new_copy: 
-            destinationPathBackup = "{}_backup".format(self.destinationPath)
-            copytree(self.destinationPath, destinationPathBackup)
-            
-        # Write content to manifest file
-        with open(self.manifestPath, "w") as f:
-            f.write(self.getManifestString())
-
-        # If to_new_copy is True, move the destination path to a new directory
-        # named after the copy index, restore the backup to the original destination
+        # If to_new_copy is True, materialize a new copy of the destination path
+        # named after the copy index, and write the manifest in that copy only. 
+        # The destination path itself is left untouched
         if to_new_copy:
             newDestinationPath = "{}_{}".format(self.destinationPath, copy_index)
-            rmtree(newDestinationPath, ignore_errors=True)
-            os.rename(self.destinationPath, newDestinationPath)
-            os.rename(destinationPathBackup, self.destinationPath)
-            # Need to parse manifest again here 
-            self.parseManifest()
+            self.materializer.materializeMutant(self.destinationPath, newDestinationPath, {self.manifestPath: self.getManifestString()})
+            # Roll back the mutation in memory, so that the next mutant
+            # starts from the original manifest
+            self.rollback()
+            return
+
+        # Write content to manifest file. Mutations written to the destination
+        # path are kept, hence they can no longer be rolled back
+        self.materializer.writeFile(self.manifestPath, self.getManifestString())
+        self.undoLog = []
+
+    def writeEdits(self, to_new_copy=False, copy_index=None):
+        # Only write the manifest if it has been mutated since
+        # it was parsed or last written
+        if len(self.undoLog) != 0:
+            self.writeManifest(to_new_copy, copy_index)
+
+    def discardEdits(self):
+        self.rollback()
+
+    def getEdits(self):
+        # Mutated manifest, if any, which is neither written nor rolled back
+        if len(self.undoLog) != 0:
+            return {self.manifestPath: self.getManifestString()}
+        return {}
 
     def findManifest(self):
-        for root, _, files in os.walk(self.destinationPath):
-            if "AndroidManifest.xml" in files:
-                self.manifestPath = os.path.join(root, "AndroidManifest.xml")
-                return True
+        manifests = self.projectIndex.findFiles(self.destinationPath, name="AndroidManifest.xml")
+        if len(manifests) != 0:
+            self.manifestPath = manifests[0]
+            return True
         return False
     
     def parseManifest(self):
         try:
             self.manifestXml = ET.parse(self.manifestPath)
+            self.manifestHash = None
             self.namespace = self.manifestXml.getroot().nsmap
+            self.androidNamespace = list(self.namespace.values())[0]
+            self.undoLog = []
+            self.indexManifest()
             return True
         except ET.ParseError as e:
             return False
+
+    def getAttribName(self, name):
+        return "{" + self.androidNamespace + "}" + name
+
+    def classifyComponent(self, component):
+        exported = component.attrib.get(self.getAttribName("exported"))
+        if exported == "true":
+            return ExportedConfig.EXPORTED_EXPORTED_IS_TRUE
+        elif exported == "false":
+            return ExportedConfig.NOT_EXPORTED_EXPORTED_IS_FALSE
+        elif not exported:
+            if component.find("intent-filter") is not None:
+                return ExportedConfig.EXPORTED_INTENT_FILTER_PRESENT_AND_EXPORTED_NOT_PRESENT
+            return ExportedConfig.NOT_EXPORTED_INTENT_FILTER_NOT_PRESENT_AND_EXPORTED_NOT_PRESENT
+        # Any other value (e.g. a build-time placeholder) is neither
+        # considered exported nor non-exported
+        return None
+
+    def indexManifest(self):
+        # Index the manifest in a single pass over the tree. Components are
+        # kept in document order, both per type and per exported config,
+        # and can be looked up by type and name. Entries hold direct
+        # references to the elements of the tree
+        self.applications = []
+        self.componentIndex = {type: {"all": []} for type in self.componentTypes}
+        self.componentsByName = {}
+        for element in self.manifestXml.getroot().iter("application", *self.componentTypes):
+            if element.tag == "application":
+                self.applications.append(element)
+                continue
+            name = element.attrib.get(self.getAttribName("name"))
+            reason = self.classifyComponent(element)
+            self.componentIndex[element.tag]["all"].append({"component": element, "name": name, "reason": None})
+            self.componentIndex[element.tag].setdefault(reason, []).append({"component": element, "name": name, "reason": reason})
+            # Same as a query by name, the first component wins
+            self.componentsByName.setdefault((element.tag, name), element)
+        self.componentIndexStale = False
+
+    def getComponentIndex(self):
+        # Replacing attributes may change the exported config of components,
+        # in which case the index is rebuilt on the next lookup
+        if self.componentIndexStale:
+            self.indexManifest()
+        return self.componentIndex
         
+    def getManifestHash(self):
+        # Hash of the manifest file as parsed, computed once
+        if self.manifestHash == None:
+            with open(self.manifestPath, "rb") as f:
+                self.manifestHash = sha256(f.read()).hexdigest()
+        return self.manifestHash
+
     def getManifestString(self):
-        return ET.tostring(self.manifestXml, pretty_print=True).decode("utf-8")
+        profile = getProfile()
+        profile.count("manifestSerializations")
+        with profile.measure("serialize"):
+            return ET.tostring(self.manifestXml, pretty_print=True).decode("utf-8")
     
+    def setAttrib(self, element, attrib, value):
+        # Record the previous value (None if not present) in the undo log
+        self.undoLog.append(("attrib", element, attrib, element.attrib.get(attrib)))
+        element.attrib[attrib] = value
+        self.componentIndexStale = True
+
+    def appendComment(self, element, comment):
+        node = ET.Comment(comment)
+        element.append(node)
+        self.undoLog.append(("comment", element, node))
+
+    def rollback(self):
+        # Undo all changes since the manifest was parsed or last written,
+        # most recent first
+        while len(self.undoLog) != 0:
+            change = self.undoLog.pop()
+            match change[0]:
+                case "attrib":
+                    _, element, attrib, value = change
+                    if value == None:
+                        del element.attrib[attrib]
+                    else:
+                        element.attrib[attrib] = value
+                case "comment":
+                    _, element, node = change
+                    element.remove(node)
+        self.componentIndexStale = True
+
+    def replaceAttrib(self, old, new, comment):
+        self.appendComment(old, comment)
+        # Operators usually mutate the element itself, in which
+        # case there is nothing left to copy
+        if old is not new:
+            for attrib in new.attrib:
+                self.setAttrib(old, attrib, new.attrib[attrib])
+
     def queryAndReplaceAttrib(self, query, new, comment):
         old = self.manifestXml.find(query, namespaces=self.namespace)
-        old.append(ET.Comment(comment))
-        for attrib in new.attrib:
-            old.attrib[attrib] = new.attrib[attrib]
+        self.replaceAttrib(old, new, comment)
 
     def replaceApplicationAttrib(self, newApplication, comment):
-        query = ".//application"
-        self.queryAndReplaceAttrib(query, newApplication, comment)
+        self.replaceAttrib(self.applications[0], newApplication, comment)
 
     def replaceComponentAttrib(self, newComponent, componentName, comment):
-        query = ".//" + newComponent.tag + "[@android:name='" + componentName + "']"
-        self.queryAndReplaceAttrib(query, newComponent, comment)
+        old = self.componentsByName.get((newComponent.tag, componentName))
+        if old is None:
+            query = ".//" + newComponent.tag + "[@android:name='" + componentName + "']"
+            self.queryAndReplaceAttrib(query, newComponent, comment)
+            return
+        self.replaceAttrib(old, newComponent, comment)
         
     def findComponentsWithoutExported(self, type):
-        query = ".//" + type
-        all = []
-        for component in self.manifestXml.findall(query, namespaces=self.namespace):
-            all.append(component)
-        exportedNotPresent = []
-        for component in all:
-            if not component.attrib.get("{" + list(self.namespace.values())[0] + "}exported"):
-                exportedNotPresent.append(component)
-        return exportedNotPresent
+        return [
+            component["component"] for component in self.getComponentIndex()[type]["all"]
+            if not component["component"].attrib.get(self.getAttribName("exported"))
+        ]
 
     def findAllComponents(self, type, exported=None):
-        components = []
+        index = self.getComponentIndex()[type]
         if exported == True:
-
-            # In order to find exported components, the query is the following: 
+            # Exported components are those where: 
             # 1. exported='true' OR (2. intent-filter AND 3. exported not present)
-
-            # 1. exported='true'
-            query = ".//" + type + "[@android:exported='true']"
-            for component in self.manifestXml.findall(query, namespaces=self.namespace):
-                components.append({
-                        "component": component, 
-                        "name": component.attrib.get("{" + list(self.namespace.values())[0] + "}name"), 
-                        "reason": ExportedConfig.EXPORTED_EXPORTED_IS_TRUE
-                    })
-
-            # 3. exported not present
-            exportedNotPresent = self.findComponentsWithoutExported(type)
-
-            # 2. those with intent-filter among the exported not present ones
-            for component in exportedNotPresent:
-                if component.find("intent-filter") is not None:
-                    components.append({
-                            "component": component, 
-                            "name": component.attrib.get("{" + list(self.namespace.values())[0] + "}name"),
-                            "reason": ExportedConfig.EXPORTED_INTENT_FILTER_PRESENT_AND_EXPORTED_NOT_PRESENT
-                        })
-            
+            return index.get(ExportedConfig.EXPORTED_EXPORTED_IS_TRUE, []) + \
+                index.get(ExportedConfig.EXPORTED_INTENT_FILTER_PRESENT_AND_EXPORTED_NOT_PRESENT, [])
         elif exported == False:
-            
-            # In order to find non-exported components, the query is the following: 
+            # Non-exported components are those where: 
             # 1. exported='false' OR (2. intent-filter not present AND 3. exported not present)
-
-            # 1. exported='false'
-            query = ".//" + type + "[@android:exported='false']"
-            for component in self.manifestXml.findall(query, namespaces=self.namespace):
-                components.append({
-                        "component": component, 
-                        "name": component.attrib.get("{" + list(self.namespace.values())[0] + "}name"),
-                        "reason": ExportedConfig.NOT_EXPORTED_EXPORTED_IS_FALSE
-                    })
-
-            # 3. exported not present
-            exportedNotPresent = self.findComponentsWithoutExported(type)
-
-            # 2. those without intent-filter among the exported not present ones
-            for component in exportedNotPresent:
-                if component.find("intent-filter") is None:
-                    components.append({
-                            "component": component, 
-                            "name": component.attrib.get("{" + list(self.namespace.values())[0] + "}name"),
-                            "reason": ExportedConfig.NOT_EXPORTED_INTENT_FILTER_NOT_PRESENT_AND_EXPORTED_NOT_PRESENT
-                        })
-
-        else:
-            query = ".//" + type
-            for component in self.manifestXml.findall(query, namespaces=self.namespace):
-                components.append({
-                    "component": component,
-                    "name": component.attrib.get("{" + list(self.namespace.values())[0] + "}name"),
-                    "reason": None
-                })
-
-        return components
+            return index.get(ExportedConfig.NOT_EXPORTED_EXPORTED_IS_FALSE, []) + \
+                index.get(ExportedConfig.NOT_EXPORTED_INTENT_FILTER_NOT_PRESENT_AND_EXPORTED_NOT_PRESENT, [])
+        return list(index["all"])
 
     def findAllActivities(self, exported=None):
         return self.findAllComponents("activity", exported)
@@ -175,5 +244,4 @@ class ManifestHandler:
             raise ValueError("Invalid value for exported: " + str(exported))
         
     def findApplication(self):
-        query = ".//application"
-        return self.manifestXml.findall(query, namespaces=self.namespace)
+        return list(self.applications)
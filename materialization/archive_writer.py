@@ -0,0 +1,127 @@
+from enum import Enum
+from io import BytesIO
+import os
+import tarfile
+import zipfile
+from materialization.tree_materializer import OutputFormat
+from profiling.run_profile import getProfile
+from scanning.concurrent_scan import walkFiles
+
+class ArchiveLayout(Enum):
+    PER_MUTANT = "per-mutant" # One archive per mutant
+    SINGLE = "single" # One archive for all mutants, with one prefix per mutant
+
+# Drop-in replacement for TreeMaterializer used by the handlers when
+# mutants are output as archives. Working copies are still materialized
+# by the wrapped tree materializer, but each mutant is streamed straight
+# into a tar or zip archive: unchanged files are read from the source
+# path and mutated files are written from memory, so that no directory
+# tree is created (nor deleted) per mutant
+class ArchiveWriter:
+
+    archiveExtensions = {
+        OutputFormat.TAR: ".tar",
+        OutputFormat.ZIP: ".zip"
+    }
+
+    # Per-mutant archives are written under this suffix and renamed once
+    # closed, so that an interrupted run never leaves a truncated archive
+    # behind (which --skip-existing would take for a complete mutant)
+    partSuffix = ".part"
+
+    def __init__(self, treeMaterializer, sourcePath, archiveFormat, layout=ArchiveLayout.PER_MUTANT, archivePath=None):
+        self.treeMaterializer = treeMaterializer
+        self.sourcePath = sourcePath
+        self.archiveFormat = archiveFormat
+        self.layout = layout
+        self.archivePath = archivePath
+        self.archive = None
+        self.sourceFiles = None
+
+    # Open archives cannot be pickled, which is needed to hand the writer
+    # over to worker processes. The single archive layout is only used
+    # by a single process, hence per-mutant archives are never open
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["archive"] = None
+        return state
+
+    def materialize(self, sourcePath, destinationPath):
+        self.treeMaterializer.materialize(sourcePath, destinationPath)
+
+    def writeFile(self, file, content):
+        self.treeMaterializer.writeFile(file, content)
+
+    def getArchivePath(self, mutantPath):
+        if self.layout == ArchiveLayout.SINGLE:
+            return self.archivePath
+        return mutantPath + self.archiveExtensions[self.archiveFormat]
+
+    def getOutputPath(self, mutantPath):
+        # Mutants in the single archive are output under their own prefix
+        if self.layout == ArchiveLayout.SINGLE:
+            return "{}:{}/".format(self.archivePath, os.path.basename(mutantPath))
+        return self.getArchivePath(mutantPath)
+
+    def getSourceFiles(self):
+        # Files of the source path, relative to it, listed once
+        if self.sourceFiles == None:
+            self.sourceFiles = [
+                os.path.relpath(os.path.join(root, file), self.sourcePath).replace(os.sep, "/")
+                for root, file in walkFiles(self.sourcePath)
+            ]
+        return self.sourceFiles
+
+    def openArchive(self, path):
+        if self.archiveFormat == OutputFormat.TAR:
+            return tarfile.open(path, "w")
+        return zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+
+    def addFile(self, archive, source, name, content=None):
+        # Unchanged files are streamed from the source path. Mutated files
+        # are written from memory, with the metadata of the original file
+        getProfile().count("filesArchived")
+        if self.archiveFormat == OutputFormat.TAR:
+            if content == None:
+                archive.add(source, name, recursive=False)
+                return
+            data = content.encode("utf-8")
+            info = archive.gettarinfo(source, name)
+            info.size = len(data)
+            archive.addfile(info, BytesIO(data))
+            return
+
+        if content == None:
+            archive.write(source, name)
+            return
+        archive.writestr(zipfile.ZipInfo.from_file(source, name), content.encode("utf-8"))
+
+    def materializeMutant(self, basePath, mutantPath, contents):
+        # Contents map files in the base path, which is a copy of the source
+        # path, to their mutated content
+        mutated = {
+            os.path.relpath(file, basePath).replace(os.sep, "/"): content
+            for file, content in contents.items()
+        }
+
+        if self.layout == ArchiveLayout.SINGLE:
+            if self.archive == None:
+                self.archive = self.openArchive(self.archivePath)
+            archive = self.archive
+            prefix = os.path.basename(mutantPath) + "/"
+        else:
+            archive = self.openArchive(self.getArchivePath(mutantPath) + self.partSuffix)
+            prefix = ""
+
+        for relativeFile in self.getSourceFiles():
+            source = os.path.join(self.sourcePath, relativeFile)
+            self.addFile(archive, source, prefix + relativeFile, mutated.get(relativeFile))
+
+        if self.layout != ArchiveLayout.SINGLE:
+            archive.close()
+            os.replace(self.getArchivePath(mutantPath) + self.partSuffix, self.getArchivePath(mutantPath))
+
+    def close(self):
+        if self.archive != None:
+            self.archive.close()
+            self.archive = None
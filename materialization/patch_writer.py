@@ -0,0 +1,71 @@
+from difflib import unified_diff
+from hashlib import sha256
+import os
+from materialization.tree_materializer import getTemporaryPath
+from profiling.run_profile import getProfile
+
+# Drop-in replacement for TreeMaterializer used by the handlers when
+# mutants are output as patches. Working copies are still materialized
+# by the wrapped tree materializer, but each mutant is written as a
+# unified diff against the pristine copy of the app instead of as a
+# full directory tree
+class PatchWriter:
+
+    patchExtension = ".patch"
+
+    def __init__(self, treeMaterializer, pristinePath):
+        self.treeMaterializer = treeMaterializer
+        self.pristinePath = pristinePath
+
+    def materialize(self, sourcePath, destinationPath):
+        self.treeMaterializer.materialize(sourcePath, destinationPath)
+
+    def writeFile(self, file, content):
+        self.treeMaterializer.writeFile(file, content)
+
+    def getPatchPath(self, mutantPath):
+        return mutantPath + self.patchExtension
+
+    def getOutputPath(self, mutantPath):
+        return self.getPatchPath(mutantPath)
+
+    def getDiff(self, relativeFile, original, content):
+        diff = ""
+        for line in unified_diff(
+            original.splitlines(keepends=True),
+            content.splitlines(keepends=True),
+            fromfile="a/" + relativeFile,
+            tofile="b/" + relativeFile
+        ):
+            diff += line
+            # Lines without a trailing newline can only be the last line
+            # of either file, and need to be marked as such
+            if not line.endswith("\n"):
+                diff += "\n\\ No newline at end of file\n"
+        return diff
+
+    def materializeMutant(self, basePath, mutantPath, contents):
+        # Small metadata header. Both patch and git apply skip
+        # any text preceding the first hunk header
+        header = "seed-vulns mutant: {}\n".format(os.path.basename(mutantPath))
+        header += "Apply to: {}\n".format(self.pristinePath)
+        diffs = ""
+        for file, content in contents.items():
+            # The base path is an unmodified copy of the pristine app, hence
+            # the file in the base path is the original one
+            relativeFile = os.path.relpath(file, basePath).replace(os.sep, "/")
+            with open(file, "r") as f:
+                original = f.read()
+            header += "File: {} (original SHA-256: {})\n".format(relativeFile, sha256(original.encode("utf-8")).hexdigest())
+            diffs += self.getDiff(relativeFile, original, content)
+
+        # Like trees, patches are renamed into place once complete
+        patch = header + "\n" + diffs
+        temporaryPath = getTemporaryPath(self.getPatchPath(mutantPath))
+        with open(temporaryPath, "w") as f:
+            f.write(patch)
+        os.replace(temporaryPath, self.getPatchPath(mutantPath))
+        profile = getProfile()
+        if profile.enabled:
+            profile.count("patchesWritten")
+            profile.count("bytesWritten", len(patch.encode("utf-8")))
@@ -0,0 +1,115 @@
+from enum import Enum
+import os
+import stat
+from shutil import copy2, copystat, copytree, rmtree
+from profiling.run_profile import getProfile
+
+# fcntl is only available on POSIX platforms. Without it, reflinks
+# are simply reported as unsupported and plain copies are used instead
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Linux ioctl request number for FICLONE, which makes the destination
+# file share the extents of the source file (copy-on-write)
+FICLONE = 0x40049409
+
+class MaterializationBackend(Enum):
+    AUTO = "auto" # Reflink where the filesystem supports it, plain copy otherwise
+    REFLINK = "reflink"
+    HARDLINK = "hardlink"
+    COPY = "copy"
+
+class OutputFormat(Enum):
+    TREE = "tree" # One full directory tree per mutant
+    PATCH = "patch" # One pristine tree plus one unified diff per mutant
+    TAR = "tar" # One tar archive per mutant, or one for all mutants
+    ZIP = "zip" # Same as tar, as zip archives
+
+# Mutants are built under a temporary name next to their output path, and
+# renamed into place once complete, so that an interrupted run never leaves
+# a partial mutant behind (which --skip-existing would take for a complete
+# one). The process identifier keeps concurrent workers apart
+def getTemporaryPath(path):
+    return "{}.tmp-{}".format(path, os.getpid())
+
+class TreeMaterializer:
+
+    def __init__(self, backend=MaterializationBackend.AUTO):
+        self.backend = backend
+        self.reflinkSupported = fcntl != None and backend in [
+            MaterializationBackend.AUTO,
+            MaterializationBackend.REFLINK
+        ]
+
+    def reflinkFile(self, source, destination):
+        if self.reflinkSupported:
+            try:
+                with open(source, "rb") as s, open(destination, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                copystat(source, destination)
+                return destination
+            except OSError:
+                # The filesystem does not support reflinks (or the source and
+                # destination are on different filesystems). Do not try again
+                self.reflinkSupported = False
+        return copy2(source, destination)
+
+    def hardlinkFile(self, source, destination):
+        try:
+            os.link(source, destination)
+        except OSError:
+            # Hardlinks cannot cross filesystems, fall back to a plain copy
+            copy2(source, destination)
+        return destination
+
+    def copyFile(self, source, destination):
+        getProfile().count("filesCopied")
+        match self.backend:
+            case MaterializationBackend.AUTO | MaterializationBackend.REFLINK:
+                return self.reflinkFile(source, destination)
+            case MaterializationBackend.HARDLINK:
+                return self.hardlinkFile(source, destination)
+            case _:
+                return copy2(source, destination)
+
+    def materialize(self, sourcePath, destinationPath):
+        copytree(sourcePath, destinationPath, copy_function=self.copyFile)
+
+    def writeFile(self, file, content):
+        # Break-on-write: a file that is hardlinked into other trees is
+        # unlinked first, so that writing it never modifies the other trees
+        mode = None
+        if os.path.exists(file):
+            fileStat = os.stat(file)
+            if fileStat.st_nlink > 1:
+                mode = stat.S_IMODE(fileStat.st_mode)
+                os.unlink(file)
+
+        with open(file, "w") as f:
+            f.write(content)
+
+        profile = getProfile()
+        if profile.enabled:
+            profile.count("filesWritten")
+            profile.count("bytesWritten", len(content.encode("utf-8")))
+
+        if mode != None:
+            os.chmod(file, mode)
+
+    # Path a mutant is output to, as reported in the mutation report
+    def getOutputPath(self, mutantPath):
+        return mutantPath
+
+    def materializeMutant(self, basePath, mutantPath, contents):
+        # Materialize a new tree from the base path and only write the
+        # mutated files to it (contents maps files in the base path to
+        # their mutated content). The base path itself is left untouched
+        temporaryPath = getTemporaryPath(mutantPath)
+        rmtree(temporaryPath, ignore_errors=True)
+        self.materialize(basePath, temporaryPath)
+        for file, content in contents.items():
+            self.writeFile(os.path.join(temporaryPath, os.path.relpath(file, basePath)), content)
+        rmtree(mutantPath, ignore_errors=True)
+        os.rename(temporaryPath, mutantPath)
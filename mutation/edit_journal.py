@@ -0,0 +1,64 @@
+# Journal of the edits operators make to source and resource files. An
+# edit replaces a span of a file with a replacement string. Spans are
+# offsets into the content of the file as last read through the journal:
+# edits journaled since that read are pending, all refer to the same
+# content, and must not overlap. Pending edits of a file are spliced in a
+# single pass, in offset order, on its next read (which later edits then
+# refer to) or when it is written. Files are only written once all edits
+# of a mutant have been journaled, by the handler that owns the journal,
+# hence each edited file is written once per mutant
+class EditJournal:
+
+    def __init__(self):
+        self.bases = {}
+        self.edits = {}
+        self.contents = {}
+
+    def hasEdits(self, file):
+        return file in self.bases
+
+    def getContent(self, file):
+        if file not in self.contents:
+            self.contents[file] = self.splice(self.bases[file], self.edits[file])
+            self.bases[file] = self.contents[file]
+            self.edits[file] = []
+        return self.contents[file]
+
+    def getContents(self):
+        return {file: self.getContent(file) for file in self.bases}
+
+    def getEdits(self, file):
+        # Pending edits of the file, as (start, end, replacement)
+        return list(self.edits.get(file, []))
+
+    def splice(self, content, edits):
+        # Insertions at the start of a replaced span go before it. Edits
+        # at the same offset are spliced in the order they were journaled
+        parts = []
+        position = 0
+        for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+            parts.append(content[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(content[position:])
+        return "".join(parts)
+
+    def addEdit(self, file, content, start, end, replacement):
+        # The content of the file is only needed for its first edit. Later
+        # edits refer to the content in the journal
+        if file not in self.bases:
+            self.bases[file] = content
+            self.edits[file] = []
+        base = self.bases[file]
+        if start < 0 or end < start or end > len(base):
+            raise ValueError("Invalid span for {}: [{}, {})".format(file, start, end))
+        for otherStart, otherEnd, _ in self.edits[file]:
+            if start < otherEnd and otherStart < end:
+                raise ValueError("Overlapping edits of {}: [{}, {}) and [{}, {})".format(file, start, end, otherStart, otherEnd))
+        self.edits[file].append((start, end, replacement))
+        self.contents.pop(file, None)
+
+    def clear(self):
+        self.bases = {}
+        self.edits = {}
+        self.contents = {}
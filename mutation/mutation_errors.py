@@ -0,0 +1,26 @@
+# Errors of seed-vulns. They are raised instead of exiting the process, so
+# that seed-vulns can be used as a library. The command line logs them and
+# exits with a status of 1
+class SeedVulnsError(Exception):
+    pass
+
+# Invalid or conflicting arguments
+class InvalidArgumentsError(SeedVulnsError):
+    pass
+
+# Unknown operator name, or operator of an unknown type
+class InvalidOperatorError(SeedVulnsError):
+    pass
+
+# Missing, unparsable or inconsistent manifest
+class ManifestError(SeedVulnsError):
+    pass
+
+# Unexpected state of a mutation site, e.g. an attribute value
+# that an operator does not know how to mutate
+class MutationError(SeedVulnsError):
+    pass
+
+# Copy or removal of a copy of the app that failed
+class MaterializationError(SeedVulnsError):
+    pass
@@ -0,0 +1,478 @@
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import escape, glob
+from queue import SimpleQueue
+from shutil import rmtree
+from corpus.corpus_cache import CorpusCache
+from materialization.archive_writer import ArchiveLayout, ArchiveWriter
+from materialization.patch_writer import PatchWriter
+from materialization.tree_materializer import OutputFormat, TreeMaterializer
+from mutation.mutation_errors import InvalidArgumentsError, InvalidOperatorError, MaterializationError
+from operators.operator_registry import getHandlerClass, getOperatorClasses
+from operators.operators import OperatorTypes
+from profiling.run_profile import getProfile, initializeWorker as initializeProfile, renderProfile
+from scanning.project_index import ProjectIndex
+from scanning.scan_engine import ScanEngine
+
+# Mutation runs of seed-vulns, shared by the command line, the server and
+# the library API. Errors are raised as SeedVulnsError subclasses
+
+def validateArguments(single, allMutants, outputFormat, archiveLayout, jobs, scanThreads, skipExisting, serve=False):
+    if allMutants and single:
+        raise InvalidArgumentsError("Conflicting arguments: cannot output all mutants and a single higher order mutant at the same time")
+    if outputFormat != OutputFormat.TREE and not allMutants and not serve:
+        raise InvalidArgumentsError("Conflicting arguments: {} output format is only available when outputting all mutants".format(outputFormat.value))
+    if outputFormat in [OutputFormat.TAR, OutputFormat.ZIP] and archiveLayout == ArchiveLayout.SINGLE and (jobs != 1 or skipExisting):
+        raise InvalidArgumentsError("Conflicting arguments: a single archive can neither be written by parallel jobs nor skip existing mutants")
+    if skipExisting and not allMutants:
+        raise InvalidArgumentsError("Conflicting arguments: skipping existing mutants is only available when outputting all mutants")
+    if jobs < 1:
+        raise InvalidArgumentsError("Invalid number of jobs: {}".format(jobs))
+    if scanThreads < 1:
+        raise InvalidArgumentsError("Invalid number of scan threads: {}".format(scanThreads))
+
+def setupOperators(operatorsQueue, reportSink, skipExisting, seed):
+    # All operators stream their mutants to the same report sink
+    for operator in operatorsQueue:
+        operator.reportSink = reportSink
+        operator.skipExisting = skipExisting
+        if seed != None:
+            operator.seed(seed)
+
+def mutateApp(log, operatorsQueue, jobs, sourcePath, destinationPath, single, commentMutations, allMutants, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, skipExisting, include, exclude, gitignore):
+    projectIndex, materializer = prepareApp(log, sourcePath, destinationPath, single, materialization, outputFormat, archiveLayout, skipExisting, scanThreads, include, exclude, gitignore)
+
+    # Corpus cache shared by the source and resources handlers
+    # of all operators, so that each file is read only once 
+    corpusCache = CorpusCache(cacheSize * 1024 * 1024)
+
+    # Scan engine holding the patterns of all queued operators, so
+    # that each file is scanned for all of them in a single pass 
+    scanEngine = createScanEngine(operatorsQueue, scanIndex)
+
+    # Enter mutation loop. For each operator in the queue,
+    # apply the mutation to the app and save the mutated app
+    # to the destination path
+    log.info("Entering mutation loop...")
+    try:
+        if single:
+            return applyOperatorsToDestination(log, operatorsQueue, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        return applyOperatorsToCopies(log, operatorsQueue, jobs, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+    finally:
+        with getProfile().measure("cleanup"):
+            closeMaterializer(materializer)
+
+def logProfile(log, reportSink):
+    # Measurements of the main process are streamed to the report sink
+    # like those of worker processes, and the profile is rendered from
+    # the records of all of them. Worker processes overlap in time, hence
+    # the total of their phases may exceed the duration of the run
+    profile = getProfile()
+    if not profile.enabled:
+        return
+    profile.setOperator(None)
+    profile.flush(reportSink)
+    profile.close()
+    log.warning("\n========== Profile ==========%s", renderProfile(reportSink))
+    if profile.outputPath != None:
+        log.warning("cProfile stats: %s", profile.outputPath)
+
+def initializeWorker(level, profileEnabled, profileOutputPath):
+    setupLogging(level, False)
+    initializeProfile(profileEnabled, profileOutputPath)
+
+def prepareApp(log, sourcePath, destinationPath, single, materialization, outputFormat, archiveLayout, skipExisting, scanThreads, include, exclude, gitignore):
+    # Index of the files of the app, built by a single walk of the source
+    # path. All handlers find their files in it, since every destination
+    # path is a copy of the source path
+    log.info("Indexing the source path...")
+    with getProfile().measure("index"):
+        projectIndex = ProjectIndex(sourcePath, scanThreads, include, exclude, gitignore)
+    log.info("Indexed files: %d", len(projectIndex.files))
+
+    # Mutants left half-written by an interrupted run are removed
+    removeStaleOutputs(log, destinationPath)
+
+    # Tree materializer used to copy the source path and to produce
+    # mutant copies of the destination path
+    materializer = TreeMaterializer(materialization)
+
+    # If outputting patches, write the pristine app to the destination 
+    # path once. Mutants are then written as patches against it
+    if outputFormat == OutputFormat.PATCH:
+        log.info("Copying the source path to the destination path (pristine app)...")
+        # The pristine app of a previous run is replaced, since
+        # the source path may have changed since
+        if skipExisting:
+            rmtree(destinationPath, ignore_errors=True)
+        copyDestination(log, materializer, sourcePath, destinationPath)
+        materializer = PatchWriter(materializer, destinationPath)
+
+    # If outputting archives, mutants are streamed into archives
+    # next to the destination path, straight from the source path
+    if outputFormat in [OutputFormat.TAR, OutputFormat.ZIP]:
+        archivePath = destinationPath + ArchiveWriter.archiveExtensions[outputFormat]
+        materializer = ArchiveWriter(materializer, sourcePath, outputFormat, archiveLayout, archivePath)
+
+    # Copy the source path to the destination path. Mutations
+    # shall ovewrite the files in the destination path
+    if single:
+        log.info("Copying the source path to the destination path...")
+        copyDestination(log, materializer, sourcePath, destinationPath)
+
+    return projectIndex, materializer
+
+def removeStaleOutputs(log, destinationPath):
+    # Mutants are output next to the destination path, named after it
+    stale = glob(escape(destinationPath) + "_*.tmp-*") + glob(escape(destinationPath) + "_*" + ArchiveWriter.partSuffix)
+    for path in stale:
+        log.info("Removing incomplete mutant: %s", path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            rmtree(path, ignore_errors=True)
+        else:
+            os.remove(path)
+
+def createScanEngine(operatorsQueue, scanIndex):
+    scanEngine = ScanEngine(scanIndex)
+    for operator in operatorsQueue:
+        scanEngine.registerPatterns(operator.getPatterns())
+    return scanEngine
+
+def closeMaterializer(materializer):
+    if isinstance(materializer, ArchiveWriter):
+        materializer.close()
+
+def applyOperatorsToDestination(log, operatorsQueue, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    # Source file handlers, shared by all operators since
+    # they all mutate the same destination path
+    manifestHandler = None 
+    sourceHandler = None
+    resourcesHandler = None
+
+    # Find and parse Android manifest if needed. That is, if
+    # there are any XML-based operators in the queue
+    if needManifest(operatorsQueue):
+        log.info("Found queued manifest-based operators. Parsing manifest...")
+        with getProfile().measure("handlers"):
+            manifestHandler = createHandler(OperatorTypes.XML_MANIFEST, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        log.info("Manifest path: %s", manifestHandler.manifestPath)
+
+    # Find source files if needed. That is, if there are any
+    # Java-based operators in the queue
+    if needSources(operatorsQueue):
+        log.info("Found queued source-based operators. Finding source files...")
+        with getProfile().measure("handlers"):
+            sourceHandler = createHandler(OperatorTypes.JAVA, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        for sourceFile in sourceHandler.sourceFiles:
+            log.debug("Source file: %s", sourceFile)
+
+    # Find resource files if needed. That is, if there are any
+    # XML-based operators in the queue
+    if needResources(operatorsQueue):
+        log.info("Found queued resource-based operators. Finding resource files...")
+        with getProfile().measure("handlers"):
+            resourcesHandler = createHandler(OperatorTypes.XML_RESOURCES, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        for resourceFile in resourcesHandler.resourceFiles:
+            log.debug("Resource file: %s", resourceFile)
+
+    mutated = []
+    for operator in operatorsQueue:
+        log.info("Applying operator: %s", operator.name.value)
+        if operator.type == OperatorTypes.XML_MANIFEST:
+            mutated.append(mutate(operator, manifestHandler, commentMutations, allMutants))
+        elif operator.type == OperatorTypes.JAVA:
+            mutated.append(mutate(operator, sourceHandler, commentMutations, allMutants))
+        elif operator.type == OperatorTypes.XML_RESOURCES:
+            mutated.append(mutate(operator, resourcesHandler, commentMutations, allMutants))
+        else: 
+            raise InvalidOperatorError("Invalid operator type: {}".format(operator.type))
+
+    # Write all files mutated by the operators, each one once
+    log.info("Writing mutated files...")
+    writeEdits([manifestHandler, sourceHandler, resourcesHandler])
+    return mutated
+
+def findApps(sourcePath):
+    # Apps of a batch are either listed in a file, one source path per
+    # line, or the subdirectories of a directory
+    if os.path.isfile(sourcePath):
+        with open(sourcePath, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f]
+        return [line for line in lines if len(line) != 0 and not line.startswith("#")]
+    with os.scandir(sourcePath) as entries:
+        return sorted(entry.path for entry in entries if entry.is_dir() and not entry.name.startswith("."))
+
+def getAppDestinations(apps, destinationPath):
+    # Each app is output under the destination path, named after its
+    # source path. Apps with the same name are told apart by a suffix
+    destinations = []
+    names = set()
+    for app in apps:
+        name = os.path.basename(os.path.normpath(app))
+        uniqueName = name
+        index = 1
+        while uniqueName in names:
+            index += 1
+            uniqueName = "{}_{}".format(name, index)
+        names.add(uniqueName)
+        destinations.append(os.path.join(destinationPath, uniqueName))
+    return destinations
+
+def runBatchJob(log, reportSink, function, *arguments):
+    # Errors of a job are logged and returned instead of raised,
+    # so that one failing app does not abort the others
+    try:
+        return function(log, *arguments), None
+    except Exception as e:
+        log.error("An error occurred while mutating an app: %s", e)
+        return None, "{}: {}".format(type(e).__name__, e)
+    finally:
+        getProfile().setOperator(None)
+        getProfile().flush(reportSink)
+
+def runBatchJobs(log, jobs, reportSink, batchJobs):
+    # Results are returned in the order of the jobs
+    if jobs == 1:
+        return [runBatchJob(log, reportSink, *batchJob) for batchJob in batchJobs]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializeWorker, initargs=(log.level, getProfile().enabled, getProfile().outputPath)) as executor:
+        futures = [executor.submit(runBatchJob, log, reportSink, *batchJob) for batchJob in batchJobs]
+        return [future.result() for future in futures]
+
+def applyOperatorsToApp(log, operatorsQueue, seed, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    # Operators are seeded again for each app, so that the mutants
+    # of an app do not depend on the other apps of the batch
+    for operator in operatorsQueue:
+        if seed != None:
+            operator.seed(seed)
+    log.info("Applying operators to: %s", destinationPath)
+    return applyOperatorsToDestination(log, operatorsQueue, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+
+def applyOperatorToApp(log, operator, seed, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    if seed != None:
+        operator.seed(seed)
+    log.info("Applying operator %s to: %s", operator.name.value, sourcePath)
+    return [applyOperatorToCopy(log, operator, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex)]
+
+def applyOperatorsToApps(log, operatorsQueue, jobs, sourcePath, destinationPath, single, commentMutations, allMutants, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, seed, skipExisting, include, exclude, gitignore, reportSink):
+    # Batch mode: the source path lists apps, each of which is mutated
+    # as if seed-vulns had been run on it alone, with its output under
+    # the destination path. Apps are prepared (indexed and, if needed,
+    # copied) first, then each operator is applied to each app as a job
+    # of its own, or all operators at once with --single
+    apps = findApps(sourcePath)
+    appDestinations = getAppDestinations(apps, destinationPath)
+    log.info("Apps in batch: %d", len(apps))
+    os.makedirs(destinationPath, exist_ok=True)
+
+    log.info("Preparing apps...")
+    prepared = runBatchJobs(log, jobs, reportSink, [
+        (prepareApp, app, appDestination, single, materialization, outputFormat, archiveLayout, skipExisting, scanThreads, include, exclude, gitignore)
+        for app, appDestination in zip(apps, appDestinations)
+    ])
+
+    # Each app has its own corpus cache and scan engine, since both
+    # are keyed by paths relative to the app. The scan index is shared,
+    # since it keys files by app too
+    log.info("Entering mutation loop...")
+    batchJobs = []
+    jobApps = []
+    for app, appDestination, (preparedApp, error) in zip(apps, appDestinations, prepared):
+        if error != None:
+            continue
+        projectIndex, materializer = preparedApp
+        corpusCache = CorpusCache(cacheSize * 1024 * 1024)
+        scanEngine = createScanEngine(operatorsQueue, scanIndex)
+        if single:
+            batchJobs.append((applyOperatorsToApp, operatorsQueue, seed, appDestination, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex))
+            jobApps.append((app, "operators"))
+            continue
+        for operator in operatorsQueue:
+            batchJobs.append((applyOperatorToApp, operator, seed, app, appDestination, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex))
+            jobApps.append((app, operator.name.value))
+    results = runBatchJobs(log, jobs, reportSink, batchJobs)
+    for preparedApp, error in prepared:
+        if error == None:
+            closeMaterializer(preparedApp[1])
+
+    # Summary of each app, in batch order: how many operators mutated it
+    # and which jobs failed. Apps that could not be prepared fail as a whole
+    summaries = {
+        app: {"event": "app", "operator": None, "app": app, "destination": appDestination, "operators": len(operatorsQueue), "mutated": 0, "failed": 0, "errors": []}
+        for app, appDestination in zip(apps, appDestinations)
+    }
+    for app, (preparedApp, error) in zip(apps, prepared):
+        if error != None:
+            summaries[app]["failed"] = len(operatorsQueue)
+            summaries[app]["errors"].append("preparation: {}".format(error))
+    for (app, job), (mutated, error) in zip(jobApps, results):
+        if error != None:
+            summaries[app]["failed"] += 1 if not single else len(operatorsQueue)
+            summaries[app]["errors"].append("{}: {}".format(job, error))
+        else:
+            summaries[app]["mutated"] += mutated.count(True)
+
+    # The summary is logged as warnings, like the mutation report,
+    # so that it is logged with quiet verbosity too
+    log.warning("\n========== Batch Summary ==========")
+    failed = False
+    for app in apps:
+        summary = summaries[app]
+        summary["timestamp"] = time.time()
+        reportSink.emit(summary)
+        log.warning("- %s: %d of %d operators mutated the app, %d failed", app, summary["mutated"], summary["operators"], summary["failed"])
+        for error in summary["errors"]:
+            log.warning("  - Error: %s", error)
+        failed = failed or summary["failed"] != 0
+    return failed
+
+def applyOperatorsToCopies(log, operatorsQueue, jobs, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    arguments = [
+        (log, operator, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        for operator in operatorsQueue
+    ]
+    if jobs == 1:
+        return [applyOperatorToCopy(*operatorArguments) for operatorArguments in arguments]
+
+    # Each operator works on its own copy of the app and shares no
+    # state with the others, hence operators can be applied in parallel.
+    # Workers stream their mutants to the report sink themselves
+    log.info("Applying operators in up to %d parallel jobs...", jobs)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializeWorker, initargs=(log.level, getProfile().enabled, getProfile().outputPath)) as executor:
+        futures = [executor.submit(applyOperatorToCopy, *operatorArguments) for operatorArguments in arguments]
+        return [future.result() for future in futures]
+
+def applyOperatorToCopy(log, operator, sourcePath, destinationPath, commentMutations, allMutants, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    log.info("Applying operator: %s", operator.name.value)
+    profile = getProfile()
+    profile.setOperator(operator.name.value)
+    path = "{}_{}".format(destinationPath, operator.name.value)
+    # Working copies left behind by an interrupted run are replaced
+    if operator.skipExisting:
+        rmtree(path, ignore_errors=True)
+    # The handler class is looked up first, so that operators of
+    # an invalid type do not leave a copy of the app behind
+    getHandlerClass(operator.type)
+    copyDestination(log, materializer, sourcePath, path)
+    # The copy is removed if the operator or its handler fails, so that
+    # long-lived callers (e.g. of the library API) do not leak a copy of
+    # the app per failure
+    try:
+        with profile.measure("handlers"):
+            handler = createHandler(operator.type, path, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+        mutated = mutate(operator, handler, commentMutations, allMutants)
+        if mutated:
+            writeEdits([handler])
+    except Exception:
+        rmtree(path, ignore_errors=True)
+        profile.setOperator(None)
+        raise
+    removeDestination(log, mutated, path)
+    # Measurements of each operator are handed over as soon as it is done,
+    # since the operator may have been applied by a worker process
+    profile.flush(operator.reportSink)
+    profile.setOperator(None)
+    return mutated
+
+def mutate(operator, handler, commentMutations, allMutants):
+    # Phases of the operator, including those of its handler,
+    # are accounted to the operator
+    profile = getProfile()
+    previous = profile.operator
+    profile.setOperator(operator.name.value)
+    with profile.measure("mutate"):
+        mutated = operator.mutate(handler, commentMutations, allMutants)
+    profile.setOperator(previous)
+    return mutated
+
+def writeEdits(handlers):
+    with getProfile().measure("write"):
+        for handler in handlers:
+            if handler != None:
+                handler.writeEdits()
+
+def createHandler(operatorType, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex):
+    # Handler modules are imported along with the first handler of their
+    # type, e.g. lxml is only imported if XML-based operators are queued
+    handlerClass = getHandlerClass(operatorType)
+    if operatorType == OperatorTypes.XML_MANIFEST:
+        return handlerClass(destinationPath, materializer, scanThreads, projectIndex)
+    return handlerClass(destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex)
+
+def needResources(operatorsQueue):
+    for operator in operatorsQueue:
+        if operator.type == OperatorTypes.XML_RESOURCES:
+            return True
+
+def needSources(operatorsQueue):
+    for operator in operatorsQueue:
+        if operator.type == OperatorTypes.JAVA:
+            return True
+
+def needManifest(operatorsQueue):
+    for operator in operatorsQueue:
+        if operator.type == OperatorTypes.XML_MANIFEST:
+            return True
+
+def instantiateOperators(log, operators, allowModulePaths=True):
+    queue = []
+    for operator in operators:
+        log.info("Instantiating operator: %s", operator)
+
+        # Operator classes are looked up in the operator registry, which
+        # only imports the modules of the operators that are requested
+        for operatorClass in getOperatorClasses(operator, allowModulePaths):
+            queue.append(operatorClass(log))
+
+        log.info("Instance of %s has been queued", operator)
+
+    return queue
+
+def removeDestination(log, mutated, path):
+    if not mutated:
+        try:
+            with getProfile().measure("cleanup"):
+                rmtree(path)
+        except Exception as e:
+            raise MaterializationError("An error occurred while removing the destination path: {}".format(e))
+
+def copyDestination(log, materializer, sourcePath, destinationPath):
+    try:
+        with getProfile().measure("copy"):
+            materializer.materialize(sourcePath, destinationPath)
+    except Exception as e:
+        raise MaterializationError("An error occurred while copying the source path to the destination path: {}".format(e))
+
+def setupLogging(level=logging.INFO, asynchronous=True):
+    log = logging.getLogger('seed-vulns')
+    log.setLevel(level)
+
+    # Worker processes started by fork inherit the handlers of the
+    # parent process, but not the thread of its queue listener
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+
+    formatter = logging.Formatter('[%(name)s] %(message)s')
+
+    ch = logging.StreamHandler()
+    ch.setLevel(level)
+    ch.setFormatter(formatter)
+
+    if not asynchronous:
+        log.addHandler(ch)
+        return log
+
+    # Records are handed over to a queue, and written to the console 
+    # by a separate thread, so that console I/O never blocks mutations.
+    # The listener is stopped at exit, after writing pending records
+    logQueue = SimpleQueue()
+    listener = QueueListener(logQueue, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    log.addHandler(QueueHandler(logQueue))
+
+    return log
+
@@ -1,35 +1,44 @@
-import os
-from random import randrange
-import re
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class HardcodedSecret(Operator):
     name = OperatorNames.HARDCODED_SECRET
     type = OperatorTypes.JAVA
+    title = "Hardcoded Secret Operator"
 
     # This pattern works interchangeably with Java and Kotlin, hence
     # there is no need to distinguish between the two file extensions.
-    # Operand changes vary between languages, though. 
-    classDefinitionPattern = r"class\s+[A-Za-z0-9_]+(?s).*?\{"
+    # Operand changes vary between languages, though. The pattern only
+    # filters candidate sources, class definitions are then located
+    # by the source tokenizer
+    classDefinitionPattern = r"\bclass\s+[A-Za-z0-9_]"
 
     def __init__(self, log):
         super().__init__(log)
 
+    def getPatterns(self):
+        return [self.classDefinitionPattern]
+
+    def findSites(self, tokenizer, pattern):
+        # Class definitions, from the class keyword to the
+        # opening brace of their body
+        return [{"start": start, "end": end} for start, end in tokenizer.findClassDefinitions()]
+
     def mutate(self, sourceHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Hardcoded Secret Operator ==========\n"
+        self.startReport()
 
         # Get sources
         sourceFiles = sourceHandler.findSourceFiles()
         self.log.info("Found %d sources:", len(sourceFiles))
         for sourceFile in sourceFiles:
-            self.log.info("Source: %s", sourceFile)
+            self.log.debug("Source: %s", sourceFile)
 
         # Find class definitions in source files
-        candidateSourceFiles = sourceHandler.matchSourceFiles([self.classDefinitionPattern])
-        self.log.info("Found %d candidate sources:", len(candidateSourceFiles))
+        candidateSourceFiles = sourceHandler.matchSourceFiles(self.getPatterns())
+        candidateSourceFiles = self.locateSites(sourceHandler, candidateSourceFiles, allMutants)
+        self.log.info("Found %d candidate sites:", len(candidateSourceFiles))
         for sourceFile in candidateSourceFiles:
-            self.log.info("Candidate source: %s", sourceFile["file"])
+            self.log.info("Candidate site: %s at offset %d", sourceFile["file"], sourceFile["site"]["start"])
 
         if len(candidateSourceFiles) != 0:
             mutated = True 
@@ -40,60 +49,62 @@ class HardcodedSecret(Operator):
             if not allMutants:
                 # Pick a pseudorandom candidate source file
                 self.log.info("Picking a pseudorandom candidate source...")
-                index = randrange(0, len(candidateSourceFiles))
-                resultLine = "Picked source: " + candidateSourceFiles[index]["file"]
-                resultLine += "\n"
-                result += resultLine
-                candidateSourceFiles = [candidateSourceFiles[index]]
+                candidate = self.pickCandidate(candidateSourceFiles)
+                self.log.info("Picked source: %s", candidate["file"])
+                candidateSourceFiles = [candidate]
 
             for candidateSourceFile in candidateSourceFiles:
 
                 # Generate high entropy string 
                 self.log.info("Generating secret...")
-                secret = os.urandom(256).hex()
+                # The secret is drawn from the operator's generator, so that
+                # seeded runs inject the same secrets
+                secret = self.random.randbytes(256).hex()
                 self.log.info("Generated secret: %s", secret)
 
                 self.log.info("Mutating source...")
-                self.log.info("Source is:")
                 source = sourceHandler.readSourceFile(candidateSourceFile["file"])
-                self.log.info(source)
+                self.logDump("Source is:", lambda: source)
 
                 # Inject hardcoded secret into beginning of class definition
                 excerpt = None 
                 mutatedExcerpt = None
 
-                match = re.search(self.classDefinitionPattern, source)
-                excerpt = source[match.start():match.end()]
-                resultLine = "\nExcerpt:\n" + excerpt
+                site = candidateSourceFile["site"]
+                excerpt = source[site["start"]:site["end"]]
+                mutantId = self.getMutantId(sourceHandler, candidateSourceFile["file"], (site["start"], site["end"]), self.getContentHash(source)) if allMutants else None
 
                 if sourceHandler.isJavaSourceFile(candidateSourceFile["file"]):
                     mutatedExcerpt = excerpt + "\n\n    private static final String KEY = \"" + secret + "\"; {}\n\n".format(self.getComment() if commentMutations else "")
                 elif sourceHandler.isKotlinSourceFile(candidateSourceFile["file"]):
                     mutatedExcerpt = excerpt + "\n\n    private val KEY = \"" + secret + "\" {}\n\n".format(self.getComment() if commentMutations else "")
-                source = source.replace(excerpt, mutatedExcerpt)
-
+                sourceHandler.editSourceFile(candidateSourceFile["file"], site["start"], site["end"], mutatedExcerpt)
+
+                self.reportMutant(
+                    "source",
+                    candidateSourceFile["file"],
+                    excerpt,
+                    mutatedExcerpt,
+                    span=(site["start"], site["end"]),
+                    pattern=self.classDefinitionPattern,
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=sourceHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(sourceHandler, mutantId)
+                )
+
+                self.logDump("Mutated source is:", lambda: sourceHandler.readSourceFile(candidateSourceFile["file"]))
+
+                # Write mutated source to a new copy. Otherwise, journaled edits
+                # are written once all operators have been applied
                 if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-
-                resultLine += "\nMutated excerpt:\n" + mutatedExcerpt
-                result += resultLine
-                self.log.info(resultLine)
-
-                self.log.info("Mutated source is:")
-                self.log.info(source)
-
-                # Write mutated source to file
-                self.log.info("Writing mutated source to file...")
-                if not allMutants:
-                    sourceHandler.writeSourceFile(candidateSourceFile["file"], source)
-                else: 
-                    sourceHandler.writeSourceFile(candidateSourceFile["file"], source, True, "{}".format(allMutantsIndex))
+                    self.log.info("Writing mutated source to file...")
+                    if self.writeMutant(sourceHandler, mutantId):
+                        self.log.info("Successfully wrote source to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote source to file")
 
         # Remove base directory (no mutations there)
         if allMutants and mutated:
             sourceHandler.removeDestinationPath()
 
-        result += "========== End of Hardcoded Secret Operator ==========\n"
-        return result if mutated else None 
+        return self.endReport(mutated) 
@@ -1,18 +1,19 @@
 import os
-from random import randrange
-import re
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class ImplicitPendingIntent(Operator):
 
     name = OperatorNames.IMPLICIT_PENDING_INTENT
     type = OperatorTypes.JAVA
+    title = "Implicit Pending Intent Operator"
 
     # This pattern works interchangeably with Java and Kotlin, hence
-    # there is no need to distinguish between the two file extensions
-    explicitPendingIntentPatterns = [ 
-        r"PendingIntent(\s+)?\.(\s+)?get{}(\s+)?\((?s).*?PendingIntent(\s+)?\.(\s+)?FLAG_IMMUTABLE(?s).*?\)"
-            .format(pattern) 
+    # there is no need to distinguish between the two file extensions.
+    # Patterns map to the PendingIntent method they look for. They only
+    # filter candidate sources, calls with an immutable flag are then
+    # located by the source tokenizer
+    explicitPendingIntentPatterns = { 
+        r"PendingIntent\s*\.\s*get{}\s*\(".format(pattern): "get" + pattern
         for pattern in [
             "Activities",
             "Activity",
@@ -20,26 +21,43 @@ class ImplicitPendingIntent(Operator):
             "Service",
             "ForegroundService"
         ]
-    ]
+    }
 
     def __init__(self, log):
         super().__init__(log)
 
+    def getPatterns(self):
+        return list(self.explicitPendingIntentPatterns.keys())
+
+    def findSites(self, tokenizer, pattern):
+        # Calls whose arguments include PendingIntent.FLAG_IMMUTABLE,
+        # along with the spans of the flags
+        sites = []
+        for call in tokenizer.findCalls(self.explicitPendingIntentPatterns[pattern], "PendingIntent"):
+            flags = []
+            for index in range(call["arguments"] + 1, tokenizer.matches[call["arguments"]]):
+                if tokenizer.getText(index) == "FLAG_IMMUTABLE" and tokenizer.getTexts(index - 2, index) == ["PendingIntent", "."]:
+                    flags.append((tokenizer.starts[index], tokenizer.ends[index]))
+            if len(flags) != 0:
+                sites.append(dict(call, flags=flags))
+        return sites
+
     def mutate(self, sourceHandler, commentMutations, allMutants):
         mutated = False  
-        result = "\n========== Implicit Pending Intent Operator ==========\n"
+        self.startReport()
 
         # Get sources
         sourceFiles = sourceHandler.findSourceFiles()
         self.log.info("Found %d sources:", len(sourceFiles))
         for sourceFile in sourceFiles:
-            self.log.info("Source: %s", sourceFile)
+            self.log.debug("Source: %s", sourceFile)
 
         # Look for explicit pending intents in source files
-        candidateSourceFiles = sourceHandler.matchSourceFiles(self.explicitPendingIntentPatterns) 
-        self.log.info("Found %d candidate sources:", len(candidateSourceFiles))
+        candidateSourceFiles = sourceHandler.matchSourceFiles(self.getPatterns()) 
+        candidateSourceFiles = self.locateSites(sourceHandler, candidateSourceFiles, allMutants)
+        self.log.info("Found %d candidate sites:", len(candidateSourceFiles))
         for sourceFile in candidateSourceFiles:
-            self.log.info("Candidate source: %s. Pattern: %s", sourceFile["file"], sourceFile["pattern"])
+            self.log.info("Candidate site: %s at offset %d. Pattern: %s", sourceFile["file"], sourceFile["site"]["start"], sourceFile["pattern"])
 
         if len(candidateSourceFiles) != 0:
             mutated = True 
@@ -48,48 +66,47 @@ class ImplicitPendingIntent(Operator):
             if not allMutants: 
                 # Pick a random candidate source file
                 self.log.info("Picking a pseudorandom candidate source...")
-                index = randrange(0, len(candidateSourceFiles))
-                resultLine = "Picked source: " + candidateSourceFiles[index]["file"]
-                resultLine += "\n- PI regex pattern: " + candidateSourceFiles[index]["pattern"]
-                result += resultLine
-                self.log.info(resultLine)
-                candidateSourceFiles = [candidateSourceFiles[index]]
+                candidate = self.pickCandidate(candidateSourceFiles)
+                self.log.info("Picked source: %s", candidate["file"])
+                candidateSourceFiles = [candidate]
 
             for candidate in candidateSourceFiles:
                 # Mutate source file 
                 self.log.info("Mutating source...")
-                self.log.info("Source is:")
                 source = sourceHandler.readSourceFile(candidate["file"])
-                self.log.info(source)
-                match = re.search(candidate["pattern"], source)
-                excerpt = source[match.start():match.end()]
-                mutatedExcerpt = excerpt.replace("FLAG_IMMUTABLE", "FLAG_MUTABLE {}".format(self.getComment() if commentMutations else ""))
-                source = source.replace(excerpt, mutatedExcerpt)
-                resultLine = "\nExcerpt:\n"
-                resultLine += excerpt
-                if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-                resultLine += "\nMutated excerpt:\n"
-                resultLine += mutatedExcerpt
-                resultLine += "\n"
-                result += resultLine
-                self.log.info(resultLine)
+                self.logDump("Source is:", lambda: source)
+                site = candidate["site"]
+                excerpt = source[site["start"]:site["end"]]
+                mutantId = self.getMutantId(sourceHandler, candidate["file"], (site["start"], site["end"]), self.getContentHash(source)) if allMutants else None
+                mutatedExcerpt = excerpt
+                for start, end in reversed(site["flags"]):
+                    mutatedExcerpt = mutatedExcerpt[:start - site["start"]] + "FLAG_MUTABLE {}".format(self.getComment() if commentMutations else "") + mutatedExcerpt[end - site["start"]:]
+                sourceHandler.editSourceFile(candidate["file"], site["start"], site["end"], mutatedExcerpt)
+                self.reportMutant(
+                    "source",
+                    candidate["file"],
+                    excerpt,
+                    mutatedExcerpt,
+                    span=(site["start"], site["end"]),
+                    pattern=candidate["pattern"],
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=sourceHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(sourceHandler, mutantId)
+                )
                 
-                self.log.info("Mutated source is:")
-                self.log.info(source)
+                self.logDump("Mutated source is:", lambda: sourceHandler.readSourceFile(candidate["file"]))
 
-                # Write mutated source to file 
-                self.log.info("Writing mutated source to file...")
-                if not allMutants:
-                    sourceHandler.writeSourceFile(candidate["file"], source)
-                else: 
-                    sourceHandler.writeSourceFile(candidate["file"], source, True, "{}".format(allMutantsIndex))
+                # Write mutated source to a new copy. Otherwise, journaled edits
+                # are written once all operators have been applied
+                if allMutants:
+                    self.log.info("Writing mutated source to file...")
+                    if self.writeMutant(sourceHandler, mutantId):
+                        self.log.info("Successfully wrote source to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote source to file")
 
         # Remove base directory (no mutations there)
         if allMutants and mutated:
             sourceHandler.removeDestinationPath()
 
-        result += "========== End of Implicit Pending Intent Operator ==========\n"
-        return result if mutated else None
+        return self.endReport(mutated)
@@ -1,33 +1,54 @@
-from random import randrange
-import re
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class TapjackingPartialOcclusion(Operator):
     name = OperatorNames.TAPJACKING_PARTIAL_OCCLUSION
     type = OperatorTypes.JAVA
+    title = "Tapjacking Partial Occlusion Operator"
 
-    # Different patterns for Java and Kotlin
-    dispatchTouchEventPatternJava = r"public\s+?boolean\s+?dispatchTouchEvent\s*?\(\s*?MotionEvent(?s).*?\)\s*?{(?s).*?}"
-    dispatchTouchEventPatternKotlin = r"override\s+?fun\s+?dispatchTouchEvent\s*?\((?s).*?:\s*?MotionEvent(?s).*?\)\s*?:\s*?Boolean\s*?{(?s).*?}"
+    # Different patterns for Java and Kotlin. They only filter candidate
+    # sources, method definitions (including their whole body, however
+    # nested) are then located by the source tokenizer
+    dispatchTouchEventPatternJava = r"\bboolean\s+dispatchTouchEvent\s*\("
+    dispatchTouchEventPatternKotlin = r"\bfun\s+dispatchTouchEvent\s*\("
 
     def __init__(self, log):
         super().__init__(log)
 
+    def getPatterns(self):
+        return [self.dispatchTouchEventPatternJava, self.dispatchTouchEventPatternKotlin]
+
+    def findSites(self, tokenizer, pattern):
+        # Definitions returning a boolean and taking a single MotionEvent
+        # parameter, along with the name of the parameter
+        sites = []
+        if tokenizer.kotlin != (pattern == self.dispatchTouchEventPatternKotlin):
+            return sites
+        for definition in tokenizer.findMethodDefinitions("dispatchTouchEvent"):
+            parameters = tokenizer.getParameters(definition["parameters"])
+            if len(parameters) != 1 or "MotionEvent" not in parameters[0]:
+                continue
+            if tokenizer.kotlin and "Boolean" in definition["header"]:
+                sites.append(dict(definition, parameter=parameters[0][0]))
+            elif not tokenizer.kotlin and "boolean" in definition["header"]:
+                sites.append(dict(definition, parameter=parameters[0][-1]))
+        return sites
+
     def mutate(self, sourceHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Tapjacking Partial Occlusion Operator ==========\n"
+        self.startReport()
 
         # Get sources
         sourceFiles = sourceHandler.findSourceFiles()
         self.log.info("Found %d sources:", len(sourceFiles))
         for sourceFile in sourceFiles:
-            self.log.info("Source: %s", sourceFile)
+            self.log.debug("Source: %s", sourceFile)
 
         # Find dispatch touch event methods in source files
-        candidateSourceFiles = sourceHandler.matchSourceFiles([self.dispatchTouchEventPatternJava, self.dispatchTouchEventPatternKotlin])
-        self.log.info("Found %d candidate sources:", len(candidateSourceFiles))
+        candidateSourceFiles = sourceHandler.matchSourceFiles(self.getPatterns())
+        candidateSourceFiles = self.locateSites(sourceHandler, candidateSourceFiles, allMutants)
+        self.log.info("Found %d candidate sites:", len(candidateSourceFiles))
         for sourceFile in candidateSourceFiles:
-            self.log.info("Candidate source: %s", sourceFile["file"])
+            self.log.info("Candidate site: %s at offset %d", sourceFile["file"], sourceFile["site"]["start"])
 
         if len(candidateSourceFiles) != 0:
             mutated = True 
@@ -36,57 +57,50 @@ class TapjackingPartialOcclusion(Operator):
             if not allMutants:
                 # Pick a pseudorandom candidate source file
                 self.log.info("Picking a pseudorandom candidate source...")
-                index = randrange(0, len(candidateSourceFiles))
-                resultLine = "Picked source: " + candidateSourceFiles[index]["file"]
-                resultLine += "\n- dispatchTouchEvent regex pattern: " + candidateSourceFiles[index]["pattern"]
-                resultLine += "\n"
-                result += resultLine
-                self.log.info(resultLine)
-                candidateSourceFiles = [candidateSourceFiles[index]]
+                candidate = self.pickCandidate(candidateSourceFiles)
+                self.log.info("Picked source: %s", candidate["file"])
+                candidateSourceFiles = [candidate]
 
             for candidate in candidateSourceFiles:
                 # Mutate source file
                 self.log.info("Mutating source...")
-                self.log.info("Source is:")
                 source = sourceHandler.readSourceFile(candidate["file"])
-                self.log.info(source)
-                match = re.search(candidate["pattern"], source)
-                excerpt = source[match.start():match.end()]
-                mutatedExcerpt = "{{\n\n        return super.dispatchTouchEvent({}{}\n\n    }}"
-                insert = None
+                self.logDump("Source is:", lambda: source)
+                site = candidate["site"]
+                excerpt = source[site["start"]:site["end"]]
+                mutantId = self.getMutantId(sourceHandler, candidate["file"], (site["start"], site["end"]), self.getContentHash(source)) if allMutants else None
+                # The body is replaced with a plain call to the super method
+                mutatedExcerpt = "{{\n\n        return super.dispatchTouchEvent({}){} {}\n\n    }}"
+                terminator = ";" if sourceHandler.isJavaSourceFile(candidate["file"]) else ""
                 comment = self.getComment() if commentMutations else ""
-                if sourceHandler.isJavaSourceFile(candidate["file"]):
-                    insert = excerpt.split("(")[1].split("MotionEvent")[1].split(")")[0].strip()
-                    mutatedExcerpt = excerpt.replace(excerpt[excerpt.find("{"):], mutatedExcerpt.format(insert, comment))
-                elif sourceHandler.isKotlinSourceFile(candidate["file"]):
-                    insert = excerpt.split("(")[1].split(":")[0].strip()
-                    mutatedExcerpt = excerpt.replace(excerpt[excerpt.find("{"):], mutatedExcerpt.format(insert, comment))
-                source = source.replace(excerpt, mutatedExcerpt)
-                resultLine = "\nExcerpt:\n"
-                resultLine += excerpt
-                if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-                resultLine += "\nMutated excerpt:\n"
-                resultLine += mutatedExcerpt
-                result += resultLine + "\n"
-                self.log.info(resultLine)
+                mutatedExcerpt = source[site["start"]:site["bodyStart"]] + mutatedExcerpt.format(site["parameter"], terminator, comment)
+                sourceHandler.editSourceFile(candidate["file"], site["start"], site["end"], mutatedExcerpt)
+                self.reportMutant(
+                    "source",
+                    candidate["file"],
+                    excerpt,
+                    mutatedExcerpt,
+                    span=(site["start"], site["end"]),
+                    pattern=candidate["pattern"],
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=sourceHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(sourceHandler, mutantId)
+                )
 
-                self.log.info("Mutated source is:")
-                self.log.info(source)
+                self.logDump("Mutated source is:", lambda: sourceHandler.readSourceFile(candidate["file"]))
 
-                # Write mutated source to file
-                self.log.info("Writing mutated source to file...")
-                if not allMutants:
-                    sourceHandler.writeSourceFile(candidate["file"], source)
-                else: 
-                    sourceHandler.writeSourceFile(candidate["file"], source, True, "{}".format(allMutantsIndex))
+                # Write mutated source to a new copy. Otherwise, journaled edits
+                # are written once all operators have been applied
+                if allMutants:
+                    self.log.info("Writing mutated source to file...")
+                    if self.writeMutant(sourceHandler, mutantId):
+                        self.log.info("Successfully wrote source to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote source to file")
 
         # Remove base directory (no mutations there)
         if allMutants and mutated:
             sourceHandler.removeDestinationPath()
 
-        result += "========== End of Tapjacking Partial Occlusion Operator ==========\n"
-        return result if mutated else None
+        return self.endReport(mutated)
     
\ No newline at end of file
@@ -1,32 +1,40 @@
-from random import randrange
-import re
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class TapjackingSetHideOverlayWindows(Operator):
     name = OperatorNames.TAPJACKING_SET_HIDE_OVERLAY_WINDOWS
     type = OperatorTypes.JAVA
+    title = "Tapjacking Set Hide Overlay Windows"
 
     # Same pattern for Java and Kotlin
-    setHideOverlayWindows = r"\.(?s)\s*?setHideOverlayWindows(?s)\s*?\((?s)\s*?true(?s)\s*?\)"
+    setHideOverlayWindows = r"(?s)\.\s*?setHideOverlayWindows\s*?\(\s*?true\s*?\)"
 
     def __init__(self, log):
         super().__init__(log)
 
+    def getPatterns(self):
+        return [self.setHideOverlayWindows]
+
+    def findSites(self, tokenizer, pattern):
+        # The pattern may also match in comments and strings, hence
+        # matching calls are located by the source tokenizer
+        return [call for call in tokenizer.findCalls("setHideOverlayWindows") if tokenizer.getParameters(call["arguments"]) == [["true"]]]
+
     def mutate(self, sourceHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Tapjacking Set Hide Overlay Windows ==========\n"
+        self.startReport()
 
         # Get sources
         sourceFiles = sourceHandler.findSourceFiles()
         self.log.info("Found %d sources:", len(sourceFiles))
         for sourceFile in sourceFiles:
-            self.log.info("Source: %s", sourceFile)
+            self.log.debug("Source: %s", sourceFile)
 
         # Find set hide overlay windows calls in source files
-        candidateSourceFiles = sourceHandler.matchSourceFiles([self.setHideOverlayWindows])
-        self.log.info("Found %d candidate sources:", len(candidateSourceFiles))
+        candidateSourceFiles = sourceHandler.matchSourceFiles(self.getPatterns())
+        candidateSourceFiles = self.locateSites(sourceHandler, candidateSourceFiles, allMutants)
+        self.log.info("Found %d candidate sites:", len(candidateSourceFiles))
         for sourceFile in candidateSourceFiles:
-            self.log.info("Candidate source: %s", sourceFile["file"])
+            self.log.info("Candidate site: %s at offset %d", sourceFile["file"], sourceFile["site"]["start"])
 
         if len(candidateSourceFiles) != 0:
             mutated = True 
@@ -35,49 +43,46 @@ class TapjackingSetHideOverlayWindows(Operator):
             if not allMutants:
                 # Pick a pseudorandom candidate source file
                 self.log.info("Picking a pseudorandom candidate source...")
-                index = randrange(0, len(candidateSourceFiles))
-                resultLine = "Picked source: " + candidateSourceFiles[index]["file"]
-                resultLine += "\n- setHideOverlayWindows pattern: " + candidateSourceFiles[index]["pattern"]
-                resultLine += "\n"
-                result += resultLine
-                self.log.info(resultLine)
-                candidateSourceFiles = [candidateSourceFiles[index]]
+                candidate = self.pickCandidate(candidateSourceFiles)
+                self.log.info("Picked source: %s", candidate["file"])
+                candidateSourceFiles = [candidate]
 
             for candidate in candidateSourceFiles:
                 # Mutate source file
                 self.log.info("Mutating source...")
-                self.log.info("Source is:")
                 source = sourceHandler.readSourceFile(candidate["file"])
-                self.log.info(source)
-                match = re.search(candidate["pattern"], source)
-                excerpt = source[match.start():match.end()]
+                self.logDump("Source is:", lambda: source)
+                site = candidate["site"]
+                excerpt = source[site["start"]:site["end"]]
+                mutantId = self.getMutantId(sourceHandler, candidate["file"], (site["start"], site["end"]), self.getContentHash(source)) if allMutants else None
                 mutatedExcerpt = excerpt.replace("true", "false {}".format(self.getComment()))
-                source = source.replace(excerpt, mutatedExcerpt)
-                resultLine = "\nExcerpt:\n"
-                resultLine += excerpt
-                if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-                resultLine += "\nMutated excerpt:\n"
-                resultLine += mutatedExcerpt
-                result += resultLine + "\n"
-                self.log.info(resultLine)
+                sourceHandler.editSourceFile(candidate["file"], site["start"], site["end"], mutatedExcerpt)
+                self.reportMutant(
+                    "source",
+                    candidate["file"],
+                    excerpt,
+                    mutatedExcerpt,
+                    span=(site["start"], site["end"]),
+                    pattern=candidate["pattern"],
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=sourceHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(sourceHandler, mutantId)
+                )
 
-                self.log.info("Mutated source is:")
-                self.log.info(source)
+                self.logDump("Mutated source is:", lambda: sourceHandler.readSourceFile(candidate["file"]))
 
-                # Write mutated source to file
-                self.log.info("Writing mutated source to file...")
-                if not allMutants:
-                    sourceHandler.writeSourceFile(candidate["file"], source)
-                else: 
-                    sourceHandler.writeSourceFile(candidate["file"], source, True, "{}".format(allMutantsIndex))
+                # Write mutated source to a new copy. Otherwise, journaled edits
+                # are written once all operators have been applied
+                if allMutants:
+                    self.log.info("Writing mutated source to file...")
+                    if self.writeMutant(sourceHandler, mutantId):
+                        self.log.info("Successfully wrote source to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote source to file")
 
         # Remove base directory (no mutations there)
         if allMutants and mutated:
             sourceHandler.removeDestinationPath()
 
-        result += "========== End of Tapjacking Set Hide Overlay Windows ==========\n"
-        return result if mutated else None
+        return self.endReport(mutated)
     
\ No newline at end of file
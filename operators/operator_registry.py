@@ -0,0 +1,94 @@
+from importlib import import_module
+from importlib.metadata import entry_points
+from mutation.mutation_errors import InvalidOperatorError
+from operators.operators import Operator, OperatorNames, OperatorTypes
+
+# Entry point group in which packages register operators of their own,
+# e.g. in pyproject.toml:
+#   [project.entry-points."seed_vulns.operators"]
+#   MyOperator = "my_package.my_operator:MyOperator"
+# An entry point either refers to an Operator subclass, or to a list of
+# them that the name activates together
+ENTRY_POINT_GROUP = "seed_vulns.operators"
+
+# Classes of the operators shipped with seed-vulns, by name, as module
+# paths. Modules are only imported once an operator is requested, so that
+# e.g. a run of Java-based operators only never imports lxml
+builtinOperators = {
+    OperatorNames.IMPROPER_EXPORT.value: ["operators.xml.improper_export:ImproperExport"],
+    OperatorNames.DEBUGGABLE_APPLICATION.value: ["operators.xml.debuggable_application:DebuggableApplication"],
+    OperatorNames.IMPLICIT_PENDING_INTENT.value: ["operators.java.implicit_pending_intent:ImplicitPendingIntent"],
+    OperatorNames.HARDCODED_SECRET.value: ["operators.java.hardcoded_secret:HardcodedSecret"],
+    # Specifying operator TapjackingFullOcclusion activates
+    # both Java and XML full occlusion operators
+    OperatorNames.TAPJACKING_FULL_OCCLUSION.value: [
+        "operators.xml.tapjacking_full_occlusion:TapjackingFullOcclusion",
+        "operators.java.tapjacking_full_occlusion:TapjackingFullOcclusion"
+    ],
+    OperatorNames.TAPJACKING_PARTIAL_OCCLUSION.value: ["operators.java.tapjacking_partial_occlusion:TapjackingPartialOcclusion"],
+    OperatorNames.TAPJACKING_SET_HIDE_OVERLAY_WINDOWS.value: ["operators.java.tapjacking_set_hide_overlay_windows:TapjackingSetHideOverlayWindows"],
+    OperatorNames.PLAINTEXT_HTTP.value: ["operators.xml.plaintext_http:PlaintextHttp"]
+}
+
+# Handler of each type of operator, imported along with the first
+# operator of that type (the XML handlers import lxml)
+handlerClasses = {
+    OperatorTypes.XML_MANIFEST: "manifest.manifest_handler:ManifestHandler",
+    OperatorTypes.JAVA: "source.source_handler:SourceHandler",
+    OperatorTypes.XML_RESOURCES: "resources.resources_handler:ResourcesHandler"
+}
+
+loadedClasses = {}
+registeredEntryPoints = None
+
+def loadClass(path):
+    # Classes are given as module:Class
+    if path not in loadedClasses:
+        moduleName, _, className = path.partition(":")
+        try:
+            module = import_module(moduleName)
+        except ImportError as e:
+            raise InvalidOperatorError("Cannot import {}: {}".format(moduleName, e))
+        if not hasattr(module, className):
+            raise InvalidOperatorError("No class {} in {}".format(className, moduleName))
+        loadedClasses[path] = getattr(module, className)
+    return loadedClasses[path]
+
+def getEntryPoints():
+    # Entry points are only looked up, which reads package metadata but
+    # does not import anything, if a name is not a built-in operator
+    global registeredEntryPoints
+    if registeredEntryPoints == None:
+        registeredEntryPoints = {entryPoint.name: entryPoint for entryPoint in entry_points(group=ENTRY_POINT_GROUP)}
+    return registeredEntryPoints
+
+def checkOperatorClasses(name, classes):
+    for operatorClass in classes:
+        if not isinstance(operatorClass, type) or not issubclass(operatorClass, Operator):
+            raise InvalidOperatorError("Invalid operator: {} is not an operator class".format(name))
+    return classes
+
+def getOperatorClasses(name, allowModulePaths=True):
+    # Operators are requested by the name of a built-in operator, by the
+    # name of an entry point, or by the module path of their class
+    # (module:Class), e.g. for operators that are not packaged. Module
+    # paths import arbitrary modules, hence they are only allowed from
+    # trusted callers (the command line and the library API)
+    if name in builtinOperators:
+        return [loadClass(path) for path in builtinOperators[name]]
+    if ":" in name:
+        if not allowModulePaths:
+            raise InvalidOperatorError("Invalid operator: {}. Operators cannot be given as module paths here".format(name))
+        return checkOperatorClasses(name, [loadClass(name)])
+    if name in getEntryPoints():
+        try:
+            loaded = getEntryPoints()[name].load()
+        except ImportError as e:
+            raise InvalidOperatorError("Cannot load operator {}: {}".format(name, e))
+        return checkOperatorClasses(name, list(loaded) if isinstance(loaded, (list, tuple)) else [loaded])
+    raise InvalidOperatorError("Invalid operator: {}".format(name))
+
+def getHandlerClass(operatorType):
+    if operatorType not in handlerClasses:
+        raise InvalidOperatorError("Invalid operator type: {}".format(operatorType))
+    return loadClass(handlerClasses[operatorType])
@@ -1,5 +1,13 @@
 from abc import abstractmethod
 from enum import Enum
+from hashlib import sha256
+import logging
+import os
+from random import Random
+import time
+from profiling.run_profile import getProfile
+from report.report_sink import renderMutant
+from scanning.scan_index import hashText
 
 class OperatorTypes(Enum):
     XML_MANIFEST = "XML_MANIFEST"
@@ -24,6 +32,17 @@ class OperatorNames(Enum):
 
 class Operator:
 
+    # Title of the operator's section in the human-readable report
+    title = None
+
+    # Sink the mutation report is streamed to. Set by the caller, mutants
+    # are only logged if no sink is set
+    reportSink = None
+
+    # If set by the caller, mutants whose output path already exists
+    # (e.g. written by a previous, interrupted run) are not written again
+    skipExisting = False
+
     @property
     def name(self):
         pass
@@ -34,12 +53,154 @@ class Operator:
 
     def __init__(self, log):
         self.log = log
+        self.random = Random()
+
+    def seed(self, seed):
+        # Each operator has its own generator seeded after its name, so that
+        # its picks do not depend on the other operators nor on the order
+        # in which operators are applied
+        self.random.seed("{}:{}".format(seed, self.name.value))
+
+    def pickCandidate(self, candidates):
+        return candidates[self.random.randrange(0, len(candidates))]
+
+    def getContentHash(self, content):
+        # Hashed a chunk at a time, since it is hashed once per mutant
+        return hashText(content)
+
+    # Stable identifier of a mutant, derived from the operator, the file
+    # (relative to the app), the mutated site in the file and the hash of
+    # the content of the file before the mutation. Reruns on the same app
+    # produce the same identifiers, regardless of the order of the mutants
+    def getMutantId(self, handler, file, site, contentHash):
+        key = "\0".join([self.name.value, os.path.relpath(file, handler.destinationPath), str(site), contentHash])
+        return sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def mutantExists(self, handler, mutantId):
+        return self.skipExisting and os.path.exists(handler.getOutputPath(mutantId))
+
+    # Write the journaled edits of a mutant to a new copy named after
+    # the mutant identifier, unless the mutant is skipped
+    def writeMutant(self, handler, mutantId):
+        if self.mutantExists(handler, mutantId):
+            self.log.info("Mutant %s already exists. Skipping...", mutantId)
+            handler.discardEdits()
+            return False
+        with getProfile().measure("write"):
+            handler.writeEdits(True, mutantId)
+        return True
 
     def getComment(self):
         return MutationComment.MUTATION_COMMENT_XML.value if (
             self.type in [OperatorTypes.XML_MANIFEST, OperatorTypes.XML_RESOURCES]
         ) else MutationComment.MUTATION_COMMENT_JAVA.value 
 
+    # Whole-file dumps are expensive to build and to write on large apps, 
+    # hence they are only logged (and built, dump being a callable) when
+    # debug logging is enabled
+    def logDump(self, message, dump):
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(message)
+            self.log.debug(dump())
+
+    # Patterns the operator looks for in source or resource files, so that
+    # files can be scanned for the patterns of all queued operators at once
+    def getPatterns(self):
+        return []
+
+    def startReport(self):
+        self.reportStart = time.monotonic()
+        self.mutantStart = self.reportStart
+        self.mutants = 0
+
+    # Report a mutant as soon as it has been produced. kind is what the
+    # mutated file or element is (source, resource, component, application),
+    # span is the offsets of the excerpt in the file, if any
+    def reportMutant(self, kind, file, excerpt, mutatedExcerpt, span=None, pattern=None, mutantIndex=None, mutantId=None, outputPath=None, skipped=False):
+        now = time.monotonic()
+        record = {
+            "event": "mutant",
+            "operator": self.name.value,
+            "kind": kind,
+            "file": file,
+            "span": list(span) if span != None else None,
+            "pattern": pattern,
+            "excerptHash": self.getContentHash(excerpt),
+            "excerpt": excerpt,
+            "mutatedExcerpt": mutatedExcerpt,
+            "mutantIndex": mutantIndex,
+            "mutantId": mutantId,
+            "outputPath": outputPath,
+            "skipped": skipped,
+            "timestamp": time.time(),
+            "duration": now - self.mutantStart
+        }
+        self.mutantStart = now
+        self.mutants += 1
+        self.log.info(renderMutant(record))
+        if self.reportSink != None:
+            self.reportSink.emit(record)
+
+    def endReport(self, mutated):
+        if self.reportSink != None:
+            self.reportSink.emit({
+                "event": "operator",
+                "operator": self.name.value,
+                "mutated": mutated,
+                "mutants": self.mutants,
+                "timestamp": time.time(),
+                "duration": time.monotonic() - self.reportStart
+            })
+        return mutated
+
+    # Mutation sites of a candidate source matching the given pattern, located
+    # with the source tokenizer, in file order. Patterns are only used to
+    # filter candidates, by operators that locate sites this way
+    def findSites(self, tokenizer, pattern):
+        return []
+
+    # Mutation sites of the candidates of a source, in a single tokenization
+    # of the source. Each site becomes a candidate of its own, in file order.
+    # Sites overlapping a previous site (e.g. found for another pattern) are
+    # dropped. There are none if the matches of the source are all in
+    # comments or strings
+    def locateFileSites(self, sourceHandler, file, candidates):
+        tokenizer = sourceHandler.tokenizeSourceFile(file)
+        sites = []
+        for candidate in candidates:
+            for site in self.findSites(tokenizer, candidate["pattern"]):
+                sites.append(dict(candidate, site=site))
+        located = []
+        end = -1
+        for candidate in sorted(sites, key=lambda candidate: candidate["site"]["start"]):
+            if candidate["site"]["start"] >= end:
+                located.append(candidate)
+                end = candidate["site"]["end"]
+        return located
+
+    # Locate the mutation sites of candidate sources. Tokenizing is far
+    # slower than scanning, hence only all mutants need the sites of every
+    # source. Otherwise, a pseudorandom candidate source is picked first and
+    # only its sites are returned, moving on to another source if it has no
+    # site, so that a single source is tokenized in most cases. The site to
+    # mutate is then picked among the sites of that source
+    def locateSites(self, sourceHandler, candidates, allMutants=True):
+        files = {}
+        for candidate in candidates:
+            files.setdefault(candidate["file"], []).append(candidate)
+        if allMutants:
+            located = []
+            for file, fileCandidates in files.items():
+                located.extend(self.locateFileSites(sourceHandler, file, fileCandidates))
+            return located
+        remaining = list(files)
+        while len(remaining) != 0:
+            file = remaining.pop(self.random.randrange(0, len(remaining)))
+            located = self.locateFileSites(sourceHandler, file, files[file])
+            if len(located) != 0:
+                return located
+        return []
+
     @abstractmethod
     def mutate(self, handler=None, commentMutations=False, allMutants=False):
         pass
@@ -1,58 +1,77 @@
+from mutation.mutation_errors import ManifestError, MutationError
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class DebuggableApplication(Operator):
 
     name = OperatorNames.DEBUGGABLE_APPLICATION
     type = OperatorTypes.XML_MANIFEST
+    title = "Debuggable Application Operator"
 
     def __init__(self, log):
         super().__init__(log)
 
     def mutate(self, manifestHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Debuggable Application Operator ==========\n"
+        self.startReport()
 
         application = None
         try:
             self.log.info("Finding application...")
             application = manifestHandler.findApplication()
         except Exception as e:
-            self.log.error("An error occurred while finding applications: %s. Exiting...", e)
-            exit(1)
+            raise ManifestError("An error occurred while finding applications: {}".format(e))
 
         if len(application) != 1:
-            self.log.error("Inconsistent manifest: must contain one and only one application. Exiting...", len(application))
-            exit(1)
+            raise ManifestError("Inconsistent manifest: must contain one and only one application, found {}".format(len(application)))
 
         application = application[0]
-        resultLine = "Application:"
-        resultLine += "\n- attrib: " + application.attrib.__str__()
-        self.log.info(resultLine)
-        result += resultLine + "\n"
+        excerpt = "Application:"
+        excerpt += "\n- attrib: " + application.attrib.__str__()
+        self.log.info(excerpt)
+        # The application is identified by the mutated attribute, since
+        # there is a single application per manifest
+        mutantId = self.getMutantId(
+            manifestHandler,
+            manifestHandler.manifestPath,
+            "application:debuggable",
+            manifestHandler.getManifestHash()
+        ) if allMutants else None
 
-        match application.attrib.get("{" + list(manifestHandler.namespace.values())[0] + "}debuggable"):
+        match application.attrib.get(manifestHandler.getAttribName("debuggable")):
             case "true":
                 self.log.info("Application is already debuggable. Skipping...")
-                return None 
+                return self.endReport(False)
             case "false" | None:
                 mutated = True
-                application.attrib["{" + list(manifestHandler.namespace.values())[0] + "}debuggable"] = "true"
+                manifestHandler.setAttrib(application, manifestHandler.getAttribName("debuggable"), "true")
                 self.log.info("Application is not debuggable. Mutating...")
                 manifestHandler.replaceApplicationAttrib(application, self.getComment())
-                self.log.info("Successfully mutated application. New manifest is:")
-                self.log.info(manifestHandler.getManifestString())
+                self.log.info("Successfully mutated application")
+                self.logDump("New manifest is:", manifestHandler.getManifestString)
             case _:
-                self.log.error("Invalid value for debuggable: %s", application.attrib.get("{" + list(manifestHandler.namespace.values())[0] + "}debuggable"))
-                exit(1)
+                raise MutationError("Invalid value for debuggable: {}".format(application.attrib.get(manifestHandler.getAttribName("debuggable"))))
         
-        resultLine = "Mutated application:"
-        resultLine += "\n- attrib: " + application.attrib.__str__()
-        self.log.info(resultLine)
-        result += resultLine + "\n"
+        mutatedExcerpt = "Application:"
+        mutatedExcerpt += "\n- attrib: " + application.attrib.__str__()
+        self.reportMutant(
+            "application",
+            manifestHandler.manifestPath,
+            excerpt,
+            mutatedExcerpt,
+            mutantIndex=0 if allMutants else None,
+            mutantId=mutantId,
+            outputPath=manifestHandler.getOutputPath(mutantId),
+            skipped=allMutants and self.mutantExists(manifestHandler, mutantId)
+        )
 
-        self.log.info("Writing manifest to file...")
-        manifestHandler.writeManifest()
-        self.log.info("Successfully wrote manifest to file")
+        # Write mutated manifest to a new copy, through the materializer so
+        # that the mutant is output in the requested format, and remove the
+        # base directory (no mutations there). Otherwise, the mutated
+        # manifest is written once all operators have been applied
+        if allMutants:
+            self.log.info("Writing manifest to file...")
+            if self.writeMutant(manifestHandler, mutantId):
+                self.log.info("Successfully wrote manifest to file")
+            manifestHandler.removeDestinationPath()
 
-        result += "========== End of Debuggable Application Operator ==========\n"
-        return result if mutated else None 
+        return self.endReport(mutated)
@@ -1,26 +1,26 @@
 from manifest.manifest_handler import ExportedConfig
-from random import randrange
+from mutation.mutation_errors import ManifestError, MutationError
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class ImproperExport(Operator):
 
     name = OperatorNames.IMPROPER_EXPORT
     type = OperatorTypes.XML_MANIFEST
+    title = "Improper Export Operator"
 
     def __init__(self, log):
         super().__init__(log)
 
     def mutate(self, manifestHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Improper Export Operator ==========\n"
+        self.startReport()
         nonExportedComponents = None
         try:
             nonExportedComponents = manifestHandler.findAllApplicationComponents(exported=False)
             for component in nonExportedComponents:
                 self.log.info("Component: %s is not exported. Reason: %s", component["name"], component["reason"])
         except Exception as e:
-            self.log.error("An error occurred while finding all application components: %s. Exiting...", e)
-            exit(1)
+            raise ManifestError("An error occurred while finding all application components: {}".format(e))
 
         if len(nonExportedComponents) != 0:
             mutated = True
@@ -28,54 +28,61 @@ class ImproperExport(Operator):
 
             if not allMutants:
                 self.log.info("Pseudorandomly picking component to mutate...")
-                index = randrange(0, len(nonExportedComponents))
-                component = nonExportedComponents[index]
-                resultLine = "Picked component: " + component["name"]
-                self.log.info(resultLine)
-                result += resultLine + "\n"
+                component = self.pickCandidate(nonExportedComponents)
+                self.log.info("Picked component: %s", component["name"])
                 nonExportedComponents = [component]
 
             for component in nonExportedComponents:
                 self.log.info("Mutating component...")
-                resultLine = "Component: " + component["name"]
-                resultLine += "\n- tag: " + component["component"].tag
-                resultLine += "\n- attrib: " + str(component["component"].attrib)
-                if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-                self.log.info(resultLine)
-                result += resultLine + "\n"
+                excerpt = "Component: " + component["name"]
+                excerpt += "\n- tag: " + component["component"].tag
+                excerpt += "\n- attrib: " + str(component["component"].attrib)
+                self.log.info(excerpt)
+                # Components are identified by tag and name within the manifest
+                mutantId = self.getMutantId(
+                    manifestHandler,
+                    manifestHandler.manifestPath,
+                    "{}:{}".format(component["component"].tag, component["name"]),
+                    manifestHandler.getManifestHash()
+                ) if allMutants else None
                 match component["reason"]:
                     case ExportedConfig.NOT_EXPORTED_EXPORTED_IS_FALSE:
-                        component["component"].attrib["{" + list(manifestHandler.namespace.values())[0] + "}exported"] = "true"
+                        manifestHandler.setAttrib(component["component"], manifestHandler.getAttribName("exported"), "true")
                     case ExportedConfig.NOT_EXPORTED_INTENT_FILTER_NOT_PRESENT_AND_EXPORTED_NOT_PRESENT:
-                        component["component"].attrib["{" + list(manifestHandler.namespace.values())[0] + "}exported"] = "true"
+                        manifestHandler.setAttrib(component["component"], manifestHandler.getAttribName("exported"), "true")
                     case _:
-                        self.log.error("Invalid reason for non-exportation: %s", component["reason"])
-                        exit(1)
+                        raise MutationError("Invalid reason for non-exportation: {}".format(component["reason"]))
                 
                 self.log.info("Successfully mutated component")
-                resultLine = "Mutated component: " + component["name"]
-                resultLine += "\n- tag: " + component["component"].tag
-                resultLine += "\n- attrib: " + str(component["component"].attrib)
-                self.log.info(resultLine)
-                result += resultLine + "\n"
+                mutatedExcerpt = "Component: " + component["name"]
+                mutatedExcerpt += "\n- tag: " + component["component"].tag
+                mutatedExcerpt += "\n- attrib: " + str(component["component"].attrib)
+                self.reportMutant(
+                    "component",
+                    manifestHandler.manifestPath,
+                    excerpt,
+                    mutatedExcerpt,
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=manifestHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(manifestHandler, mutantId)
+                )
                 
                 self.log.info("Replacing component in manifest...")
                 manifestHandler.replaceComponentAttrib(component["component"], component["name"], self.getComment())
-                self.log.info("Successfully replaced component in manifest. New manifest is:")
-                self.log.info(manifestHandler.getManifestString())
+                self.log.info("Successfully replaced component in manifest")
+                self.logDump("New manifest is:", manifestHandler.getManifestString)
 
-                self.log.info("Writing manifest to file...")
-                if not allMutants:
-                    manifestHandler.writeManifest()
-                else:
-                    manifestHandler.writeManifest(True, "{}".format(allMutantsIndex))
+                # Write mutated manifest to a new copy. Otherwise, the mutated
+                # manifest is written once all operators have been applied
+                if allMutants:
+                    self.log.info("Writing manifest to file...")
+                    if self.writeMutant(manifestHandler, mutantId):
+                        self.log.info("Successfully wrote manifest to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote manifest to file")
 
         # Remove base directory (no mutations there)
         if allMutants and mutated:
             manifestHandler.removeDestinationPath()
 
-        result += "========== End of Improper Export Operator ==========\n"
-        return result if mutated else None
+        return self.endReport(mutated)
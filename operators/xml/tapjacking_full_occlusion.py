@@ -1,31 +1,32 @@
-from random import randrange
-import re
 from operators.operators import Operator, OperatorNames, OperatorTypes
 
 class TapjackingFullOcclusion(Operator):
     name = OperatorNames.TAPJACKING_FULL_OCCLUSION_XML
     type = OperatorTypes.XML_RESOURCES
+    title = "Tapjacking Full Occlusion (XML)"
 
-    filterTouchesWhenObscured = r"filterTouchesWhenObscured=\"true\""
+    # Attribute looked for in layout resources
+    filterTouchesWhenObscured = "filterTouchesWhenObscured"
 
     def __init__(self, log):
         super().__init__(log)
 
     def mutate(self, resourcesHandler, commentMutations, allMutants):
         mutated = False 
-        result = "\n========== Tapjacking Full Occlusion (XML) ==========\n"
+        self.startReport()
 
         # Get resources
         resourceFiles = resourcesHandler.findResourceFiles()
         self.log.info("Found %d resources:", len(resourceFiles))
         for resourceFile in resourceFiles:
-            self.log.info("Resource: %s", resourceFile)
+            self.log.debug("Resource: %s", resourceFile)
 
-        # Find filter touches when obscured in resource files
-        candidateResourceFiles = resourcesHandler.matchResourceFiles([self.filterTouchesWhenObscured])
-        self.log.info("Found %d candidate resources:", len(candidateResourceFiles))
+        # Find filter touches when obscured attributes set to true in layout
+        # resources. Each attribute is a mutation site of its own
+        candidateResourceFiles = resourcesHandler.findAttributes("layout", resourcesHandler.getAttribName(self.filterTouchesWhenObscured), "true")
+        self.log.info("Found %d candidate sites:", len(candidateResourceFiles))
         for resourceFile in candidateResourceFiles:
-            self.log.info("Candidate resource: %s", resourceFile["file"])
+            self.log.info("Candidate site: %s at offset %d", resourceFile["file"], resourceFile["start"])
 
         if len(candidateResourceFiles) != 0:
             mutated = True 
@@ -34,52 +35,49 @@ class TapjackingFullOcclusion(Operator):
             if not allMutants:
                 # Pick a pseudorandom candidate resource file
                 self.log.info("Picking a pseudorandom candidate resource...")
-                index = randrange(0, len(candidateResourceFiles))
-                resultLine = "Picked resource: " + candidateResourceFiles[index]["file"]
-                resultLine += "\n- filterTouchesWhenObscured pattern: " + candidateResourceFiles[index]["pattern"]
-                resultLine += "\n"
-                result += resultLine
-                self.log.info(resultLine)
-                candidateResourceFiles = [candidateResourceFiles[index]]
+                candidate = self.pickCandidate(candidateResourceFiles)
+                self.log.info("Picked resource: %s", candidate["file"])
+                candidateResourceFiles = [candidate]
 
             for candidate in candidateResourceFiles:
                 # Mutate source file
                 self.log.info("Mutating resource...")
-                self.log.info("Resource is:")
                 resource = resourcesHandler.readResourceFile(candidate["file"])
-                self.log.info(resource)
-                match = re.search(candidate["pattern"], resource)
-                excerpt = resource[match.start():match.end()]
+                self.logDump("Resource is:", lambda: resource)
+                excerpt = resource[candidate["start"]:candidate["end"]]
+                mutantId = self.getMutantId(resourcesHandler, candidate["file"], (candidate["start"], candidate["end"]), self.getContentHash(resource)) if allMutants else None
                 mutatedExcerpt = excerpt.replace("true", "false")
-                resource = resource.replace(excerpt, mutatedExcerpt)
+                resourcesHandler.editResourceFile(candidate["file"], candidate["start"], candidate["end"], mutatedExcerpt)
 
-                # TODO improve, this is due to the current resources handler parsing limitation
-                resource = resource.replace("</application>", "<!--{}--></application>".format(self.getComment()))
+                # The comment goes right before the mutated element. Both edits
+                # are offsets into the resource as read, and are spliced together
+                if commentMutations:
+                    resourcesHandler.editResourceFile(candidate["file"], candidate["elementStart"], candidate["elementStart"], "<!--{}-->".format(self.getComment()))
 
-                resultLine = "\nExcerpt:\n"
-                resultLine += excerpt
-                if allMutants:
-                    resultLine += "\nMutant index is: {}".format(allMutantsIndex)
-                resultLine += "\nMutated excerpt:\n"
-                resultLine += mutatedExcerpt
-                result += resultLine + "\n"
-                self.log.info(resultLine)
+                self.reportMutant(
+                    "resource",
+                    candidate["file"],
+                    excerpt,
+                    mutatedExcerpt,
+                    span=(candidate["start"], candidate["end"]),
+                    mutantIndex=allMutantsIndex if allMutants else None,
+                    mutantId=mutantId,
+                    outputPath=resourcesHandler.getOutputPath(mutantId),
+                    skipped=allMutants and self.mutantExists(resourcesHandler, mutantId)
+                )
 
-                self.log.info("Mutated resource is:")
-                self.log.info(resource)
+                self.logDump("Mutated resource is:", lambda: resourcesHandler.readResourceFile(candidate["file"]))
 
-                # Write mutated resource to file
-                self.log.info("Writing mutated resource to file...")
-                if not allMutants:
-                    resourcesHandler.writeResourceFile(candidate["file"], resource)
-                else: 
-                    resourcesHandler.writeResourceFile(candidate["file"], resource, True, "{}".format(allMutantsIndex))
+                # Write mutated resource to a new copy. Otherwise, journaled edits
+                # are written once all operators have been applied
+                if allMutants:
+                    self.log.info("Writing mutated resource to file...")
+                    if self.writeMutant(resourcesHandler, mutantId):
+                        self.log.info("Successfully wrote resource to file")
                     allMutantsIndex += 1
-                self.log.info("Successfully wrote resource to file")
 
         if allMutants and mutated:
             resourcesHandler.removeDestinationPath()
 
-        result += "========== End of Tapjacking Full Occlusion (XML) ==========\n"
-        return result if mutated else None
+        return self.endReport(mutated)
     
\ No newline at end of file
@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+import cProfile
+import os
+from threading import Lock
+import time
+
+# Phases, in the order they are rendered. Phases are timed exclusively:
+# time spent in a nested phase (e.g. scanning while mutating) is only
+# accounted to the nested phase
+phases = ["index", "copy", "handlers", "scan", "mutate", "serialize", "write", "report", "cleanup"]
+
+# Operator that phases and counters outside of any operator belong to
+RUN = "(run)"
+
+# Per-process profile of a run: wall time, CPU time and number of calls of
+# each phase, and counters (bytes read and written, files copied, regex
+# evaluations...), per operator. Like loggers, there is one profile per
+# process, so that hot paths can be instrumented without handing it over
+# to every object. It is disabled by default, and then costs nothing
+# but a check. Worker processes hand their measurements over to the main
+# process as records of the report sink
+class RunProfile:
+
+    def __init__(self):
+        self.enabled = False
+        self.worker = False
+        self.outputPath = None
+        self.profiler = None
+        self.operator = RUN
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+        self.lock = Lock()
+
+    def enable(self, outputPath=None):
+        # With an output path, cProfile stats are also collected
+        self.enabled = True
+        self.outputPath = outputPath
+        if outputPath != None:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def setOperator(self, operator):
+        self.operator = operator if operator != None else RUN
+
+    @contextmanager
+    def measure(self, phase):
+        if not self.enabled:
+            yield
+            return
+        # Each frame holds the time spent in nested phases,
+        # which is subtracted from the time of the phase itself
+        frame = [0.0, 0.0]
+        self.stack.append(frame)
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wallStart
+            cpu = time.process_time() - cpuStart
+            self.stack.pop()
+            if len(self.stack) != 0:
+                self.stack[-1][0] += wall
+                self.stack[-1][1] += cpu
+            entry = self.phases.setdefault(self.operator, {}).setdefault(phase, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            entry["wall"] += wall - frame[0]
+            entry["cpu"] += cpu - frame[1]
+            entry["calls"] += 1
+
+    def count(self, counter, amount=1):
+        # Counters are incremented by the threads of concurrent scans too
+        if not self.enabled:
+            return
+        with self.lock:
+            counters = self.counters.setdefault(self.operator, {})
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def toRecords(self):
+        records = []
+        for operator in sorted(set(self.phases) | set(self.counters)):
+            records.append({
+                "event": "profile",
+                "operator": operator,
+                "pid": os.getpid(),
+                "phases": self.phases.get(operator, {}),
+                "counters": self.counters.get(operator, {})
+            })
+        return records
+
+    def flush(self, reportSink):
+        # Measurements are streamed to the report sink and reset. Worker
+        # processes also dump their cProfile stats so far, next to the
+        # output path with a suffix of their own
+        if not self.enabled:
+            return
+        for record in self.toRecords():
+            reportSink.emit(record)
+        self.phases = {}
+        self.counters = {}
+        if self.worker and self.profiler != None:
+            self.profiler.dump_stats("{}.{}".format(self.outputPath, os.getpid()))
+
+    def close(self):
+        # cProfile stats are dumped in pstats format, which flame graph
+        # tools (e.g. flameprof) and viewers (e.g. snakeviz) convert
+        if self.profiler != None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.outputPath)
+            self.profiler = None
+
+profile = RunProfile()
+
+def getProfile():
+    return profile
+
+def initializeWorker(enabled, outputPath):
+    # Worker processes started by fork inherit the profile of the main
+    # process, including measurements and the active profiler. Workers
+    # start from a clean profile instead
+    global profile
+    if profile.profiler != None:
+        profile.profiler.disable()
+    profile = RunProfile()
+    profile.worker = True
+    if enabled:
+        profile.enable(outputPath)
+
+def renderProfile(reportSink):
+    # Human-readable profile of the run, aggregated over the profile
+    # records of all processes: phases and counters per operator,
+    # then phases and counters of the whole run
+    operators = {}
+    for record in reportSink.readRecords():
+        if record["event"] != "profile":
+            continue
+        entry = operators.setdefault(record["operator"], {"phases": {}, "counters": {}})
+        for phase, measurement in record["phases"].items():
+            total = entry["phases"].setdefault(phase, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            for key in total:
+                total[key] += measurement[key]
+        for counter, value in record["counters"].items():
+            entry["counters"][counter] = entry["counters"].get(counter, 0) + value
+
+    totals = {"phases": {}, "counters": {}}
+    for entry in operators.values():
+        for phase, measurement in entry["phases"].items():
+            total = totals["phases"].setdefault(phase, {"wall": 0.0, "cpu": 0.0, "calls": 0})
+            for key in total:
+                total[key] += measurement[key]
+        for counter, value in entry["counters"].items():
+            totals["counters"][counter] = totals["counters"].get(counter, 0) + value
+
+    text = ""
+    for operator, entry in sorted(operators.items()) + [("Total", totals)]:
+        text += "\n{}:\n".format(operator)
+        for phase in phases:
+            if phase in entry["phases"]:
+                measurement = entry["phases"][phase]
+                text += "- {:<10} {:>10.3f} s wall {:>10.3f} s CPU {:>8} calls\n".format(phase, measurement["wall"], measurement["cpu"], measurement["calls"])
+        for counter, value in sorted(entry["counters"].items()):
+            text += "- {}: {}\n".format(counter, value)
+    return text
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+
+# Streaming sink for the machine-readable mutation report. Each record is
+# appended to a JSON Lines file as soon as it is produced, so that memory
+# does not grow with the number of mutants and progress is visible while
+# the run goes on. The human-readable report is rendered from the records
+class ReportSink:
+
+    def __init__(self, path=None):
+        # Without a path, records are written to a temporary
+        # file, which is removed when the sink is closed
+        self.temporary = path == None
+        if self.temporary:
+            descriptor, path = tempfile.mkstemp(prefix="seed-vulns-", suffix=".jsonl")
+            os.close(descriptor)
+        else:
+            open(path, "w").close()
+        self.path = path
+        self.descriptor = None
+
+    # File descriptors cannot be pickled, which is needed to hand the
+    # sink over to worker processes. Workers reopen the file on demand
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["descriptor"] = None
+        return state
+
+    def emit(self, record):
+        if self.descriptor == None:
+            self.descriptor = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        # Each record is appended with a single write, so that records
+        # emitted by concurrent worker processes do not interleave
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        while len(line) != 0:
+            line = line[os.write(self.descriptor, line):]
+
+    def readRecords(self, operator=None):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if operator == None or record["operator"] == operator:
+                    yield record
+
+    def close(self):
+        if self.descriptor != None:
+            os.close(self.descriptor)
+            self.descriptor = None
+        if self.temporary:
+            os.remove(self.path)
+
+def renderMutant(record):
+    text = ""
+    # Mutants of a span of a file are introduced by the file. Otherwise,
+    # the excerpt itself describes the mutated element
+    if record["span"] != None:
+        text += "\n{}: {}".format(record["kind"].capitalize(), record["file"])
+    if record["pattern"] != None:
+        text += "\n- Pattern: {}".format(record["pattern"])
+    text += "\nExcerpt:\n{}".format(record["excerpt"])
+    if record["mutantIndex"] != None:
+        text += "\nMutant index is: {}".format(record["mutantIndex"])
+    if record["mutantId"] != None:
+        text += "\nMutant ID is: {}{}".format(record["mutantId"], " (already exists, skipped)" if record["skipped"] else "")
+    text += "\nMutated excerpt:\n{}\n".format(record["mutatedExcerpt"])
+    return text
+
+def renderOperator(sink, operator):
+    # Human-readable section of the report for a single operator, or None
+    # if the operator did not mutate the app
+    section = None
+    for record in sink.readRecords(operator.name.value):
+        if record["event"] != "mutant":
+            continue
+        if section == None:
+            section = "\n========== {} ==========\n".format(operator.title)
+        section += renderMutant(record)
+    if section != None:
+        section += "========== End of {} ==========\n".format(operator.title)
+    return section
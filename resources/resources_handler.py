@@ -1,77 +1,256 @@
 from enum import Enum
+from io import BytesIO
 import os
 import re
-from shutil import copytree, rmtree
+from shutil import rmtree
+from lxml import etree as ET
+from corpus.corpus_cache import CorpusCache
+from materialization.tree_materializer import TreeMaterializer
+from mutation.edit_journal import EditJournal
+from profiling.run_profile import getProfile
+from scanning.concurrent_scan import mapFiles
+from scanning.project_index import ProjectIndex
+from scanning.scan_engine import ScanEngine
 
 # For now, only XML resource files are supported.
 class ResourceFileExtension(Enum):
     XML = 0
 
-# TODO improve this to actually parse XML resource files.
-# Since the first version of this tool contains only a single 
-# operator that mutates resource files, this class takes the
-# dumb approach of just matching patterns in the resource 
-# files instead of actually parsing them.
+# Resource files can either be matched against patterns, or parsed into
+# an index of their attributes. The index is built per resource type, from
+# the files in res/<type>[-<qualifiers>] folders only (e.g. layout and
+# layout-land for layouts), and holds the span of each attribute in the
+# raw file, so that operators edit attributes without rewriting the file
 class ResourcesHandler:
 
     resourceFiles = None
+    androidNamespace = "http://schemas.android.com/apk/res/android"
+
+    # Start tag: its name, then any number of attributes (whose quoted
+    # values may hold ">") up to the closing ">" or "/>"
+    startTagRegex = re.compile(r"<([^\s/>!?]+)(?:[^\"'>]|\"[^\"]*\"|'[^']*')*>")
 
     resourceFileExtensions = {
         ResourceFileExtension.XML: ".xml"
     }
 
-    def __init__(self, destinationPath):
+    def __init__(self, destinationPath, materializer=None, corpusCache=None, scanEngine=None, scanThreads=1, projectIndex=None):
         self.destinationPath = destinationPath
+        self.materializer = materializer if materializer != None else TreeMaterializer()
+        self.corpusCache = corpusCache if corpusCache != None else CorpusCache()
+        self.scanEngine = scanEngine if scanEngine != None else ScanEngine()
+        self.scanThreads = scanThreads
+        self.projectIndex = projectIndex if projectIndex != None else ProjectIndex(destinationPath, scanThreads)
+        self.journal = EditJournal()
+        self.attributeIndex = {}
         self.findResourceFiles()
 
     def removeDestinationPath(self):
         rmtree(self.destinationPath, ignore_errors=True)
 
+    def getOutputPath(self, copy_index=None):
+        # Mutants written to a new copy are output wherever the materializer
+        # puts that copy. Otherwise, the destination path itself is mutated
+        if copy_index == None:
+            return self.destinationPath
+        return self.materializer.getOutputPath("{}_{}".format(self.destinationPath, copy_index))
+
     def writeResourceFile(self, file, content, to_new_copy=False, copy_index=None):
-        # If to_new_copy is True, create a backup of the destination path
-        destinationPathBackup = None
-        if to_new_copy:
-            destinationPathBackup = "{}_backup".format(self.destinationPath)
-            copytree(self.destinationPath, destinationPathBackup)
-        
-        # Write content to manifest file
-        with open(file, "w") as f:
-            f.write(content)
-
-        # If to_new_copy is True, move the destination path to a new directory
-        # named after the copy index, restore the backup to the original destination
+        self.writeResourceFiles({file: content}, to_new_copy, copy_index)
+
+    def writeResourceFiles(self, contents, to_new_copy=False, copy_index=None):
+        # If to_new_copy is True, materialize a new copy of the destination path
+        # named after the copy index, and write contents to the files in that 
+        # copy only. The destination path itself is left untouched
         if to_new_copy:
             newDestinationPath = "{}_{}".format(self.destinationPath, copy_index)
-            rmtree(newDestinationPath, ignore_errors=True)
-            os.rename(self.destinationPath, newDestinationPath)
-            os.rename(destinationPathBackup, self.destinationPath)
+            self.materializer.materializeMutant(self.destinationPath, newDestinationPath, contents)
+            return
+
+        # Write contents to files
+        for file, content in contents.items():
+            self.materializer.writeFile(file, content)
+            self.corpusCache.invalidate(self.destinationPath, file)
+
+    def writeEdits(self, to_new_copy=False, copy_index=None):
+        # Write each edited file once, with all of its journaled edits
+        contents = self.journal.getContents()
+        self.journal.clear()
+        if len(contents) != 0:
+            self.writeResourceFiles(contents, to_new_copy, copy_index)
+
+    def discardEdits(self):
+        self.journal.clear()
+
+    def getEdits(self):
+        # Content of each edited file, with its journaled edits, which are
+        # neither written nor discarded
+        return self.journal.getContents()
 
     def readResourceFile(self, file):
-        with open(file, "r") as f:
-            return f.read()
+        # Journaled edits that have not been written yet are visible to reads
+        if self.journal.hasEdits(file):
+            return self.journal.getContent(file)
+        return self.corpusCache.read(self.destinationPath, file)
+
+    def editResourceFile(self, file, start, end, replacement):
+        # Spans are offsets into the file as last read. Edited files are not
+        # read again, which would splice their pending edits one at a time
+        content = self.readResourceFile(file) if not self.journal.hasEdits(file) else None
+        self.journal.addEdit(file, content, start, end, replacement)
+
+    def scanResourceFile(self, file):
+        # Files with journaled edits are scanned as edited
+        if self.journal.hasEdits(file):
+            return self.scanEngine.scanContent(self.journal.getContent(file))
+        return self.scanEngine.scan(self.destinationPath, file, self.readResourceFile)
 
     def matchResourceFiles(self, patterns):
         matches = []
         if self.resourceFiles != None:
-            for file in self.resourceFiles:
-                with open(file, "r") as f:
-                    source = f.read()
-                    for pattern in patterns:
-                        if re.search(pattern, source):
-                            matches.append({"file": file, "pattern": pattern})
+            # Patterns of operators that were not queued in advance
+            # are added to the scan engine on demand
+            self.scanEngine.registerPatterns(patterns)
+            with getProfile().measure("scan"):
+                found = mapFiles(self.scanResourceFile, self.resourceFiles, self.scanThreads)
+            for file, fileFound in zip(self.resourceFiles, found):
+                for pattern in patterns:
+                    if pattern in fileFound:
+                        matches.append({"file": file, "pattern": pattern})
         return matches
 
     def findResourceFiles(self):
         # Check if resource files have already been found
         if self.resourceFiles == None:
             self.resourceFiles = []
-            # Look for resource files in the destination path and
-            # add them to the resourceFiles list
-            for root, _, files in os.walk(self.destinationPath):
-                for file in files:
-                    for extension in self.resourceFileExtensions.values():
-                        # Need to filter out the manifest file here 
-                        if file.endswith(extension) and not file.startswith("AndroidManifest"):
-                            self.resourceFiles.append(os.path.join(root, file))
-                            break
+            # Look for resource files among the indexed files of the
+            # destination path and add them to the resourceFiles list
+            for file in self.projectIndex.findFiles(self.destinationPath, self.resourceFileExtensions.values()):
+                # Need to filter out the manifest file here 
+                if not os.path.basename(file).startswith("AndroidManifest"):
+                    self.resourceFiles.append(file)
         return self.resourceFiles
+
+    def getAttribName(self, name):
+        return "{" + self.androidNamespace + "}" + name
+
+    def getResourceFolder(self, file):
+        # Resource folder (e.g. layout-land) of files in a res folder,
+        # None for any other file. Build output is not indexed
+        relativeParts = os.path.relpath(file, self.destinationPath).split(os.sep)
+        if len(relativeParts) < 3 or relativeParts[-3] != "res" or "build" in relativeParts:
+            return None
+        return relativeParts[-2]
+
+    def findResourceFilesOfType(self, resourceType):
+        files = []
+        for file in self.findResourceFiles():
+            folder = self.getResourceFolder(file)
+            if folder != None and folder.split("-")[0] == resourceType:
+                files.append(file)
+        return files
+
+    def findStartTags(self, content):
+        # Spans of the start tags of the raw file, in document order, as
+        # (start, end, name). Comments, CDATA sections, processing
+        # instructions, declarations and end tags are skipped, and ">"
+        # within quoted attribute values does not end a tag
+        position = content.find("<")
+        while position != -1:
+            if content.startswith("<!--", position):
+                end = content.find("-->", position + 4)
+                end = end + 3 if end != -1 else len(content)
+            elif content.startswith("<![CDATA[", position):
+                end = content.find("]]>", position + 9)
+                end = end + 3 if end != -1 else len(content)
+            elif content.startswith("<?", position):
+                end = content.find("?>", position + 2)
+                end = end + 2 if end != -1 else len(content)
+            elif content.startswith("<!", position) or content.startswith("</", position):
+                # Declarations with an internal subset end with "]>"
+                end = content.find(">", position)
+                subset = content.find("[", position, end)
+                if content.startswith("<!DOCTYPE", position) and subset != -1:
+                    end = content.find("]>", subset)
+                    end = end + 1 if end != -1 else -1
+                end = end + 1 if end != -1 else len(content)
+            else:
+                match = self.startTagRegex.match(content, position)
+                if match == None:
+                    end = position + 1
+                else:
+                    end = match.end()
+                    yield position, end, match.group(1)
+            position = content.find("<", end)
+
+    def indexResourceFile(self, file, content):
+        # Attributes of every element of the file. Elements are parsed as
+        # a stream and cleared once indexed, so that large files are never
+        # held in memory as a whole tree
+        entries = []
+        attributeRegexes = {}
+        startTags = self.findStartTags(content)
+        try:
+            for event, element in ET.iterparse(BytesIO(content.encode("utf-8")), events=("start", "end")):
+                if event == "end":
+                    element.clear()
+                    continue
+                if not isinstance(element.tag, str):
+                    continue
+
+                # Elements come in document order, hence each one is the next
+                # start tag of the raw file. Attributes are only looked up
+                # within that start tag, which may span several lines
+                localName = ET.QName(element).localname
+                tag = element.prefix + ":" + localName if element.prefix else localName
+                elementStart, elementEnd, tagName = next(startTags, (-1, -1, None))
+                if tagName != tag:
+                    # The raw file does not match the parsed one (e.g. tags
+                    # expanded from entities), hence nothing more is indexed
+                    break
+                prefixes = {uri: prefix for prefix, uri in element.nsmap.items()}
+                for attrib, value in element.attrib.items():
+                    qualifiedName = ET.QName(attrib)
+                    name = qualifiedName.localname
+                    if qualifiedName.namespace != None:
+                        name = prefixes.get(qualifiedName.namespace, "") + ":" + name
+                    if name not in attributeRegexes:
+                        attributeRegexes[name] = re.compile(r"(?<![\w:.-]){}\s*=\s*(\"[^\"]*\"|'[^']*')".format(re.escape(name)))
+                    match = attributeRegexes[name].search(content, elementStart, elementEnd)
+                    if match == None:
+                        continue
+                    entries.append({
+                        "file": file,
+                        "element": localName,
+                        "attribute": attrib,
+                        "value": value,
+                        "elementStart": elementStart,
+                        "start": match.start(),
+                        "end": match.end()
+                    })
+        except ET.XMLSyntaxError:
+            # Files that are not well-formed are not indexed
+            return []
+        return entries
+
+    def getAttributeIndex(self, resourceType):
+        # Files are parsed again only if their content has changed since
+        # they were indexed, e.g. by journaled edits
+        index = self.attributeIndex.setdefault(resourceType, {})
+        with getProfile().measure("scan"):
+            for file in self.findResourceFilesOfType(resourceType):
+                content = self.readResourceFile(file)
+                if file not in index or index[file]["content"] != content:
+                    index[file] = {"content": content, "entries": self.indexResourceFile(file, content)}
+        return index
+
+    def findAttributes(self, resourceType, attrib, value=None):
+        # Attributes named attrib (with value, if given) in resource files of
+        # the given type, in file order. Each one is returned with its resource
+        # folder, file, element and the span of the attribute in the file
+        attributes = []
+        for file, indexed in self.getAttributeIndex(resourceType).items():
+            for entry in indexed["entries"]:
+                if entry["attribute"] == attrib and (value == None or entry["value"] == value):
+                    attributes.append(dict(entry, folder=self.getResourceFolder(file)))
+        return attributes
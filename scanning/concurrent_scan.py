@@ -0,0 +1,74 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import os
+
+def listDirectory(directory):
+    # Same classification as os.walk: symlinks to directories are
+    # not walked into, and unreadable directories are skipped
+    files = []
+    directories = []
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    isDirectory = entry.is_dir()
+                except OSError:
+                    isDirectory = False
+                if not isDirectory:
+                    files.append(entry.name)
+                elif not entry.is_symlink():
+                    directories.append(entry.path)
+    except OSError:
+        pass
+    # Entries are sorted, so that walks are in the same order
+    # regardless of the filesystem the app is on
+    files.sort()
+    directories.sort()
+    return files, directories
+
+def walkFiles(root, threads=1, skipDirectory=None):
+    # Serial walks are plain top-down os.walk walks, which callers may
+    # stop early. Directories are walked into in sorted order, unless
+    # skipDirectory returns True for their path
+    if threads <= 1:
+        for directory, directories, files in os.walk(root):
+            directories.sort()
+            if skipDirectory != None:
+                directories[:] = [
+                    subdirectory for subdirectory in directories
+                    if not skipDirectory(os.path.join(directory, subdirectory))
+                ]
+            for file in sorted(files):
+                yield directory, file
+        return
+
+    # Directories are listed by a bounded pool of threads as soon as
+    # they are discovered. Files are then yielded in the same order
+    # as a serial walk, so that results are stable
+    listings = {}
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        pending = {executor.submit(listDirectory, root): root}
+        while len(pending) != 0:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                directory = pending.pop(future)
+                files, directories = future.result()
+                if skipDirectory != None:
+                    directories = [subdirectory for subdirectory in directories if not skipDirectory(subdirectory)]
+                listings[directory] = files, directories
+                for subdirectory in listings[directory][1]:
+                    pending[executor.submit(listDirectory, subdirectory)] = subdirectory
+
+    stack = [root]
+    while len(stack) != 0:
+        directory = stack.pop()
+        files, directories = listings[directory]
+        for file in files:
+            yield directory, file
+        stack.extend(reversed(directories))
+
+def mapFiles(function, files, threads=1):
+    # Results are returned in the order of the files
+    if threads <= 1:
+        return [function(file) for file in files]
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(function, files))
@@ -0,0 +1,168 @@
+from fnmatch import fnmatchcase
+import os
+import re
+from scanning.concurrent_scan import walkFiles
+
+# Directories that never hold sources or resources of the app itself:
+# Gradle caches, VCS metadata and JavaScript dependencies. Patterns
+# ending with a slash only match directories
+defaultExcludes = [".gradle/", ".git/", "node_modules/"]
+
+# Build output directories are also skipped, but only at the root of a
+# module, i.e. next to its src directory or a Gradle file, since source
+# packages may be named build too (e.g. com/example/build)
+buildOutputDirectory = "build"
+moduleMarkers = ["src", "build.gradle", "build.gradle.kts", "settings.gradle", "settings.gradle.kts"]
+
+def translateGitignorePattern(pattern):
+    # Regex for a .gitignore glob: "*" and "?" do not match slashes,
+    # "**" matches any number of directories
+    regex = ""
+    index = 0
+    while index < len(pattern):
+        character = pattern[index]
+        if pattern.startswith("**/", index):
+            regex += "(?:.*/)?"
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            regex += ".*"
+            index += 2
+            continue
+        if character == "*":
+            regex += "[^/]*"
+        elif character == "?":
+            regex += "[^/]"
+        elif character == "[" and pattern.find("]", index + 1) != -1:
+            end = pattern.find("]", index + 1)
+            characters = pattern[index + 1:end]
+            if characters.startswith("!"):
+                characters = "^" + characters[1:]
+            regex += "[" + characters.replace("\\", "\\\\") + "]"
+            index = end
+        elif character == "\\" and index + 1 < len(pattern):
+            index += 1
+            regex += re.escape(pattern[index])
+        else:
+            regex += re.escape(character)
+        index += 1
+    return regex
+
+# Rules of the .gitignore files of a project, read lazily per directory
+# as the walk reaches it. Global and .git/info/exclude rules are not read
+class GitignoreRules:
+
+    def __init__(self, root):
+        self.root = root
+        self.rules = {}
+
+    def parseRules(self, content):
+        rules = []
+        for line in content.splitlines():
+            line = line.rstrip()
+            if len(line) == 0 or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            directoryOnly = line.endswith("/")
+            line = line.rstrip("/")
+            # Patterns with a slash other than a trailing one are relative to
+            # the directory of the .gitignore file, others match at any depth
+            anchored = "/" in line
+            regex = translateGitignorePattern(line.lstrip("/"))
+            if not anchored:
+                regex = "(?:.*/)?" + regex
+            rules.append((re.compile(regex + "$"), negated, directoryOnly))
+        return rules
+
+    def getRules(self, relativeDirectory):
+        if relativeDirectory not in self.rules:
+            try:
+                with open(os.path.join(self.root, relativeDirectory, ".gitignore"), "r", encoding="utf-8", errors="replace") as f:
+                    self.rules[relativeDirectory] = self.parseRules(f.read())
+            except OSError:
+                self.rules[relativeDirectory] = []
+        return self.rules[relativeDirectory]
+
+    def isIgnored(self, relativePath, isDirectory):
+        # Rules of deeper .gitignore files, and later rules of the
+        # same file, take precedence. Paths are slash separated
+        parts = relativePath.split("/")
+        ignored = False
+        for depth in range(len(parts)):
+            rest = "/".join(parts[depth:])
+            for regex, negated, directoryOnly in self.getRules("/".join(parts[:depth])):
+                if directoryOnly and not isDirectory:
+                    continue
+                if regex.match(rest):
+                    ignored = not negated
+        return ignored
+
+# Files of an app, found by a single walk of its directory tree that all
+# handlers share instead of walking the tree themselves. Excluded
+# directories are not walked into at all. Files are kept relative to the
+# root, so that the index of the source path also lists the files of
+# each copy of it. Include globs only restrict the sources and resources
+# looked up, since the manifest is needed whatever files are mutated
+class ProjectIndex:
+
+    def __init__(self, root, scanThreads=1, include=None, exclude=None, gitignore=False):
+        self.root = root
+        self.include = include if include != None else []
+        self.exclude = defaultExcludes + (exclude if exclude != None else [])
+        self.gitignore = GitignoreRules(root) if gitignore else None
+        self.files = []
+        self.buildIndex(scanThreads)
+
+    def getRelativePath(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def matchesGlob(self, relativePath, isDirectory, patterns):
+        # Globs match either the name or the whole relative path
+        name = relativePath.rsplit("/", 1)[-1]
+        for pattern in patterns:
+            if pattern.endswith("/"):
+                if not isDirectory:
+                    continue
+                pattern = pattern.rstrip("/")
+            if fnmatchcase(name, pattern) or fnmatchcase(relativePath, pattern):
+                return True
+        return False
+
+    def isExcluded(self, relativePath, isDirectory):
+        if self.matchesGlob(relativePath, isDirectory, self.exclude):
+            return True
+        return self.gitignore != None and self.gitignore.isIgnored(relativePath, isDirectory)
+
+    def isBuildOutput(self, directory):
+        if os.path.basename(directory) != buildOutputDirectory:
+            return False
+        module = os.path.dirname(directory)
+        return any(os.path.exists(os.path.join(module, marker)) for marker in moduleMarkers)
+
+    def skipDirectory(self, directory):
+        return self.isBuildOutput(directory) or self.isExcluded(self.getRelativePath(directory), True)
+
+    def buildIndex(self, scanThreads):
+        for root, file in walkFiles(self.root, scanThreads, self.skipDirectory):
+            relativePath = self.getRelativePath(os.path.join(root, file))
+            if self.isExcluded(relativePath, False):
+                continue
+            self.files.append(relativePath)
+
+    def findFiles(self, destinationPath, extensions=None, name=None):
+        # Indexed files with one of the extensions, or the given name,
+        # as paths in the destination path, in walk order. Files looked
+        # up by extension must also match the include globs, if any
+        found = []
+        for relativePath in self.files:
+            fileName = relativePath.rsplit("/", 1)[-1]
+            if name != None and fileName != name:
+                continue
+            if extensions != None and not fileName.endswith(tuple(extensions)):
+                continue
+            if extensions != None and len(self.include) != 0 and not self.matchesGlob(relativePath, False, self.include):
+                continue
+            found.append(os.path.join(destinationPath, *relativePath.split("/")))
+        return found
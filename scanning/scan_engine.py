@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+import mmap
+import os
+import re
+from threading import Lock
+from profiling.run_profile import getProfile
+
+# The regex parser is internal to the re module. It is only used to find
+# literal anchors in patterns, and patterns without anchors still work
+try:
+    from re import _parser as regexParser
+except ImportError:
+    import sre_parse as regexParser
+
+# Anchors shorter than this filter out too little to be worth it
+MINIMUM_ANCHOR_LENGTH = 3
+
+# Top-level items of a parsed pattern that end a run of literals. An
+# anchor is only looked for in patterns made of literals and of these
+# items: patterns with any other item (e.g. of a newer parser) have none,
+# since a wrong anchor would silently drop real matches
+ANCHOR_SEPARATORS = {
+    getattr(regexParser, name) for name in [
+        "ANY", "AT", "IN", "NOT_LITERAL", "CATEGORY", "BRANCH", "SUBPATTERN",
+        "MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT", "ATOMIC_GROUP",
+        "ASSERT", "ASSERT_NOT", "GROUPREF", "GROUPREF_EXISTS"
+    ] if hasattr(regexParser, name)
+}
+
+# Files at least this large are scanned straight from a memory mapping
+MMAP_THRESHOLD = 1024 * 1024
+
+# Scan engine shared by all handlers of a run. It holds the union of the
+# patterns of every queued operator and scans each file for all of them
+# at once: a single pass over the file looks for the literal anchors of
+# every pattern, and only patterns whose anchor was found are evaluated.
+# Results are memoized per file (keyed like the corpus cache), so files
+# are scanned once no matter how many operators ask for them. Results
+# may also be kept across runs in a persistent scan index.
+# Large files (e.g. generated sources and merged resources) are scanned as
+# bytes from a read-only memory mapping instead, so that they are neither
+# read into memory nor decoded unless an operator needs their content.
+# Patterns are then matched as bytes, i.e. with ASCII semantics for
+# classes such as \b and \s, which is all operators' patterns rely on.
+# Only scanning is bounded this way: operators decode the whole of each
+# candidate file they mutate, since sites are located by tokenizing the
+# whole text and mutants are written as whole files. Peak memory thus
+# scales with the largest candidate file, not with the largest file
+class ScanEngine:
+
+    def __init__(self, index=None, mmapThreshold=MMAP_THRESHOLD):
+        self.index = index
+        self.mmapThreshold = mmapThreshold
+        self.patterns = {}
+        self.anchors = set()
+        self.anchorRegex = None
+        self.anchorBytesRegex = None
+        self.bytesSupported = True
+        self.results = {}
+        self.evaluations = 0
+        self.lock = Lock()
+
+    # Locks cannot be pickled, which is needed to hand the engine over
+    # to worker processes
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def getAnchor(self, regex):
+        # The anchor of a pattern is its longest run of top-level literal
+        # characters, which must appear in any text the pattern matches.
+        # Case-insensitive patterns (including through inline flags, which
+        # are part of the flags of the compiled pattern) have none
+        if regex.flags & re.IGNORECASE or not isinstance(regex.pattern, str):
+            return None
+        try:
+            items = regexParser.parse(regex.pattern, regex.flags)
+        except Exception:
+            return None
+
+        anchor = ""
+        run = ""
+        for op, av in items:
+            if op == regexParser.LITERAL:
+                run += chr(av)
+                continue
+            if op not in ANCHOR_SEPARATORS:
+                return None
+            if len(run) > len(anchor):
+                anchor = run
+            run = ""
+        if len(run) > len(anchor):
+            anchor = run
+
+        return anchor if len(anchor) >= MINIMUM_ANCHOR_LENGTH else None
+
+    def registerPatterns(self, patterns):
+        registered = False
+        for pattern in patterns:
+            if pattern not in self.patterns:
+                regex = re.compile(pattern)
+                self.patterns[pattern] = {"regex": regex, "bytesRegex": self.compileBytes(pattern), "anchor": self.getAnchor(regex)}
+                registered = True
+
+        if registered:
+            self.anchors = {entry["anchor"] for entry in self.patterns.values() if entry["anchor"] != None}
+            # Longest anchors first, so that an anchor is preferred over its prefixes
+            anchors = sorted(self.anchors, key=len, reverse=True)
+            self.anchorRegex = re.compile("|".join(re.escape(anchor) for anchor in anchors)) if len(anchors) != 0 else None
+            self.anchorBytesRegex = re.compile(b"|".join(re.escape(anchor.encode("utf-8")) for anchor in anchors)) if len(anchors) != 0 else None
+            self.bytesSupported = all(entry["bytesRegex"] != None for entry in self.patterns.values())
+            # Memoized results do not cover the newly registered patterns
+            self.results = {}
+
+    def compileBytes(self, pattern):
+        # Patterns that cannot be matched as bytes (e.g. with non-ASCII
+        # escapes) disable scanning from memory mappings
+        try:
+            return re.compile(pattern.encode("utf-8"))
+        except (re.error, UnicodeEncodeError):
+            return None
+
+    def findAnchors(self, content):
+        # Content is either text, or the bytes of a memory mapping
+        binary = not isinstance(content, str)
+        anchorRegex = self.anchorBytesRegex if binary else self.anchorRegex
+        found = set()
+        if anchorRegex == None:
+            return found
+
+        for match in anchorRegex.finditer(content):
+            found.add(match.group().decode("utf-8") if binary else match.group())
+            if len(found) == len(self.anchors):
+                return found
+
+        # Matches do not overlap, so an anchor may have been skipped for
+        # overlapping another one. Only possible if something was found
+        if len(found) != 0:
+            for anchor in self.anchors - found:
+                if content.find(anchor.encode("utf-8") if binary else anchor) != -1:
+                    found.add(anchor)
+        return found
+
+    def scanContent(self, content, patterns=None):
+        # All registered patterns are evaluated, unless given a subset of them
+        regexKey = "regex" if isinstance(content, str) else "bytesRegex"
+        anchors = self.findAnchors(content)
+        matches = set()
+        evaluations = 0
+        for pattern in self.patterns if patterns == None else patterns:
+            entry = self.patterns[pattern]
+            if entry["anchor"] == None or entry["anchor"] in anchors:
+                evaluations += 1
+                if entry[regexKey].search(content):
+                    matches.add(pattern)
+        with self.lock:
+            self.evaluations += evaluations
+        getProfile().count("regexEvaluations", evaluations)
+        return matches
+
+    def scan(self, root, file, readFile):
+        key = os.path.relpath(file, root)
+        fileStat = os.stat(file)
+
+        result = self.results.get(key)
+        if result != None and result["size"] == fileStat.st_size and result["mtime"] == fileStat.st_mtime_ns:
+            return result["matches"]
+
+        if self.index == None:
+            with self.openContent(file, fileStat, readFile) as content:
+                matches = self.scanContent(content)
+        else:
+            matches = self.scanIndexed(os.path.abspath(root), key, fileStat, file, readFile)
+        self.results[key] = {
+            "size": fileStat.st_size,
+            "mtime": fileStat.st_mtime_ns,
+            "matches": matches
+        }
+        return matches
+
+    @contextmanager
+    def openContent(self, file, fileStat, readFile):
+        # Large files are mapped rather than read. Other files are read as
+        # text through the handler, and thus through the corpus cache
+        if not self.bytesSupported or self.mmapThreshold == None or fileStat.st_size < self.mmapThreshold:
+            yield readFile(file)
+            return
+        with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            profile = getProfile()
+            profile.count("filesMapped")
+            profile.count("bytesMapped", fileStat.st_size)
+            yield mapping
+
+    def scanIndexed(self, root, key, fileStat, file, readFile):
+        # Unchanged files are looked up by app, path, size and modification
+        # time, without reading them. Otherwise, they are looked up by content hash
+        contentHash = self.index.lookupFile(root, key, fileStat)
+        known = None
+        if contentHash != None:
+            known = self.index.lookupMatches(contentHash, self.patterns)
+            if len(known) == len(self.patterns):
+                return {pattern for pattern, matched in known.items() if matched}
+
+        with self.openContent(file, fileStat, readFile) as content:
+            if known == None:
+                contentHash = self.index.getContentHash(content)
+                known = self.index.lookupMatches(contentHash, self.patterns)
+
+            # Only patterns the content has not been scanned for yet are evaluated.
+            # Files read for the first time are stored even if all are known
+            unknown = [pattern for pattern in self.patterns if pattern not in known]
+            found = self.scanContent(content, unknown) if len(unknown) != 0 else set()
+        results = {pattern: pattern in found for pattern in unknown}
+        self.index.store(root, key, fileStat, contentHash, results)
+        known.update(results)
+
+        return {pattern for pattern, matched in known.items() if matched}
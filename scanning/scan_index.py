@@ -0,0 +1,116 @@
+from hashlib import sha256
+import sqlite3
+from threading import Lock
+
+# Text is hashed as UTF-8 a chunk at a time, which gives the same hash as
+# encoding it as a whole, without holding an encoded copy of large files
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def hashText(content):
+    digest = sha256()
+    for start in range(0, len(content), HASH_CHUNK_SIZE):
+        digest.update(content[start:start + HASH_CHUNK_SIZE].encode("utf-8"))
+    return digest.hexdigest()
+
+# Persistent index of scan results, kept in a SQLite file across runs. It
+# maps the hash of the content of a file to whether each pattern matches
+# it, so that files whose content has not changed are not scanned again
+# for patterns they have already been scanned for. Files are also mapped
+# to the hash of their content by app (its absolute root), path (relative
+# to the app), size and modification time, so that unchanged files need
+# not even be read. The app is part of the key since apps of a batch may
+# hold files at the same path with the same size and modification time
+# (e.g. extracted from archives) but different content
+class ScanIndex:
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = None
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Connections and locks cannot be pickled, which is needed to hand the
+    # index over to worker processes. Each process opens its own connection
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["connection"] = None
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
+    def getConnection(self):
+        if self.connection == None:
+            # Threads of a concurrent scan share the connection under the lock.
+            # Worker processes wait on each other's writes, up to the timeout
+            self.connection = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            # Files of indexes written before apps were part of the key
+            # are dropped. Their matches are still valid, by content hash
+            columns = [row[1] for row in self.connection.execute("PRAGMA table_info(files)")]
+            if len(columns) != 0 and "root" not in columns:
+                self.connection.execute("DROP TABLE files")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "root TEXT NOT NULL, path TEXT NOT NULL, size INTEGER NOT NULL, mtime INTEGER NOT NULL, contentHash TEXT NOT NULL, "
+                "PRIMARY KEY (root, path, size, mtime))"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS matches ("
+                "contentHash TEXT NOT NULL, pattern TEXT NOT NULL, matched INTEGER NOT NULL, "
+                "PRIMARY KEY (contentHash, pattern))"
+            )
+            self.connection.commit()
+        return self.connection
+
+    def getContentHash(self, content):
+        # Content is either text, or the bytes of a memory mapping
+        return hashText(content) if isinstance(content, str) else sha256(content).hexdigest()
+
+    def lookupFile(self, root, key, fileStat):
+        with self.lock:
+            row = self.getConnection().execute(
+                "SELECT contentHash FROM files WHERE root = ? AND path = ? AND size = ? AND mtime = ?",
+                (root, key, fileStat.st_size, fileStat.st_mtime_ns)
+            ).fetchone()
+        return row[0] if row != None else None
+
+    def lookupMatches(self, contentHash, patterns):
+        # Results of the given patterns known for the content,
+        # as a dictionary mapping patterns to whether they match
+        known = {}
+        with self.lock:
+            for pattern, matched in self.getConnection().execute(
+                "SELECT pattern, matched FROM matches WHERE contentHash = ?",
+                (contentHash,)
+            ):
+                if pattern in patterns:
+                    known[pattern] = matched == 1
+            if len(known) == len(patterns):
+                self.hits += 1
+            else:
+                self.misses += 1
+        return known
+
+    def store(self, root, key, fileStat, contentHash, results):
+        with self.lock:
+            connection = self.getConnection()
+            connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (root, key, fileStat.st_size, fileStat.st_mtime_ns, contentHash)
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO matches VALUES (?, ?, ?)",
+                [(contentHash, pattern, 1 if matched else 0) for pattern, matched in results.items()]
+            )
+            connection.commit()
+
+    def close(self):
+        with self.lock:
+            if self.connection != None:
+                self.connection.close()
+                self.connection = None
@@ -2,220 +2,184 @@
 
 import logging
 import argparse
-from shutil import copytree, rmtree
-from manifest.manifest_handler import ManifestHandler
-from operators.java.hardcoded_secret import HardcodedSecret
-from operators.java.implicit_pending_intent import ImplicitPendingIntent
-from operators.java.tapjacking_full_occlusion import TapjackingFullOcclusion as TapjackingFullOcclusionJava
-from operators.java.tapjacking_partial_occlusion import TapjackingPartialOcclusion
-from operators.java.tapjacking_set_hide_overlay_windows import TapjackingSetHideOverlayWindows
-from operators.operators import OperatorNames, OperatorTypes
-from operators.xml.improper_export import ImproperExport
-from operators.xml.debuggable_application import DebuggableApplication
-from operators.xml.plaintext_http import PlaintextHttp
-from operators.xml.tapjacking_full_occlusion import TapjackingFullOcclusion as TapjackingFullOcclusionXml
-from resources.resources_handler import ResourcesHandler
-from source.source_handler import SourceHandler
+from corpus.corpus_cache import DEFAULT_MAX_BYTES, CorpusCache
+from materialization.archive_writer import ArchiveLayout
+from materialization.tree_materializer import MaterializationBackend, OutputFormat
+from mutation.mutation_errors import InvalidArgumentsError, SeedVulnsError
+from mutation.mutation_runner import applyOperatorsToApps, closeMaterializer, instantiateOperators, logProfile, mutateApp, prepareApp, setupLogging, setupOperators, validateArguments
+from profiling.run_profile import getProfile
+from report.report_sink import ReportSink, renderOperator
+from scanning.project_index import defaultExcludes
+from scanning.scan_engine import ScanEngine
+from scanning.scan_index import ScanIndex
+
+# Logging levels for each verbosity. Whole-file dumps are only
+# logged with debug verbosity. Results (the mutation report, the batch
+# summary and the profile) are logged as warnings, so that quiet
+# verbosity only leaves out progress
+verbosityLevels = {
+    "quiet": logging.WARNING,
+    "normal": logging.INFO,
+    "debug": logging.DEBUG
+}
 
 def main():
+    # Parse arguments first, since they set the logging verbosity. 
+    # Need sourcePath, destinationPath, and operators
+    args = parseArguments()
+
     # Setup logging and print banner to console 
-    log = setupLogging()
+    log = setupLogging(verbosityLevels[args.verbosity])
     log.info("========== seed-vulns ==========")
 
-    # Parse arguments and log them. Need sourcePath, 
-    # destinationPath, and operators
-    log.info("Parsing arguments...")
-    args = parseArguments()
+    # Errors are raised by seed-vulns as exceptions, so that it can be
+    # used as a library. The command line exits on them instead
+    try:
+        run(log, args)
+    except SeedVulnsError as e:
+        log.error("%s. Exiting...", e)
+        exit(1)
+
+def run(log, args):
+    # Read arguments and log them
     sourcePath = args.sourcePath
     destinationPath = args.destinationPath
-    operators = args.operators.split(',')
+    operators = args.operators.split(',') if args.operators != None else []
     single = args.single
     commentMutations = args.comment_mutations
     allMutants = args.all_mutants
-    logArguments(log, sourcePath, destinationPath, operators, single, commentMutations, allMutants)
-    if allMutants and single:
-        log.error("Conflicting arguments: cannot output all mutants and a single higher order mutant at the same time. Exiting...")
-        exit(1)
-
-    # Copy the source path to the destination path. Mutations
-    # shall ovewrite the files in the destination path
-    if single:
-        log.info("Copying the source path to the destination path...")
-        copyDestination(log, sourcePath, destinationPath)
+    materialization = MaterializationBackend(args.materialization)
+    outputFormat = OutputFormat(args.output_format)
+    cacheSize = args.cache_size
+    jobs = args.jobs
+    scanThreads = args.scan_threads
+    verbosity = args.verbosity
+    reportPath = args.report
+    seed = args.seed
+    skipExisting = args.skip_existing
+    scanIndexPath = args.scan_index
+    archiveLayout = ArchiveLayout(args.archive_layout)
+    include = args.include
+    exclude = args.exclude
+    gitignore = args.gitignore
+    batch = args.batch
+    profileOutputPath = args.profile_output
+    profile = args.profile or profileOutputPath != None
+    serveAddress = args.serve
+    logArguments(log, sourcePath, destinationPath, operators, single, commentMutations, allMutants, materialization, outputFormat, cacheSize, jobs, scanThreads, verbosity, reportPath, seed, skipExisting, scanIndexPath, archiveLayout, include, exclude, gitignore, batch, profile, profileOutputPath, serveAddress)
+    if len(operators) == 0 and serveAddress == None:
+        raise InvalidArgumentsError("No operators given")
+    if serveAddress != None and (allMutants or batch):
+        raise InvalidArgumentsError("Conflicting arguments: the server outputs one higher order mutant per request, of a single app")
+    validateArguments(single, allMutants, outputFormat, archiveLayout, jobs, scanThreads, skipExisting, serveAddress != None)
+
+    # Profiling starts once arguments are validated, and covers
+    # everything up to the rendering of the profile itself
+    if profile:
+        getProfile().enable(profileOutputPath)
 
     # Instantiate operators, by mapping the operator names to
     # the corresponding classes 
     log.info("Instantiating operators...")
     operatorsQueue = instantiateOperators(log, operators)
 
-    # Source file handlers 
-    manifestHandler = None 
-    sourceHandler = None
-    resourcesHandler = None
-
-    # If single, then instantiate all source file handlers
-    # in advance, since the destination path is always the same
-    if single: 
-        # Find and parse Android manifest if needed. That is, if
-        # there are any XML-based operators in the queue
-        if needManifest(operatorsQueue):
-            log.info("Found queued manifest-based operators. Parsing manifest...")
-            manifestHandler = ManifestHandler(destinationPath)
-            log.info("Manifest path: %s", manifestHandler.manifestPath)
-
-        # Find source files if needed. That is, if there are any
-        # Java-based operators in the queue
-        if needSources(operatorsQueue):
-            log.info("Found queued source-based operators. Finding source files...")
-            sourceHandler = SourceHandler(destinationPath)
-            for sourceFile in sourceHandler.sourceFiles:
-                log.info("Source file: %s", sourceFile)
-
-        # Find resource files if needed. That is, if there are any
-        # XML-based operators in the queue
-        if needResources(operatorsQueue):
-            log.info("Found queued resource-based operators. Finding resource files...")
-            resourcesHandler = ResourcesHandler(destinationPath)
-            for resourceFile in resourcesHandler.resourceFiles:
-                log.info("Resource file: %s", resourceFile)
-    
-    # Enter mutation loop. For each operator in the queue,
-    # apply the mutation to the app and save the mutated app
-    # to the destination path
-    log.info("Entering mutation loop...")
-
-    # Variable report is a string containing the results of
-    # all mutations. It is printed to the console at the end
-    report = "\n========== Mutation Report ==========\n"
-    for operator in operatorsQueue:
-        log.info("Applying operator: %s", operator.name.value)
-        path = None 
-        if not single: 
-            path = "{}_{}".format(destinationPath, operator.name.value)
-        if operator.type == OperatorTypes.XML_MANIFEST:
-            if not single:
-                copyDestination(log, sourcePath, path)
-                manifestHandler = ManifestHandler(path)
-            result = operator.mutate(manifestHandler, commentMutations, allMutants)
-            if not single:
-                removeDestination(log, result, path)
-            report = appendResult(report, result)
-        elif operator.type == OperatorTypes.JAVA:
-            if not single: 
-                copyDestination(log, sourcePath, path)
-                sourceHandler = SourceHandler(path)
-            result = operator.mutate(sourceHandler, commentMutations, allMutants)
-            if not single:
-                removeDestination(log, result, path)
-            report = appendResult(report, result)
-        elif operator.type == OperatorTypes.XML_RESOURCES:
-            if not single: 
-                copyDestination(log, sourcePath, path)
-                resourcesHandler = ResourcesHandler(path)
-            result = operator.mutate(resourcesHandler, commentMutations, allMutants)
-            if not single:
-                removeDestination(log, result, path)
-            report = appendResult(report, result)
-        else: 
-            log.error("Invalid operator type: %s", operator.type)
+    # Report sink shared by all operators, to which each mutant
+    # is streamed as a JSON Lines record as soon as it is produced
+    reportSink = ReportSink(reportPath)
+    setupOperators(operatorsQueue, reportSink, skipExisting, seed)
+
+    # Persistent scan index, so that files that have not changed since
+    # a previous run are not scanned again for the same patterns
+    scanIndex = ScanIndex(scanIndexPath) if scanIndexPath != None else None
+
+    # Mutants of a batch are only reported by the JSON Lines report. The
+    # log only holds a summary of each app
+    if batch:
+        failed = applyOperatorsToApps(log, operatorsQueue, jobs, sourcePath, destinationPath, single, commentMutations, allMutants, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, seed, skipExisting, include, exclude, gitignore, reportSink)
+        logProfile(log, reportSink)
+        reportSink.close()
+        if scanIndex != None:
+            scanIndex.close()
+        if failed:
             exit(1)
-    
-    log.info(report)
-
-def appendResult(report, result):
-    return report + (result if result != None else "")
-
-def needResources(operatorsQueue):
-    for operator in operatorsQueue:
-        if operator.type == OperatorTypes.XML_RESOURCES:
-            return True
-
-def needSources(operatorsQueue):
-    for operator in operatorsQueue:
-        if operator.type == OperatorTypes.JAVA:
-            return True
-
-def needManifest(operatorsQueue):
-    for operator in operatorsQueue:
-        if operator.type == OperatorTypes.XML_MANIFEST:
-            return True
-
-def instantiateOperators(log, operators):
-    queue = []
-    for operator in operators:
-        log.info("Instantiating operator: %s", operator)
-
-        match operator:
-            case OperatorNames.IMPROPER_EXPORT.value:
-                queue.append(ImproperExport(log))
-            case OperatorNames.DEBUGGABLE_APPLICATION.value:
-                queue.append(DebuggableApplication(log))
-            case OperatorNames.IMPLICIT_PENDING_INTENT.value:
-                queue.append(ImplicitPendingIntent(log))
-            case OperatorNames.HARDCODED_SECRET.value:
-                queue.append(HardcodedSecret(log))
-            # Specifying operator TapjackingFullOcclusion activates 
-            # both Java and XML full occlusion operators
-            case OperatorNames.TAPJACKING_FULL_OCCLUSION.value:
-                queue.append(TapjackingFullOcclusionXml(log))
-                queue.append(TapjackingFullOcclusionJava(log))
-            case OperatorNames.TAPJACKING_PARTIAL_OCCLUSION.value:
-                queue.append(TapjackingPartialOcclusion(log))
-            case OperatorNames.TAPJACKING_SET_HIDE_OVERLAY_WINDOWS.value:
-                queue.append(TapjackingSetHideOverlayWindows(log))
-            case OperatorNames.PLAINTEXT_HTTP.value:
-                queue.append(PlaintextHttp(log))
-            case _:
-                log.error("Invalid operator: %s", operator)
-                exit(1)
-
-        log.info("Instance of %s has been queued", operator)
-
-    return queue
-
-def removeDestination(log, result, path):
-    if result == None:
-        try:
-            rmtree(path)
-        except Exception as e:
-            log.error("An error occurred while removing the destination path: %s", e)
-            exit(1)
-
-def copyDestination(log, sourcePath, destinationPath):
-    try:
-        copytree(sourcePath, destinationPath)
-    except Exception as e:
-        log.error("An error occurred while copying the source path to the destination path: %s", e)
-        exit(1)
+        return
+
+    # Server mode: the destination path is a working copy of the app that
+    # is loaded once, and each request is answered with a mutant of it
+    if serveAddress != None:
+        serveApp(log, operators, serveAddress, sourcePath, destinationPath, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, include, exclude, gitignore, reportSink)
+        return
+
+    mutateApp(log, operatorsQueue, jobs, sourcePath, destinationPath, single, commentMutations, allMutants, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, skipExisting, include, exclude, gitignore)
+
+    # The human-readable report is rendered from the streamed records,
+    # one operator at a time and in queue order, so that it is the
+    # same regardless of which operator finished first
+    with getProfile().measure("report"):
+        log.warning("\n========== Mutation Report ==========")
+        for operator in operatorsQueue:
+            section = renderOperator(reportSink, operator)
+            if section != None:
+                log.warning(section)
+    if scanIndex != None:
+        with getProfile().measure("cleanup"):
+            scanIndex.close()
+    logProfile(log, reportSink)
+    reportSink.close()
+
+def serveApp(log, operators, serveAddress, sourcePath, destinationPath, materialization, outputFormat, archiveLayout, cacheSize, scanIndex, scanThreads, include, exclude, gitignore, reportSink):
+    # The working copy is copied like with --single, unless outputting
+    # patches, whose pristine app is the working copy itself
+    projectIndex, materializer = prepareApp(log, sourcePath, destinationPath, outputFormat != OutputFormat.PATCH, materialization, outputFormat, archiveLayout, False, scanThreads, include, exclude, gitignore)
+    corpusCache = CorpusCache(cacheSize * 1024 * 1024)
+    scanEngine = ScanEngine(scanIndex)
+    # The HTTP server is only imported when serving
+    from server.mutation_server import MutationServer
+    server = MutationServer(log, instantiateOperators, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex, reportSink)
+    log.info("Loading operators...")
+    server.loadOperators(operators)
+    server.serve(serveAddress)
+
+    with getProfile().measure("cleanup"):
+        closeMaterializer(materializer)
+        if scanIndex != None:
+            scanIndex.close()
+    logProfile(log, reportSink)
+    reportSink.close()
 
 def parseArguments():
     parser = argparse.ArgumentParser(description="seed-vulns")
 
     parser.add_argument('sourcePath', help='Source path containing the original app')
     parser.add_argument('destinationPath', help='Destination path to which the resulting mutated app will be saved')
-    parser.add_argument('--operators', help='Comma-separeted list of mutation operators to be applied to the app', required=True)
+    parser.add_argument('--operators', help='Comma-separeted list of mutation operators to be applied to the app: built-in operators, operators registered by installed packages under the seed_vulns.operators entry point group, or operator classes given as module:Class. Required, except with --serve, for which they are the operators loaded before serving', default=None)
     parser.add_argument('-s', '--single', help='Output one single higher order mutant containing all mutations', action='store_true')
     parser.add_argument('-c', '--comment-mutations', help='Comment all mutations in the source code', action='store_true')
-    parser.add_argument('-a', '--all-mutants', help='Output all mutants', action='store_true')
+    parser.add_argument('-a', '--all-mutants', help='Output all mutants. Each mutant is output next to the destination path as <destination>_<operator>_<mutant ID>, the ID being a stable hash of the operator, file, mutated site and file content (mutants used to be numbered <destination>_<operator>_<index>)', action='store_true')
+    parser.add_argument('-m', '--materialization', help='How copies of the app are materialized: reflink where supported falling back to plain copies (auto), reflink, hardlink or copy. Hardlinked copies share unmodified files with the source path', choices=[backend.value for backend in MaterializationBackend], default=MaterializationBackend.AUTO.value)
+    parser.add_argument('-f', '--output-format', help='Output each mutant as a full copy of the app (tree), as a unified diff against a single pristine copy of the app written to the destination path (patch), or streamed into a tar or zip archive (tar, zip). All but tree require --all-mutants', choices=[outputFormat.value for outputFormat in OutputFormat], default=OutputFormat.TREE.value)
+    parser.add_argument('--archive-layout', help='With tar or zip output, write one archive per mutant next to the destination path (per-mutant), or a single archive named after the destination path holding each mutant under its own prefix (single). Single requires one job', choices=[layout.value for layout in ArchiveLayout], default=ArchiveLayout.PER_MUTANT.value)
+    parser.add_argument('-j', '--jobs', help='Number of operators applied in parallel, each in its own process (default: 1). Has no effect with --single, since all operators then mutate the same copy of the app', type=int, default=1)
+    parser.add_argument('-t', '--scan-threads', help='Number of threads used to walk the app and to read and scan its files (default: 1)', type=int, default=1)
+    parser.add_argument('-v', '--verbosity', help='Logging verbosity: results, warnings and errors only (quiet), progress and results (normal), or everything including whole-file dumps (debug)', choices=list(verbosityLevels.keys()), default="normal")
+    parser.add_argument('--cache-size', help='Memory cap of the in-memory cache of source and resource files, in MB. 0 disables the cache', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024))
+    parser.add_argument('--seed', help='Seed of the pseudorandom choices of the operators (candidates picked and secrets injected), so that runs can be reproduced', type=int, default=None)
+    parser.add_argument('--skip-existing', help='Do not write mutants that already exist in the destination, e.g. when resuming an interrupted run. Mutants are looked up by their output path, named after their mutant ID (see --all-mutants). Requires --all-mutants', action='store_true')
+    parser.add_argument('--scan-index', help='Path to a SQLite file in which scan results are kept across runs, so that unchanged files are not scanned again for the same patterns. Created if it does not exist', default=None)
+    parser.add_argument('--include', help='Glob of the files of the app to look for mutation sites in, matched against their name or their path relative to the app. May be given more than once. All files by default. The manifest is always looked up', action='append', default=None)
+    parser.add_argument('--exclude', help='Glob of files or directories of the app to skip, matched like --include. A trailing slash only matches directories. May be given more than once. {} are always skipped, and so is build/ at the root of a module (next to src/ or a Gradle file)'.format(', '.join(defaultExcludes)), action='append', default=None)
+    parser.add_argument('--gitignore', help='Also skip the files and directories ignored by the .gitignore files of the app', action='store_true')
+    parser.add_argument('-b', '--batch', help='Mutate a batch of apps: the source path is either a directory whose subdirectories are apps, or a file listing the source paths of apps, one per line. Each app is output under the destination path, named after it. Operators are applied to apps as parallel jobs, and an app that fails does not stop the others', action='store_true')
+    parser.add_argument('--profile', help='Log the wall time, CPU time and number of calls of each phase of the run (indexing, copies, handlers, scanning, mutation, serialization, writes, report and cleanup) and counters such as bytes read and written, files copied and regex evaluations, per operator. Measurements are also streamed to the report', action='store_true')
+    parser.add_argument('--profile-output', help='Path to which cProfile stats are dumped in pstats format, e.g. to be converted to a flame graph. Worker processes dump their own stats to this path suffixed with their process ID. Implies --profile', default=None)
+    parser.add_argument('--serve', help='Serve mutants of the app instead of exiting: the app is copied to the destination path and loaded once, then each request for a mutant (a JSON object with operators, and optionally a seed and commentMutations) is answered with a higher order mutant written next to it. The address is either unix:PATH, for a Unix socket speaking JSON Lines, or HOST:PORT, for a localhost HTTP server answering requests POSTed as application/json. Requests may only name built-in operators, entry point operators, or operators given with --operators', default=None)
+    parser.add_argument('--report', help='Path to which the mutation report is streamed as JSON Lines, one record per mutant and per operator', default=None)
 
     args = parser.parse_args()
 
     return args
 
-def setupLogging():
-    log = logging.getLogger('seed-vulns')
-    log.setLevel(logging.INFO)
-
-    formatter = logging.Formatter('[%(name)s] %(message)s')
-
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
-    ch.setFormatter(formatter)
-    log.addHandler(ch)
-
-    return log
-
-def logArguments(log, sourcePath, destinationPath, operators, single, commentMutations, allMutants):
+def logArguments(log, sourcePath, destinationPath, operators, single, commentMutations, allMutants, materialization, outputFormat, cacheSize, jobs, scanThreads, verbosity, reportPath, seed, skipExisting, scanIndexPath, archiveLayout, include, exclude, gitignore, batch, profile, profileOutputPath, serveAddress):
     log.info("seed-vulns has been initiated with the following arguments:")
     log.info("- Source path: %s", sourcePath)
     log.info("- Destination path: %s", destinationPath)
@@ -223,6 +187,24 @@ def logArguments(log, sourcePath, destinationPath, operators, single, commentMut
     log.info("- Single: %s", "True" if single else "False")
     log.info("- Comment mutations: %s", "True" if commentMutations else "False")
     log.info("- All mutants: %s", "True" if allMutants else "False")
+    log.info("- Materialization: %s", materialization.value)
+    log.info("- Output format: %s", outputFormat.value)
+    log.info("- Cache size: %d MB", cacheSize)
+    log.info("- Jobs: %d", jobs)
+    log.info("- Scan threads: %d", scanThreads)
+    log.info("- Verbosity: %s", verbosity)
+    log.info("- Report: %s", reportPath if reportPath != None else "None")
+    log.info("- Seed: %s", seed if seed != None else "None")
+    log.info("- Skip existing: %s", "True" if skipExisting else "False")
+    log.info("- Scan index: %s", scanIndexPath if scanIndexPath != None else "None")
+    log.info("- Archive layout: %s", archiveLayout.value)
+    log.info("- Include: %s", include if include != None else "None")
+    log.info("- Exclude: %s", exclude if exclude != None else "None")
+    log.info("- Gitignore: %s", "True" if gitignore else "False")
+    log.info("- Batch: %s", "True" if batch else "False")
+    log.info("- Profile: %s", "True" if profile else "False")
+    log.info("- Profile output: %s", profileOutputPath if profileOutputPath != None else "None")
+    log.info("- Serve: %s", serveAddress if serveAddress != None else "None")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,254 @@
+from hashlib import sha256
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+from socketserver import StreamRequestHandler, UnixStreamServer
+from mutation.mutation_errors import InvalidArgumentsError, SeedVulnsError
+from mutation.mutation_runner import createHandler
+from profiling.run_profile import getProfile
+
+# Hosts the HTTP server may listen on. Requests are not authenticated,
+# hence the server is only reachable from the local machine
+loopbackHosts = ["localhost", "127.0.0.1", "::1"]
+
+# Sink of the records of a single request, which are returned with the
+# response, and also streamed to the report sink of the run, if any
+class RequestSink:
+
+    def __init__(self, reportSink=None):
+        self.reportSink = reportSink
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+        if self.reportSink != None:
+            self.reportSink.emit(record)
+
+# Long-running server that loads an app once (index, working copy,
+# parsed manifest, source and resource corpus, scan results) and answers
+# repeated requests for mutants of it, each one a JSON object:
+#   {"operators": ["ImproperExport", ...], "seed": 1, "commentMutations": false}
+# Each request is answered with a higher order mutant holding the mutations
+# of all of its operators, written next to the working copy and named after
+# a hash of its content. Mutations are kept in memory and discarded once the
+# mutant is written, hence the working copy is never modified and the next
+# request starts from the original app. Other requests are {"command":
+# "status"} and {"command": "shutdown"}. Requests are served one at a time
+class MutationServer:
+
+    def __init__(self, log, instantiateOperators, destinationPath, materializer, corpusCache, scanEngine, scanThreads, projectIndex, reportSink=None):
+        self.log = log
+        self.instantiateOperators = instantiateOperators
+        self.destinationPath = destinationPath
+        self.materializer = materializer
+        self.corpusCache = corpusCache
+        self.scanEngine = scanEngine
+        self.scanThreads = scanThreads
+        self.projectIndex = projectIndex
+        self.reportSink = reportSink
+        self.operators = {}
+        self.handlers = {}
+        self.mutantIds = set()
+        self.requests = 0
+        self.stopped = False
+
+    def getOperators(self, names, allowModulePaths=False):
+        # Operators are instantiated once per name, on first use. A name may
+        # stand for more than one operator (e.g. TapjackingFullOcclusion).
+        # Requests may only name built-in and entry point operators, or
+        # operators loaded up front, since module paths would let any
+        # local client import any module
+        queue = []
+        for name in names:
+            if name not in self.operators:
+                self.operators[name] = self.instantiateOperators(self.log, [name], allowModulePaths)
+            queue.extend(self.operators[name])
+        return queue
+
+    def getHandler(self, operatorType):
+        # Handlers are created on first use and kept, along with the
+        # parsed manifest and the resource index they hold
+        if operatorType not in self.handlers:
+            with getProfile().measure("handlers"):
+                self.handlers[operatorType] = createHandler(operatorType, self.destinationPath, self.materializer, self.corpusCache, self.scanEngine, self.scanThreads, self.projectIndex)
+        return self.handlers[operatorType]
+
+    def loadOperators(self, names):
+        # Operators given up front are loaded before serving, so that
+        # the first request does not pay for parsing and scanning the app
+        for operator in self.getOperators(names, True):
+            self.scanEngine.registerPatterns(operator.getPatterns())
+            self.getHandler(operator.type)
+
+    def getMutantId(self, contents):
+        # Mutants are named after their mutated files and content, hence
+        # requests producing the same mutant are answered with the same one
+        key = ""
+        for file in sorted(contents):
+            key += "\0".join([os.path.relpath(file, self.destinationPath), sha256(contents[file].encode("utf-8")).hexdigest()]) + "\0"
+        return sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def generateMutant(self, request):
+        names = request.get("operators", [])
+        if isinstance(names, str):
+            names = names.split(",")
+        if len(names) == 0:
+            return {"ok": False, "error": "No operators given"}
+        seed = request.get("seed")
+        commentMutations = request.get("commentMutations", False)
+
+        sink = RequestSink(self.reportSink)
+        profile = getProfile()
+        mutated = {}
+        try:
+            for operator in self.getOperators(names):
+                if seed != None:
+                    operator.seed(seed)
+                operator.reportSink = sink
+                handler = self.getHandler(operator.type)
+                self.log.info("Applying operator: %s", operator.name.value)
+                profile.setOperator(operator.name.value)
+                with profile.measure("mutate"):
+                    mutated[operator.name.value] = operator.mutate(handler, commentMutations, False)
+                profile.setOperator(None)
+
+            contents = {}
+            for handler in self.handlers.values():
+                contents.update(handler.getEdits())
+            mutantId = None
+            outputPath = None
+            if len(contents) != 0:
+                mutantId = self.getMutantId(contents)
+                mutantPath = "{}_{}".format(self.destinationPath, mutantId)
+                outputPath = self.materializer.getOutputPath(mutantPath)
+                if mutantId not in self.mutantIds:
+                    with profile.measure("write"):
+                        self.materializer.materializeMutant(self.destinationPath, mutantPath, contents)
+                    self.mutantIds.add(mutantId)
+            return {"ok": True, "mutantId": mutantId, "outputPath": outputPath, "mutated": mutated, "records": sink.records}
+        finally:
+            # Mutations of a request never outlive it, even if it failed
+            profile.setOperator(None)
+            for handler in self.handlers.values():
+                handler.discardEdits()
+
+    def handleRequest(self, request):
+        # Errors of a request are returned to the client
+        # instead of stopping the server
+        self.requests += 1
+        try:
+            if not isinstance(request, dict):
+                return {"ok": False, "error": "Requests must be JSON objects"}
+            match request.get("command", "mutate"):
+                case "mutate":
+                    return self.generateMutant(request)
+                case "status":
+                    return {
+                        "ok": True,
+                        "destinationPath": self.destinationPath,
+                        "files": len(self.projectIndex.files),
+                        "operators": sorted(self.operators),
+                        "requests": self.requests,
+                        "mutants": len(self.mutantIds)
+                    }
+                case "shutdown":
+                    self.stopped = True
+                    return {"ok": True}
+                case command:
+                    return {"ok": False, "error": "Invalid command: {}".format(command)}
+        except SeedVulnsError as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            self.log.error("An error occurred while serving a request: %s", e)
+            return {"ok": False, "error": "{}: {}".format(type(e).__name__, e)}
+
+    def handleLine(self, line):
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            return {"ok": False, "error": "Invalid JSON: {}".format(e)}
+        return self.handleRequest(request)
+
+    def serve(self, address):
+        # Addresses are either unix:PATH, for a Unix socket speaking JSON
+        # Lines (one request and one response per line), or HOST:PORT, for
+        # an HTTP server answering JSON requests POSTed to any path
+        if address.startswith("unix:"):
+            socketPath = address[len("unix:"):]
+            if os.path.exists(socketPath):
+                os.remove(socketPath)
+            server = UnixStreamServer(socketPath, UnixRequestHandler)
+        else:
+            host, _, port = address.rpartition(":")
+            host = host.strip("[]")
+            if host not in loopbackHosts:
+                raise InvalidArgumentsError("Invalid server address: {}. Only loopback hosts ({}) are allowed".format(address, ", ".join(loopbackHosts)))
+            try:
+                server = HTTPServer((host, int(port)), HttpRequestHandler)
+            except ValueError:
+                raise InvalidArgumentsError("Invalid server port: {}".format(port))
+            socketPath = None
+        server.mutationServer = self
+
+        self.log.info("Serving mutants on: %s", address)
+        try:
+            while not self.stopped:
+                server.handle_request()
+        finally:
+            server.server_close()
+            if socketPath != None and os.path.exists(socketPath):
+                os.remove(socketPath)
+        self.log.info("Server stopped after %d requests", self.requests)
+
+class UnixRequestHandler(StreamRequestHandler):
+
+    def handle(self):
+        # Clients may send any number of requests over a connection
+        for line in self.rfile:
+            if len(line.strip()) == 0:
+                continue
+            response = self.server.mutationServer.handleLine(line)
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if self.server.mutationServer.stopped:
+                return
+
+# Web pages the user visits may send requests to the server too, either
+# directly (e.g. a form POSTing text/plain) or through a domain resolving
+# to a loopback address. Only JSON requests to a loopback host are served
+class HttpRequestHandler(BaseHTTPRequestHandler):
+
+    def isLoopbackHost(self):
+        host = self.headers.get("Host", "")
+        if host.startswith("["):
+            host = host[1:].partition("]")[0]
+        else:
+            host = host.rpartition(":")[0] if ":" in host else host
+        return host in loopbackHosts
+
+    def sendResponse(self, response):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(200 if response["ok"] else 400)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self.isLoopbackHost():
+            self.sendResponse({"ok": False, "error": "Invalid host"})
+            return
+        self.sendResponse(self.server.mutationServer.handleRequest({"command": "status"}))
+
+    def do_POST(self):
+        if not self.isLoopbackHost():
+            self.sendResponse({"ok": False, "error": "Invalid host"})
+            return
+        if self.headers.get("Content-Type", "").partition(";")[0].strip().lower() != "application/json":
+            self.sendResponse({"ok": False, "error": "Requests must have Content-Type application/json"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        self.sendResponse(self.server.mutationServer.handleLine(self.rfile.read(length)))
+
+    def log_message(self, format, *args):
+        self.server.mutationServer.log.debug(format, *args)
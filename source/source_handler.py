@@ -1,7 +1,14 @@
+from collections import OrderedDict
 from enum import Enum
-import os
-import re
-from shutil import copytree, rmtree 
+from shutil import rmtree 
+from corpus.corpus_cache import CorpusCache
+from materialization.tree_materializer import TreeMaterializer
+from mutation.edit_journal import EditJournal
+from profiling.run_profile import getProfile
+from scanning.concurrent_scan import mapFiles
+from scanning.project_index import ProjectIndex
+from scanning.scan_engine import ScanEngine
+from source.source_tokenizer import SourceTokenizer
 
 class SourceFileExtension(Enum):
     JAVA = 0
@@ -9,14 +16,27 @@ class SourceFileExtension(Enum):
 
 class SourceHandler:
 
+    # Cap on the content of the sources whose tokenizers are kept, in
+    # characters. Tokenizers hold several entries per token, hence they
+    # take many times the memory of their source
+    maxTokenizedChars = 8 * 1024 * 1024
+
     sourceFiles = None
     sourceFileExtensions = {
         SourceFileExtension.JAVA: ".java",
         SourceFileExtension.KOTLIN: ".kt"
     }
 
-    def __init__(self, destinationPath):
+    def __init__(self, destinationPath, materializer=None, corpusCache=None, scanEngine=None, scanThreads=1, projectIndex=None):
         self.destinationPath = destinationPath
+        self.materializer = materializer if materializer != None else TreeMaterializer()
+        self.corpusCache = corpusCache if corpusCache != None else CorpusCache()
+        self.scanEngine = scanEngine if scanEngine != None else ScanEngine()
+        self.scanThreads = scanThreads
+        self.projectIndex = projectIndex if projectIndex != None else ProjectIndex(destinationPath, scanThreads)
+        self.journal = EditJournal()
+        self.tokenizers = OrderedDict()
+        self.tokenizedChars = 0
         self.findSourceFiles()
 
     def isJavaSourceFile(self, file):
@@ -28,50 +48,101 @@ class SourceHandler:
     def removeDestinationPath(self):
         rmtree(self.destinationPath, ignore_errors=True)
 
+    def getOutputPath(self, copy_index=None):
+        # Mutants written to a new copy are output wherever the materializer
+        # puts that copy. Otherwise, the destination path itself is mutated
+        if copy_index == None:
+            return self.destinationPath
+        return self.materializer.getOutputPath("{}_{}".format(self.destinationPath, copy_index))
+
     def writeSourceFile(self, file, content, to_new_copy=False, copy_index=None):
-        # If to_new_copy is True, create a backup of the destination path
-        destinationPathBackup = None
-        if to_new_copy: 
-            destinationPathBackup = "{}_backup".format(self.destinationPath)
-            copytree(self.destinationPath, destinationPathBackup)
-
-        # Write content to file
-        with open(file, "w") as f:
-                f.write(content)
-
-        # If to_new_copy is True, move the destination path to a new directory
-        # named after the copy index, restore the backup to the original destination
+        self.writeSourceFiles({file: content}, to_new_copy, copy_index)
+
+    def writeSourceFiles(self, contents, to_new_copy=False, copy_index=None):
+        # If to_new_copy is True, materialize a new copy of the destination path
+        # named after the copy index, and write contents to the files in that 
+        # copy only. The destination path itself is left untouched
         if to_new_copy:
             newDestinationPath = "{}_{}".format(self.destinationPath, copy_index)
-            rmtree(newDestinationPath, ignore_errors=True)
-            os.rename(self.destinationPath, newDestinationPath)
-            os.rename(destinationPathBackup, self.destinationPath)
+            self.materializer.materializeMutant(self.destinationPath, newDestinationPath, contents)
+            return
+
+        # Write contents to files
+        for file, content in contents.items():
+            self.materializer.writeFile(file, content)
+            self.corpusCache.invalidate(self.destinationPath, file)
+
+    def writeEdits(self, to_new_copy=False, copy_index=None):
+        # Write each edited file once, with all of its journaled edits
+        contents = self.journal.getContents()
+        self.journal.clear()
+        if len(contents) != 0:
+            self.writeSourceFiles(contents, to_new_copy, copy_index)
+
+    def discardEdits(self):
+        self.journal.clear()
+
+    def getEdits(self):
+        # Content of each edited file, with its journaled edits, which are
+        # neither written nor discarded
+        return self.journal.getContents()
 
     def readSourceFile(self, file):
-        with open(file, "r") as f:
-            return f.read()
+        # Journaled edits that have not been written yet are visible to reads
+        if self.journal.hasEdits(file):
+            return self.journal.getContent(file)
+        return self.corpusCache.read(self.destinationPath, file)
+
+    def tokenizeSourceFile(self, file):
+        # Tokenizers are shared by all operators using the handler, and
+        # kept as long as the content of the source is unchanged. Least
+        # recently used ones are evicted past the cap
+        content = self.readSourceFile(file)
+        if file in self.tokenizers:
+            tokenizer = self.tokenizers.pop(file)
+            self.tokenizedChars -= len(tokenizer.content)
+            if tokenizer.content is content or tokenizer.content == content:
+                self.tokenizers[file] = tokenizer
+                self.tokenizedChars += len(content)
+                return tokenizer
+        tokenizer = SourceTokenizer(content, self.isKotlinSourceFile(file))
+        self.tokenizers[file] = tokenizer
+        self.tokenizedChars += len(content)
+        while self.tokenizedChars > self.maxTokenizedChars and len(self.tokenizers) > 1:
+            _, evicted = self.tokenizers.popitem(last=False)
+            self.tokenizedChars -= len(evicted.content)
+        return tokenizer
+
+    def editSourceFile(self, file, start, end, replacement):
+        # Spans are offsets into the file as last read. Edited files are not
+        # read again, which would splice their pending edits one at a time
+        content = self.readSourceFile(file) if not self.journal.hasEdits(file) else None
+        self.journal.addEdit(file, content, start, end, replacement)
+
+    def scanSourceFile(self, file):
+        # Files with journaled edits are scanned as edited
+        if self.journal.hasEdits(file):
+            return self.scanEngine.scanContent(self.journal.getContent(file))
+        return self.scanEngine.scan(self.destinationPath, file, self.readSourceFile)
 
     def matchSourceFiles(self, patterns):
         matches = []
         if self.sourceFiles != None:
-            for file in self.sourceFiles:
-                with open(file, "r") as f:
-                    source = f.read()
-                    for pattern in patterns:
-                        if re.search(pattern, source):
-                            matches.append({"file": file, "pattern": pattern})
+            # Patterns of operators that were not queued in advance
+            # are added to the scan engine on demand
+            self.scanEngine.registerPatterns(patterns)
+            with getProfile().measure("scan"):
+                found = mapFiles(self.scanSourceFile, self.sourceFiles, self.scanThreads)
+            for file, fileFound in zip(self.sourceFiles, found):
+                for pattern in patterns:
+                    if pattern in fileFound:
+                        matches.append({"file": file, "pattern": pattern})
         return matches
 
     def findSourceFiles(self):
         # Check if source files have already been found
         if self.sourceFiles == None:
-            self.sourceFiles = []
-            # Look for source files in the destination path and
-            # add them to the sourceFiles list
-            for root, _, files in os.walk(self.destinationPath):
-                for file in files:
-                    for extension in self.sourceFileExtensions.values():
-                        if file.endswith(extension):
-                            self.sourceFiles.append(os.path.join(root, file))
-                            break
+            # Look for source files among the indexed files of the
+            # destination path and add them to the sourceFiles list
+            self.sourceFiles = self.projectIndex.findFiles(self.destinationPath, self.sourceFileExtensions.values())
         return self.sourceFiles
@@ -0,0 +1,248 @@
+from enum import Enum
+import re
+
+class TokenKind(Enum):
+    IDENTIFIER = "identifier" # Identifiers and keywords
+    STRING = "string" # String, text block, raw string and char literals
+    NUMBER = "number"
+    SYMBOL = "symbol" # Single characters, e.g. "==" is two tokens
+
+# Tokens of Java and Kotlin sources. Each alternative consumes its input
+# in a single forward pass, hence tokenizing never backtracks. Comments,
+# text blocks and raw strings are completed by the tokenizer itself.
+# Strings and chars end at the end of the line if left unterminated
+tokenRegex = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*)
+    |(?P<textBlock>\"\"\")
+    |(?P<string>"(?:[^"\\\n]|\\.)*"?|'(?:[^'\\\n]|\\.)*'?)
+    |(?P<identifier>(?:[^\W\d]|\$)(?:\w|\$)*|`[^`\n]*`)
+    |(?P<number>[0-9][A-Za-z0-9_.]*)
+    |(?P<symbol>\S)
+""", re.VERBOSE)
+whitespaceRegex = re.compile(r"\s*")
+blockCommentRegex = re.compile(r"/\*|\*/")
+
+brackets = {")": "(", "]": "[", "}": "{"}
+
+# Tokens that end a class header that has no body
+classHeaderEnds = {";", "}", "=", "class", "interface", "object", "fun", "val", "var"}
+
+# Kotlin classes whose body cannot start with a property: enum entries come
+# first in enum classes, and annotation and value classes have no
+# properties with a backing field
+restrictedClassModifiers = {"enum", "annotation", "value", "inline"}
+
+# Modifiers that may precede a method name
+methodModifiers = {
+    "public", "protected", "private", "internal", "static", "final", "abstract", "synchronized",
+    "native", "strictfp", "default", "open", "override", "suspend", "inline", "operator", "fun"
+}
+
+# Linear-time tokenizer and bracket matcher for Java and Kotlin sources,
+# used by operators to locate classes, methods and call sites. Unlike
+# regexes over the raw source, it skips comments and string literals and
+# matches brackets with nesting, e.g. to find the end of a method body.
+# Kotlin string templates are not parsed: a template containing quotes
+# may end its string early
+class SourceTokenizer:
+
+    def __init__(self, content, kotlin=False):
+        self.content = content
+        self.kotlin = kotlin
+        self.kinds = []
+        self.texts = []
+        self.starts = []
+        self.ends = []
+        self.matches = {}
+        self.identifiers = {}
+        self.tokenize()
+
+    def skipBlockComment(self, start):
+        # Kotlin block comments nest, Java ones do not
+        depth = 0
+        for match in blockCommentRegex.finditer(self.content, start):
+            if match.group() == "/*":
+                depth += 1
+                if not self.kotlin and depth > 1:
+                    depth = 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+        return len(self.content)
+
+    def skipTextBlock(self, start):
+        end = self.content.find('"""', start + 3)
+        if end == -1:
+            return len(self.content)
+        # Raw strings may end with more than three quotes
+        end += 3
+        while end < len(self.content) and self.content[end] == '"':
+            end += 1
+        return end
+
+    def tokenize(self):
+        content = self.content
+        stack = []
+        position = whitespaceRegex.match(content, 0).end()
+        while position < len(content):
+            match = tokenRegex.match(content, position)
+            group = match.lastgroup
+            end = match.end()
+            if group == "comment":
+                if match.group() == "/*":
+                    end = self.skipBlockComment(position)
+                position = whitespaceRegex.match(content, end).end()
+                continue
+
+            if group == "textBlock":
+                end = self.skipTextBlock(position)
+                kind = TokenKind.STRING
+            elif group == "string":
+                kind = TokenKind.STRING
+            elif group == "identifier":
+                kind = TokenKind.IDENTIFIER
+            elif group == "number":
+                kind = TokenKind.NUMBER
+            else:
+                kind = TokenKind.SYMBOL
+
+            index = len(self.texts)
+            text = content[position:end]
+            self.kinds.append(kind)
+            self.texts.append(text)
+            self.starts.append(position)
+            self.ends.append(end)
+
+            if kind == TokenKind.IDENTIFIER:
+                self.identifiers.setdefault(text, []).append(index)
+            elif kind == TokenKind.SYMBOL:
+                if text in "([{":
+                    stack.append(index)
+                elif text in brackets:
+                    # Unbalanced closing brackets are left unmatched
+                    if len(stack) != 0 and self.texts[stack[-1]] == brackets[text]:
+                        opening = stack.pop()
+                        self.matches[opening] = index
+                        self.matches[index] = opening
+
+            position = whitespaceRegex.match(content, end).end()
+
+    def getText(self, index):
+        return self.texts[index] if 0 <= index < len(self.texts) else None
+
+    def getTexts(self, start, end):
+        return self.texts[start:end]
+
+    def getParameters(self, opening):
+        # Token texts of each argument or parameter between the brackets,
+        # split on top-level commas
+        parameters = [[]]
+        index = opening + 1
+        while index < self.matches[opening]:
+            if self.texts[index] == ",":
+                parameters.append([])
+            else:
+                parameters[-1].append(self.texts[index])
+            if index in self.matches and self.texts[index] in "([{":
+                parameters[-1].extend(self.texts[index + 1:self.matches[index] + 1])
+                index = self.matches[index]
+            index += 1
+        return parameters if parameters != [[]] else []
+
+    def isCall(self, index):
+        return self.getText(index + 1) == "(" and index + 1 in self.matches
+
+    def findClassDefinitions(self):
+        # Spans of class headers, from the class keyword to the opening
+        # brace of the body. Class literals (Foo.class, Foo::class), classes
+        # without a body and restricted Kotlin classes are skipped
+        definitions = []
+        for index in self.identifiers.get("class", []):
+            if self.getText(index - 1) in [".", ":"]:
+                continue
+            if self.kotlin and self.getText(index - 1) in restrictedClassModifiers:
+                continue
+            if index + 1 >= len(self.texts) or self.kinds[index + 1] != TokenKind.IDENTIFIER:
+                continue
+            current = index + 2
+            while current < len(self.texts):
+                text = self.texts[current]
+                if text == "{":
+                    definitions.append((self.starts[index], self.ends[current]))
+                    break
+                if text in classHeaderEnds:
+                    break
+                # Constructor parameters and annotations with
+                # arguments are skipped as a whole
+                if text in "([" and current in self.matches:
+                    current = self.matches[current]
+                current += 1
+        return definitions
+
+    def findMethodDefinitions(self, name):
+        # Methods named name that have a body. Each one is returned with
+        # the span of the whole definition (from its first modifier to the
+        # closing brace of the body), the offset of the opening brace of
+        # the body, the index of the opening parenthesis of the parameters
+        # and the token texts of the header
+        definitions = []
+        for index in self.identifiers.get(name, []):
+            if not self.isCall(index) or self.getText(index - 1) == ".":
+                continue
+            current = self.matches[index + 1] + 1
+            # Return types (Kotlin) and throws clauses (Java)
+            while current < len(self.texts) and self.texts[current] not in ["{", "=", ";", "}", "("]:
+                current += 1
+            if self.getText(current) != "{" or current not in self.matches:
+                continue
+
+            # Modifiers and the return type (Java) precede the name.
+            # Annotations are not part of the definition
+            first = index
+            if not self.kotlin and first > 0 and self.kinds[first - 1] == TokenKind.IDENTIFIER and self.getText(first - 1) not in methodModifiers:
+                first -= 1
+            while self.getText(first - 1) in methodModifiers and self.getText(first - 2) != "@":
+                first -= 1
+
+            definitions.append({
+                "start": self.starts[first],
+                "end": self.ends[self.matches[current]],
+                "bodyStart": self.starts[current],
+                "parameters": index + 1,
+                "header": self.texts[first:current]
+            })
+        return definitions
+
+    def findCalls(self, name, receiver=None):
+        # Calls of a method named name on the given receiver, or on any
+        # receiver if None. Each one is returned with the span of the call
+        # (from the receiver, or the dot preceding the name, to the closing
+        # parenthesis) and the index of the opening parenthesis
+        calls = []
+        for index in self.identifiers.get(name, []):
+            if not self.isCall(index) or self.getText(index - 1) != ".":
+                continue
+            if receiver != None and self.getText(index - 2) != receiver:
+                continue
+            first = index - 2 if receiver != None else index - 1
+            calls.append({
+                "start": self.starts[first],
+                "end": self.ends[self.matches[index + 1]],
+                "arguments": index + 1
+            })
+        return calls
+
+    def findAssignments(self, name, value):
+        # Assignments of value to a property named name (.name = value),
+        # with the span from the dot to the value, and the index of the value
+        assignments = []
+        for index in self.identifiers.get(name, []):
+            if self.getText(index - 1) != "." or self.getText(index + 1) != "=" or self.getText(index + 2) != value:
+                continue
+            assignments.append({
+                "start": self.starts[index - 1],
+                "end": self.ends[index + 2],
+                "value": index + 2
+            })
+        return assignments
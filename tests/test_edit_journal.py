@@ -0,0 +1,69 @@
+import unittest
+from mutation.edit_journal import EditJournal
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+content = "class Main {\n    int a = 1;\n    int b = 2;\n}\n"
+
+class TestEditJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.journal = EditJournal()
+
+    def testEditsAreSplicedInOffsetOrder(self):
+        a = content.index("1")
+        b = content.index("2")
+        # Journaled out of order, both relative to the content as read
+        self.journal.addEdit("Main.java", content, b, b + 1, "20")
+        self.journal.addEdit("Main.java", None, a, a + 1, "10")
+        self.assertEqual(len(self.journal.getEdits("Main.java")), 2)
+        self.assertEqual(self.journal.getContent("Main.java"), content.replace("1", "10").replace("2", "20"))
+        self.assertEqual(self.journal.getEdits("Main.java"), [])
+
+    def testInsertionBeforeReplacedSpan(self):
+        start = content.index("int a")
+        end = start + len("int a")
+        self.journal.addEdit("Main.java", content, start, end, "long a")
+        self.journal.addEdit("Main.java", None, start, start, "// mutated\n    ")
+        self.assertEqual(self.journal.getContent("Main.java"), content.replace("int a", "// mutated\n    long a"))
+
+    def testEditsAfterReadReferToSplicedContent(self):
+        a = content.index("1")
+        self.journal.addEdit("Main.java", content, a, a + 1, "100")
+        spliced = self.journal.getContent("Main.java")
+        b = spliced.index("2")
+        self.journal.addEdit("Main.java", None, b, b + 1, "200")
+        self.assertEqual(self.journal.getContents(), {"Main.java": content.replace("1", "100").replace("2", "200")})
+
+    def testOverlappingEditsAreRejected(self):
+        start = content.index("int a")
+        self.journal.addEdit("Main.java", content, start, start + 5, "long a")
+        with self.assertRaises(ValueError):
+            self.journal.addEdit("Main.java", None, start + 2, start + 8, "x")
+        with self.assertRaises(ValueError):
+            self.journal.addEdit("Main.java", None, start + 1, start + 1, "x")
+        # Adjacent spans do not overlap
+        self.journal.addEdit("Main.java", None, start + 5, start + 5, "2")
+        self.assertEqual(self.journal.getContent("Main.java"), content.replace("int a", "long a2"))
+
+    def testInvalidSpansAreRejected(self):
+        with self.assertRaises(ValueError):
+            self.journal.addEdit("Main.java", content, 5, 4, "x")
+        with self.assertRaises(ValueError):
+            self.journal.addEdit("Main.java", content, 0, len(content) + 1, "x")
+
+    def testFilesAreJournaledSeparately(self):
+        self.journal.addEdit("Main.java", content, 0, 5, "interface")
+        self.journal.addEdit("Other.java", "class Other {}\n", 0, 0, "public ")
+        self.assertEqual(self.journal.getContents(), {
+            "Main.java": content.replace("class", "interface", 1),
+            "Other.java": "public class Other {}\n"
+        })
+        self.journal.clear()
+        self.assertFalse(self.journal.hasEdits("Main.java"))
+        self.assertEqual(self.journal.getContents(), {})
+
+if __name__ == "__main__":
+    unittest.main()
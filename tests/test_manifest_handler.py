@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from manifest.manifest_handler import ManifestHandler
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+manifest = """<?xml version="1.0" encoding="utf-8"?>
+<manifest xmlns:android="http://schemas.android.com/apk/res/android" package="com.example">
+    <application android:label="Example">
+        <activity android:name=".Main" android:exported="true">
+            <intent-filter>
+                <action android:name="android.intent.action.MAIN"/>
+            </intent-filter>
+        </activity>
+        <service android:name=".Sync" android:exported="false"/>
+        <receiver android:name=".Boot"/>
+    </application>
+</manifest>
+"""
+
+class TestManifestRollback(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "AndroidManifest.xml"), "w") as f:
+            f.write(manifest)
+        self.handler = ManifestHandler(self.directory.name)
+        self.original = self.handler.getManifestString()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def getComponent(self, type, name):
+        return [component for component in self.handler.findAllComponents(type) if component["name"] == name][0]["component"]
+
+    def testNewAttributeIsDeleted(self):
+        receiver = self.getComponent("receiver", ".Boot")
+        exported = self.handler.getAttribName("exported")
+        self.handler.setAttrib(receiver, exported, "true")
+        self.assertEqual(receiver.attrib[exported], "true")
+        self.handler.rollback()
+        self.assertNotIn(exported, receiver.attrib)
+
+    def testOverwrittenValueIsRestored(self):
+        service = self.getComponent("service", ".Sync")
+        exported = self.handler.getAttribName("exported")
+        # The value is overwritten twice, rollback restores the original one
+        self.handler.setAttrib(service, exported, "true")
+        self.handler.setAttrib(service, exported, "maybe")
+        self.handler.rollback()
+        self.assertEqual(service.attrib[exported], "false")
+
+    def testCommentsAreRemoved(self):
+        application = self.handler.findApplication()[0]
+        children = len(application)
+        self.handler.appendComment(application, "mutated")
+        self.assertEqual(len(application), children + 1)
+        self.handler.rollback()
+        self.assertEqual(len(application), children)
+        self.assertNotIn("mutated", self.handler.getManifestString())
+
+    def testComponentIndexIsRebuilt(self):
+        service = self.getComponent("service", ".Sync")
+        self.assertEqual([component["name"] for component in self.handler.findAllServices(False)], [".Sync"])
+        self.handler.setAttrib(service, self.handler.getAttribName("exported"), "true")
+        self.assertEqual([component["name"] for component in self.handler.findAllServices(True)], [".Sync"])
+        self.handler.rollback()
+        self.assertEqual([component["name"] for component in self.handler.findAllServices(True)], [])
+        self.assertEqual([component["name"] for component in self.handler.findAllServices(False)], [".Sync"])
+
+    def testSerializationAfterRollbackIsOriginal(self):
+        application = self.handler.findApplication()[0]
+        self.handler.setAttrib(application, self.handler.getAttribName("debuggable"), "true")
+        self.handler.replaceComponentAttrib(self.getComponent("service", ".Sync"), ".Sync", "mutated")
+        self.handler.setAttrib(self.getComponent("activity", ".Main"), self.handler.getAttribName("exported"), "false")
+        self.assertNotEqual(self.handler.getManifestString(), self.original)
+        self.handler.rollback()
+        self.assertEqual(self.handler.getManifestString(), self.original)
+        self.assertEqual(self.handler.getEdits(), {})
+
+if __name__ == "__main__":
+    unittest.main()
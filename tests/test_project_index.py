@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+from scanning.project_index import ProjectIndex
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+files = [
+    "settings.gradle",
+    "app/build.gradle",
+    "app/build/generated/Generated.java",
+    "app/src/main/AndroidManifest.xml",
+    "app/src/main/java/com/example/Main.java",
+    "app/src/main/java/com/example/build/Builder.java",
+    "lib/src/main/java/com/example/lib/Lib.java",
+    "lib/build/intermediates/Lib.java",
+    "build/reports/Report.java",
+    ".gradle/caches/Cached.java"
+]
+
+class TestProjectIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        for file in files:
+            path = os.path.join(self.directory.name, *file.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def testBuildOutputIsSkippedAtModuleRoots(self):
+        for scanThreads in [1, 4]:
+            index = ProjectIndex(self.directory.name, scanThreads)
+            self.assertEqual(sorted(index.files), [
+                "app/build.gradle",
+                "app/src/main/AndroidManifest.xml",
+                "app/src/main/java/com/example/Main.java",
+                "app/src/main/java/com/example/build/Builder.java",
+                "lib/src/main/java/com/example/lib/Lib.java",
+                "settings.gradle"
+            ])
+
+    def testIncludeGlobsDoNotHideTheManifest(self):
+        index = ProjectIndex(self.directory.name, include=["*.java"])
+        root = self.directory.name
+        self.assertEqual(index.findFiles(root, name="AndroidManifest.xml"), [os.path.join(root, "app", "src", "main", "AndroidManifest.xml")])
+        self.assertEqual(len(index.findFiles(root, [".xml"])), 0)
+        self.assertEqual(len(index.findFiles(root, [".java"])), 3)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from resources.resources_handler import ResourcesHandler
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+filterTouches = "{http://schemas.android.com/apk/res/android}filterTouchesWhenObscured"
+
+class TestIndexResourceFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.handler = ResourcesHandler(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def getAttributes(self, content):
+        # Value, element start and raw text of each filterTouchesWhenObscured attribute
+        entries = self.handler.indexResourceFile(os.path.join(self.directory.name, "layout.xml"), content)
+        return [(entry["value"], entry["elementStart"], content[entry["start"]:entry["end"]]) for entry in entries if entry["attribute"] == filterTouches]
+
+    def testMultiLineStartTags(self):
+        content = (
+            '<LinearLayout xmlns:android="http://schemas.android.com/apk/res/android">\n'
+            '    <Button\n'
+            '        android:id="@+id/first"\n'
+            '        android:filterTouchesWhenObscured="true" />\n'
+            '    <Button\n'
+            '        android:id="@+id/second"\n'
+            '        android:filterTouchesWhenObscured="false" />\n'
+            '</LinearLayout>\n'
+        )
+        first = content.index("<Button")
+        second = content.index("<Button", first + 1)
+        self.assertEqual(self.getAttributes(content), [
+            ("true", first, 'android:filterTouchesWhenObscured="true"'),
+            ("false", second, 'android:filterTouchesWhenObscured="false"')
+        ])
+
+    def testAttributesAreBoundedToTheirStartTag(self):
+        content = (
+            '<LinearLayout xmlns:android="http://schemas.android.com/apk/res/android">\n'
+            '    <Button\n'
+            '        android:id="@+id/first" />\n'
+            '    <Button android:filterTouchesWhenObscured="true" />\n'
+            '</LinearLayout>\n'
+        )
+        self.assertEqual(self.getAttributes(content), [
+            ("true", content.rindex("<Button"), 'android:filterTouchesWhenObscured="true"')
+        ])
+
+    def testCommentsAreSkipped(self):
+        content = (
+            '<LinearLayout xmlns:android="http://schemas.android.com/apk/res/android">\n'
+            '    <!-- <Button android:filterTouchesWhenObscured="false" /> -->\n'
+            '    <Button android:text="a > b"\n'
+            '        android:filterTouchesWhenObscured="true" />\n'
+            '</LinearLayout>\n'
+        )
+        self.assertEqual(self.getAttributes(content), [
+            ("true", content.index("<Button android:text"), 'android:filterTouchesWhenObscured="true"')
+        ])
+
+    def testPrefixTagNames(self):
+        content = (
+            '<LinearLayout xmlns:android="http://schemas.android.com/apk/res/android">\n'
+            '    <ButtonBar\n'
+            '        android:filterTouchesWhenObscured="false">\n'
+            '        <Button\n'
+            '            android:filterTouchesWhenObscured="true" />\n'
+            '    </ButtonBar>\n'
+            '</LinearLayout>\n'
+        )
+        self.assertEqual(self.getAttributes(content), [
+            ("false", content.index("<ButtonBar"), 'android:filterTouchesWhenObscured="false"'),
+            ("true", content.index("<Button\n"), 'android:filterTouchesWhenObscured="true"')
+        ])
+
+if __name__ == "__main__":
+    unittest.main()
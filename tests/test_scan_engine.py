@@ -0,0 +1,63 @@
+import re
+import unittest
+from scanning import scan_engine
+from scanning.scan_engine import ScanEngine
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+class TestAnchors(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = ScanEngine()
+
+    def getAnchor(self, pattern):
+        return self.engine.getAnchor(re.compile(pattern))
+
+    def assertScans(self, pattern, content):
+        # Whatever the anchor, the prefilter never drops a real match
+        self.engine.registerPatterns([pattern])
+        self.assertEqual(pattern in self.engine.scanContent(content), re.search(pattern, content) != None)
+        self.assertEqual(pattern in self.engine.scanContent(content.encode("utf-8")), re.search(pattern, content) != None)
+
+    def testLongestTopLevelLiteralRun(self):
+        self.assertEqual(self.getAnchor(r"PendingIntent\s*\.\s*getActivity\s*\("), "PendingIntent")
+        self.assertEqual(self.getAnchor(r"\bclass\s+[A-Za-z0-9_]"), "class")
+
+    def testAlternationsHaveNoAnchor(self):
+        self.assertEqual(self.getAnchor(r"setFilterTouchesWhenObscured|filterTouchesWhenObscured\s*="), None)
+        self.assertScans(r"setFilterTouchesWhenObscured|filterTouchesWhenObscured\s*=", "view.filterTouchesWhenObscured = true")
+
+    def testOptionalGroupsAreNotAnchors(self):
+        self.assertEqual(self.getAnchor(r"set(FilterTouches)?WhenObscured"), "WhenObscured")
+        self.assertEqual(self.getAnchor(r"(?:Pending)?Intent"), "Intent")
+        self.assertEqual(self.getAnchor(r"(?:Pending)?In"), None)
+        self.assertEqual(self.getAnchor(r"getActivityx?"), "getActivity")
+        self.assertScans(r"set(FilterTouches)?WhenObscured", "setWhenObscured")
+        self.assertScans(r"getActivityx?", "getActivity(")
+
+    def testInlineFlagsHaveNoAnchor(self):
+        self.assertEqual(self.getAnchor(r"(?i)pendingintent"), None)
+        self.assertScans(r"(?i)pendingintent", "PendingIntent.getActivity")
+        # Scoped flags only apply to their group, which is not an anchor
+        self.assertEqual(self.getAnchor(r"(?i:pending)Intent"), "Intent")
+        self.assertScans(r"(?i:pending)Intent", "PENDINGIntent")
+
+    def testCaseInsensitivePatternsHaveNoAnchor(self):
+        self.assertEqual(self.engine.getAnchor(re.compile("PendingIntent", re.IGNORECASE)), None)
+
+    def testUnfamiliarItemsHaveNoAnchor(self):
+        # Items the anchor extraction does not know of are never skipped over
+        separators = scan_engine.ANCHOR_SEPARATORS
+        try:
+            scan_engine.ANCHOR_SEPARATORS = set()
+            self.assertEqual(self.getAnchor(r"PendingIntent\s*\."), None)
+        finally:
+            scan_engine.ANCHOR_SEPARATORS = separators
+
+    def testShortRunsAreNotAnchors(self):
+        self.assertEqual(self.getAnchor(r"ab\s+cd"), None)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+from hashlib import sha256
+import unittest
+from scanning.scan_index import HASH_CHUNK_SIZE, hashText
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+class TestHashText(unittest.TestCase):
+
+    def testChunkedHashIsHashOfEncodedText(self):
+        # Multi-byte characters straddle chunk boundaries once encoded
+        for content in ["", "class Main {}\n", "é€😀" * (HASH_CHUNK_SIZE // 2 + 1)]:
+            self.assertEqual(hashText(content), sha256(content.encode("utf-8")).hexdigest())
+
+if __name__ == "__main__":
+    unittest.main()
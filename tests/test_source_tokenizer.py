@@ -0,0 +1,31 @@
+import unittest
+from source.source_tokenizer import SourceTokenizer
+
+# Run from the root of the repository:
+#
+#   python3 -m unittest discover tests
+
+class TestFindClassDefinitions(unittest.TestCase):
+
+    def getHeaders(self, content, kotlin):
+        tokenizer = SourceTokenizer(content, kotlin)
+        return [content[start:end] for start, end in tokenizer.findClassDefinitions()]
+
+    def testKotlinEnumClassIsSkipped(self):
+        content = "enum class Color { RED, GREEN }\n\nclass Palette(val colors: List<Color>) {\n}\n"
+        self.assertEqual(self.getHeaders(content, True), ["class Palette(val colors: List<Color>) {"])
+
+    def testKotlinRestrictedClassesAreSkipped(self):
+        content = "annotation class Marker {\n}\n@JvmInline\nvalue class Id(val value: Int) {\n}\n"
+        self.assertEqual(self.getHeaders(content, True), [])
+
+    def testJavaClassesAreFound(self):
+        content = "public class Main {\n    enum Color { RED, GREEN }\n    static class Inner extends Base {\n    }\n}\n"
+        self.assertEqual(self.getHeaders(content, False), ["class Main {", "class Inner extends Base {"])
+
+    def testClassLiteralsAreSkipped(self):
+        content = "class Main {\n    val type = Main::class\n    Class<?> other = Main.class;\n}\n"
+        self.assertEqual(self.getHeaders(content, True), ["class Main {"])
+
+if __name__ == "__main__":
+    unittest.main()